@@ -7,26 +7,56 @@ from multiprocessing import Queue, Event, Process, Semaphore
 from modules.update_manager.update_manager import UpdateManager
 from exclusiveprocess import Lock, CannotAcquireLock
 from collections import OrderedDict
-from typing import List, Tuple
+from typing import List, Optional, Tuple, Union
 from slips_files.common.style import green
 import asyncio
+import ast
 import signal
+import threading
 import time
 import pkgutil
-import inspect
 import modules
 import importlib
 import os
 import sys
 import traceback
 
+class ModuleThread(threading.Thread):
+    """
+    Runs a slips module or core process in a thread of the main process,
+    used instead of starting a process per module when embedded_mode = yes.
+    has the attributes the ProcessManager uses from the module processes
+    """
+    def __init__(self, module: IModule):
+        # daemon threads don't keep slips running once the main thread is done
+        super().__init__(target=module.run, name=module.name, daemon=True)
+        self.module = module
+
+    @property
+    def pid(self) -> Optional[int]:
+        # the id of the thread in the OS, it's unique like the PIDs
+        return self.native_id
+
+
 class ProcessManager:
     def __init__(self, main):
         self.main = main
         self.module_objects = {}
+        # run the modules as threads of this process instead of starting
+        # a process per module
+        self.embedded_mode: bool = ConfigParser().embedded_mode()
+        # the threads running the modules in embedded mode
+        self.module_threads: List[ModuleThread] = []
         # this is the queue that will be used by the input proces to pass flows
         # to the profiler
         self.profiler_queue = Queue()
+        # the number of profiler processes, the input process shards the
+        # flows between them by saddr
+        self.profiler_workers: int = ConfigParser().profiler_workers()
+        # each profiler worker has its own queue, the first one is profiler_queue
+        self.profiler_queues: List[Queue] = [self.profiler_queue] + [
+            Queue() for _ in range(self.profiler_workers - 1)
+        ]
         self.termination_event: Event = Event()
         self.stopped_modules = []
         # used to stop slips when these 2 are done
@@ -38,6 +68,12 @@ class ProcessManager:
         # now without this event, input process doesn't know that profiler is still waiting for the queue to stop
         # and inout stops and renders the profiler queue useless and profiler cant get more lines anymore!
         self.is_profiler_done_event = Event()
+        # one event per profiler worker, the first one is is_profiler_done_event
+        self.profiler_done_events: List[Event] = [self.is_profiler_done_event] + [
+            Event() for _ in range(self.profiler_workers - 1)
+        ]
+        # the number of profiler workers that released is_profiler_done so far
+        self.profilers_done = 0
 
 
     def start_output_process(self, current_stdout, stderr, slips_logfile):
@@ -57,25 +93,78 @@ class ProcessManager:
         self.slips_logfile = output_process.slips_logfile
         return output_process
 
-    def start_profiler_process(self):
-        profiler_process = Profiler(
-            self.main.logger,
-            self.main.args.output,
-            self.main.redis_port,
-            self.termination_event,
-            is_profiler_done=self.is_profiler_done,
-            profiler_queue=self.profiler_queue,
-            is_profiler_done_event= self.is_profiler_done_event
-        )
-        profiler_process.start()
+    def start_module(self, module: IModule) -> Union[Process, ModuleThread]:
+        """
+        starts the given module in its own process, or in a thread of this
+        process in embedded mode.
+        returns the process or thread running it
+        """
+        if not self.embedded_mode:
+            module.start()
+            return module
+
+        module_thread = ModuleThread(module)
+        module_thread.start()
+        self.module_threads.append(module_thread)
+        return module_thread
+
+    def get_children(self) -> List[Union[Process, ModuleThread]]:
+        """returns the processes and the threads of the running modules"""
+        return multiprocessing.active_children() + self.module_threads
+
+    def warn_about_tw_storage_layout(self) -> bool:
+        """
+        warns the user if the configured tw_storage_layout is replaced with
+        the native one because of the number of profiler workers.
+        check ConfigParser.tw_storage_layout()
+        returns True if a warning was printed
+        """
+        if (
+                self.profiler_workers <= 1
+                or ConfigParser().configured_tw_storage_layout() != 'json'
+        ):
+            return False
+
         self.main.print(
-            f'Started {green("Profiler Process")} '
-            f"[PID {green(profiler_process.pid)}]",
-            1,
-            0,
+            f"Warning: tw_storage_layout = json isn't supported with "
+            f"{self.profiler_workers} profiler workers, using "
+            f"tw_storage_layout = native. Kalipso and the tools that "
+            f"read the json TW data won't see the TWs of this analysis."
         )
-        self.main.db.store_process_PID("Profiler", int(profiler_process.pid))
-        return profiler_process
+        return True
+
+    def start_profiler_process(self):
+        """
+        starts profiler_workers profiler processes,
+        each one reads the flows of its own queue
+        returns the first one
+        """
+        self.warn_about_tw_storage_layout()
+
+        profiler_processes = []
+        for worker_id in range(self.profiler_workers):
+            profiler_process = Profiler(
+                self.main.logger,
+                self.main.args.output,
+                self.main.redis_port,
+                self.termination_event,
+                is_profiler_done=self.is_profiler_done,
+                profiler_queue=self.profiler_queues[worker_id],
+                is_profiler_done_event=self.profiler_done_events[worker_id],
+                worker_id=worker_id,
+            )
+            profiler_process = self.start_module(profiler_process)
+            # the first worker keeps the old name for backwards compatibility
+            name = "Profiler" if worker_id == 0 else f"Profiler_{worker_id}"
+            self.main.print(
+                f'Started {green(f"{name} Process")} '
+                f"[PID {green(profiler_process.pid)}]",
+                1,
+                0,
+            )
+            self.main.db.store_process_PID(name, int(profiler_process.pid))
+            profiler_processes.append(profiler_process)
+        return profiler_processes[0]
 
     def start_evidence_process(self):
         evidence_process = Evidence(
@@ -84,7 +173,7 @@ class ProcessManager:
             self.main.redis_port,
             self.termination_event,
         )
-        evidence_process.start()
+        evidence_process = self.start_module(evidence_process)
         self.main.print(
             f'Started {green("Evidence Process")} '
             f"[PID {green(evidence_process.pid)}]",
@@ -102,6 +191,8 @@ class ProcessManager:
             self.termination_event,
             is_input_done=self.is_input_done,
             profiler_queue=self.profiler_queue,
+            profiler_queues=self.profiler_queues,
+            profiler_done_events=self.profiler_done_events,
             input_type=self.main.input_type,
             input_information=self.main.input_information,
             cli_packet_filter=self.main.args.pcapfilter,
@@ -110,7 +201,7 @@ class ProcessManager:
             line_type=self.main.line_type,
             is_profiler_done_event=self.is_profiler_done_event,
         )
-        input_process.start()
+        input_process = self.start_module(input_process)
         self.main.print(
             f'Started {green("Input Process")} ' f"[PID {green(input_process.pid)}]",
             1,
@@ -139,6 +230,14 @@ class ProcessManager:
 
     def kill_all_children(self):
         for process in self.processes:
+            if isinstance(process, ModuleThread):
+                # threads can't be killed, they are daemon threads
+                # so they stop when slips exits
+                if process.name not in self.stopped_modules:
+                    process.join(3)
+                    self.print_stopped_module(process.name)
+                continue
+
             module_name: str = self.main.db.get_name_of_module_at(process.pid)
             if not module_name:
                 # if it's a thread started by one of the modules or
@@ -165,17 +264,59 @@ class ProcessManager:
                 return True
         return False
 
+    def read_modules_metadata(self, path: str) -> List[dict]:
+        """
+        returns the name, description and class name of the slips modules
+        defined in the given file by parsing it instead of importing it,
+        so the modules and their dependencies are only imported if they're
+        going to be started
+        """
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+
+        modules_metadata = []
+        for node in tree.body:
+            if not isinstance(node, ast.ClassDef):
+                continue
+            bases = {
+                getattr(base, 'id', getattr(base, 'attr', None))
+                for base in node.bases
+            }
+            if 'IModule' not in bases:
+                continue
+
+            # the class attributes that are literals, e.g. name = 'ARP'
+            attributes = {}
+            for stmt in node.body:
+                if (
+                        isinstance(stmt, ast.Assign)
+                        and len(stmt.targets) == 1
+                        and isinstance(stmt.targets[0], ast.Name)
+                ):
+                    try:
+                        attributes[stmt.targets[0].id] = ast.literal_eval(
+                            stmt.value
+                        )
+                    except ValueError:
+                        continue
+
+            if 'name' not in attributes:
+                continue
+            modules_metadata.append(dict(
+                name=attributes['name'],
+                description=attributes.get('description', ''),
+                class_name=node.name,
+            ))
+        return modules_metadata
+
     def get_modules(self, to_ignore: list):
         """
         Get modules from the 'modules' folder.
+        the modules aren't imported here, check import_modules()
         """
-        # This plugins import will automatically load the modules and put them in
-        # the __modules__ variable
-
         plugins = {}
         failed_to_load_modules = 0
 
-
         # __path__ is the current path of this python program
         look_for_modules_in = modules.__path__
         prefix = f"{modules.__name__}."
@@ -198,39 +339,21 @@ class ProcessManager:
             if self.is_ignored_module(module_name, to_ignore):
                 continue
 
-
-            # Try to import the module, otherwise skip.
+            path = os.path.join(loader.path, f"{file_name}.py")
             try:
-                # "level specifies whether to use absolute or relative imports.
-                # The default is -1 which
-                # indicates both absolute and relative imports will be attempted.
-                # 0 means only perform absolute imports.
-                # Positive values for level indicate the number of parent
-                # directories to search relative to the directory of the
-                # module calling __import__()."
-                module = importlib.import_module(module_name)
-            except ImportError as e:
+                modules_metadata = self.read_modules_metadata(path)
+            except (OSError, SyntaxError, ValueError) as e:
                 print(f"Something wrong happened while "
-                      f"importing the module {module_name}: {e}")
-                self.print(traceback.print_exc())
+                      f"reading the module {module_name}: {e}")
                 failed_to_load_modules += 1
-
                 continue
 
-            # Walk through all members of currently imported modules.
-            for member_name, member_object in inspect.getmembers(module):
-                # Check if current member is a class.
-                if (
-                        inspect.isclass(member_object)
-                        and (
-                            issubclass(member_object, IModule)
-                            and member_object is not IModule
-                        )
-                ):
-                    plugins[member_object.name] = dict(
-                        obj=member_object,
-                        description=member_object.description,
-                    )
+            for metadata in modules_metadata:
+                plugins[metadata["name"]] = dict(
+                    module=module_name,
+                    class_name=metadata["class_name"],
+                    description=metadata["description"],
+                )
 
         # Change the order of the blocking module(load it first)
         # so it can receive msgs sent from other modules
@@ -249,31 +372,74 @@ class ProcessManager:
 
         return plugins, failed_to_load_modules
 
-    def load_modules(self):
+    def import_module(self, plugin: dict):
+        """
+        imports the code of the given module, returns its class or
+        None if it can't be imported
+        :param plugin: the info of the module returned by get_modules()
+        """
+        try:
+            module = importlib.import_module(plugin["module"])
+        except ImportError as e:
+            print(f"Something wrong happened while "
+                  f"importing the module {plugin['module']}: {e}")
+            traceback.print_exc()
+            return None
+        return getattr(module, plugin["class_name"])
+
+    def import_modules(self, plugins: dict) -> Tuple[dict, int]:
+        """
+        imports the given modules.
+        the dependencies that take long to import (tensorflow, sklearn, etc.)
+        are imported by each module in its pre_main(), so they're imported by
+        the started modules in parallel instead of one by one here.
+        returns {module name: class} of the modules that were imported and
+        the number of modules that couldn't be imported
+        """
+        module_classes = {}
+        failed_to_import_modules = 0
+        for module_name, plugin in plugins.items():
+            if module_class := self.import_module(plugin):
+                module_classes[module_name] = module_class
+            else:
+                failed_to_import_modules += 1
+        return module_classes, failed_to_import_modules
+
+    def load_modules(self) -> Tuple[List[str], int]:
+        """
+        starts the enabled modules.
+        returns the names of the started modules and the number of modules
+        that couldn't be read or imported
+        """
         to_ignore: list = self.main.conf.get_disabled_modules(
             self.main.input_type)
+        modules_to_call, failed_to_load_modules = self.get_modules(to_ignore)
+        modules_to_call = {
+            module_name: plugin
+            for module_name, plugin in modules_to_call.items()
+            if module_name not in to_ignore
+        }
         # Import all the modules
-        modules_to_call = self.get_modules(to_ignore)[0]
+        module_classes, failed_to_import_modules = self.import_modules(
+            modules_to_call
+        )
+        failed_to_load_modules += failed_to_import_modules
         loaded_modules = []
-        for module_name in modules_to_call:
-            if module_name in to_ignore:
-                continue
-
-            module_class = modules_to_call[module_name]["obj"]
+        for module_name, module_class in module_classes.items():
             module = module_class(
                 self.main.logger,
                 self.main.args.output,
                 self.main.redis_port,
                 self.termination_event,
             )
-            module.start()
-            self.main.db.store_process_PID(module_name, int(module.pid))
+            module_process = self.start_module(module)
+            self.main.db.store_process_PID(module_name, int(module_process.pid))
             self.module_objects[module_name] = module  # maps name -> object
             description = modules_to_call[module_name]["description"]
             self.main.print(
                 f"\t\tStarting the module {green(module_name)} "
                 f"({description}) "
-                f"[PID {green(module.pid)}]",
+                f"[PID {green(module_process.pid)}]",
                 1, 0,
             )
             loaded_modules.append(module_name)
@@ -281,7 +447,11 @@ class ProcessManager:
         time.sleep(0.5)
         print("-" * 27)
         self.main.print(f"Disabled Modules: {to_ignore}", 1, 0)
-        return loaded_modules
+        if failed_to_load_modules:
+            self.main.print(
+                f"Failed to load {failed_to_load_modules} modules", 0, 1
+            )
+        return loaded_modules, failed_to_load_modules
 
     def print_stopped_module(self, module):
         self.stopped_modules.append(module)
@@ -503,7 +673,15 @@ class ProcessManager:
         """
         # try to acquire the semaphore without blocking
         input_done_processing: bool = self.is_input_done.acquire(block=False)
-        profiler_done_processing: bool = self.is_profiler_done.acquire(block=False)
+        # every profiler worker releases the semaphore once
+        while (
+                self.profilers_done < self.profiler_workers
+                and self.is_profiler_done.acquire(block=False)
+        ):
+            self.profilers_done += 1
+        profiler_done_processing: bool = (
+            self.profilers_done == self.profiler_workers
+        )
 
         if input_done_processing and profiler_done_processing:
             return True
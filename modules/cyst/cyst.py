@@ -13,6 +13,8 @@ class Module(IModule, multiprocessing.Process):
     name = 'CYST'
     description = 'Communicates with CYST simulation framework'
     authors = ['Alya Gomaa']
+    # main() polls the CYST socket, don't wait for redis msgs before calling it
+    channels_read_timeout = 0
 
     def init(self):
         self.port = None
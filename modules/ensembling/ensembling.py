@@ -28,10 +28,12 @@ class Ensembling(IModule, multiprocessing.Process):
         : return: None
         """
 
-        flows = self.db.get_all_flows_in_profileid_twid(profileid, twid)
+        flows = self.db.get_flows_fields(
+            ['daddr', 'module_labels'], profileid, twid
+        )
         dstip_labels_total = {}
         for flow_uid, flow_data in flows.items():
-            flow_module_labels = flow_data['module_labels']
+            flow_module_labels = flow_data['module_labels'] or {}
             # First stage - calculate the amount of malicious and normal labels per each flow.
             # Set the final label per flow using majority voting
             flow_labels = list(flow_module_labels.values())
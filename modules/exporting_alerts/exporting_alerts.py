@@ -1,16 +1,16 @@
 from slips_files.common.abstracts._module import IModule
 from slips_files.common.imports import *
-from slack import WebClient
-from slack.errors import SlackApiError
 import os
 import json
-from stix2 import Indicator, Bundle
-from cabby import create_client
 import time
 import threading
 import sys
 import datetime
 
+# the slack and STIX libs are imported by the process of this module in
+# pre_main(), check import_export_libs()
+WebClient = SlackApiError = Indicator = Bundle = create_client = None
+
 class ExportingAlerts(IModule, multiprocessing.Process):
     """
     Module to export alerts to slack and/or STIX
@@ -292,8 +292,16 @@ class ExportingAlerts(IModule, multiprocessing.Process):
             date_time = utils.convert_format(date_time, utils.alerts_format)
             self.send_to_slack(f'{date_time}: Slips finished on sensor: {self.sensor_name}.')
 
+    def import_export_libs(self):
+        global WebClient, SlackApiError, Indicator, Bundle, create_client
+        from slack import WebClient
+        from slack.errors import SlackApiError
+        from stix2 import Indicator, Bundle
+        from cabby import create_client
+
     def pre_main(self):
         utils.drop_root_privs()
+        self.import_export_libs()
         if (
             self.is_running_on_interface
             and 'stix' in self.export_to
@@ -396,7 +396,7 @@ class FlowAlerts(IModule, multiprocessing.Process):
             bytes_sent = {}
             for uid, flow in all_flows.items():
                 daddr = flow['daddr']
-                sbytes: int = flow.get('sbytes', 0)
+                sbytes: int = flow['sbytes'] or 0
 
                 if self.is_ignored_ip_data_upload(daddr) or not sbytes:
                     continue
@@ -411,8 +411,8 @@ class FlowAlerts(IModule, multiprocessing.Process):
 
             return bytes_sent
 
-        all_flows = self.db.get_all_flows_in_profileid(
-            profileid
+        all_flows = self.db.get_flows_fields(
+            ['daddr', 'sbytes'], profileid
         )
         if not all_flows:
             return
@@ -564,25 +564,9 @@ class FlowAlerts(IModule, multiprocessing.Process):
         """get the SNI, ASN, and  rDNS of the IP to check if it belongs
         to a well-known org"""
 
-        ip_data = self.db.get_ip_info(ip)
-        try:
-            SNI = ip_data['SNI']
-            if type(SNI) == list:
-                # SNI is a list of dicts, each dict contains the 'server_name' and 'port'
-                SNI = SNI[0]
-                if SNI in (None, ''):
-                    SNI = False
-                elif type(SNI) == dict:
-                    SNI = SNI.get('server_name', False)
-        except (KeyError, TypeError):
-            # No SNI data for this ip
-            SNI = False
-
-        try:
-            rdns = ip_data['reverse_dns']
-        except (KeyError, TypeError):
-            # No SNI data for this ip
-            rdns = False
+        ip_context = self.db.get_ip_context(ip)
+        SNI = ip_context['sni']
+        rdns = ip_context['ip_info'].get('reverse_dns')
 
         flow_domain = rdns or SNI
         for org in utils.supported_orgs:
@@ -1752,13 +1736,11 @@ class FlowAlerts(IModule, multiprocessing.Process):
     def main(self):
         # if timewindows are not updated for a long time, Slips is stopped automatically.
         if msg:= self.get_msg('new_flow'):
-            new_flow = json.loads(msg['data'])
+            new_flow = self.decode_msg(msg)
             profileid = new_flow['profileid']
             twid = new_flow['twid']
-            flow = new_flow['flow']
-            flow = json.loads(flow)
-            uid = next(iter(flow))
-            flow_dict = json.loads(flow[uid])
+            flow_dict = new_flow['flow']
+            uid = flow_dict['uid']
             # Flow type is 'conn' or 'dns', etc.
             flow_type = flow_dict['flow_type']
             dur = flow_dict['dur']
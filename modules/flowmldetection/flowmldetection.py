@@ -1,12 +1,14 @@
 from slips_files.common.abstracts._module import IModule
 from slips_files.common.imports import *
-from sklearn.linear_model import SGDClassifier
-from sklearn.preprocessing import StandardScaler
 import pickle
-import pandas as pd
-import json
 import datetime
 import traceback
+from slips_files.core.database.parquet_db.flow_archive import (
+    get_archive_dir,
+    get_archived_flow_types,
+    is_pyarrow_installed,
+    read_archived_flows,
+)
 # Only for debbuging
 # from matplotlib import pyplot as plt
 
@@ -19,6 +21,10 @@ import warnings
 
 warnings.warn = warn
 
+# sklearn and pandas take seconds to import, they're imported by the
+# process of this module in pre_main(), check import_ml_libs()
+SGDClassifier = StandardScaler = pd = None
+
 
 class FlowMLDetection(IModule, multiprocessing.Process):
     # Name: short name of the module. Do not use spaces
@@ -42,12 +48,17 @@ class FlowMLDetection(IModule, multiprocessing.Process):
         self.minimum_lables_to_retrain = 50
         # To plot the scores of training
         # self.scores = []
-        # The scaler trained during training and to use during testing
-        self.scaler = StandardScaler()
+
+    def import_ml_libs(self):
+        global SGDClassifier, StandardScaler, pd
+        from sklearn.linear_model import SGDClassifier
+        from sklearn.preprocessing import StandardScaler
+        import pandas as pd
 
     def read_configuration(self):
         conf = ConfigParser()
         self.mode = conf.get_ml_mode()
+        self.archive_flows = conf.archive_flows() and is_pyarrow_installed()
 
 
 
@@ -126,6 +137,7 @@ class FlowMLDetection(IModule, multiprocessing.Process):
                 'flow_type' ,
                 'smac',
                 'dmac',
+                'uid',
             ]
             for field in to_drop:
                 try:
@@ -205,6 +217,23 @@ class FlowMLDetection(IModule, multiprocessing.Process):
             self.print('Error in process_features()')
             self.print(traceback.print_exc(),0,1)
 
+    def read_archived_flows(self):
+        """
+        returns a df with the conn flows the profiler wrote to the
+        flow archive so far. the flows the profiler didn't write yet
+        are used in the next training
+        """
+        archive_dir = get_archive_dir(self.output_dir)
+        conn_flow_types = ('conn', 'nfdump', 'argus', 'flow')
+        flows = [
+            read_archived_flows(archive_dir, flow_type).to_pandas()
+            for flow_type in get_archived_flow_types(archive_dir)
+            if flow_type in conn_flow_types
+        ]
+        if not flows:
+            return pd.DataFrame()
+        return pd.concat(flows, ignore_index=True)
+
     def process_flows(self):
         """
         Process all the flwos in the DB
@@ -213,7 +242,13 @@ class FlowMLDetection(IModule, multiprocessing.Process):
         try:
             # We get all the flows so far
             # because this retraining happens in batches
-            flows = self.db.get_all_flows()
+            archived_flows = None
+            if self.archive_flows:
+                # read them as columns instead of json decoding each flow
+                archived_flows = self.read_archived_flows()
+                flows = []
+            else:
+                flows = self.db.get_all_flows()
 
             # Check how many different labels are in the DB
             # We need both normal and malware
@@ -273,6 +308,10 @@ class FlowMLDetection(IModule, multiprocessing.Process):
 
             # Convert to pandas df
             df_flows = pd.DataFrame(flows)
+            if archived_flows is not None:
+                df_flows = pd.concat(
+                    [archived_flows, df_flows], ignore_index=True
+                )
 
             # Process features
             df_flows = self.process_features(df_flows)
@@ -386,25 +425,19 @@ class FlowMLDetection(IModule, multiprocessing.Process):
 
     def pre_main(self):
         utils.drop_root_privs()
+        self.import_ml_libs()
+        # The scaler trained during training and to use during testing
+        self.scaler = StandardScaler()
         # Load the model
         self.read_model()
 
     def main(self):
         if msg:= self.get_msg('new_flow'):
-            data = msg['data']
-            # Convert from json to dict
-            data = json.loads(data)
+            data = self.decode_msg(msg)
             profileid = data['profileid']
             twid = data['twid']
-            # Get flow that is now in json format
-            flow = data['flow']
-            # Convert flow to a dict
-            flow = json.loads(flow)
-            # Convert the common fields to something that can
-            # be interpreted
-            # Get the uid which is the key
-            uid = next(iter(flow))
-            self.flow_dict = json.loads(flow[uid])
+            self.flow_dict = data['flow']
+            uid = self.flow_dict['uid']
 
             if self.mode == 'train':
                 # We are training
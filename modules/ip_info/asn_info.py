@@ -1,14 +1,17 @@
 from slips_files.common.imports import *
 import time
 import ipaddress
-import ipwhois
 import json
 import requests
 import maxminddb
+from slips_files.common.ip_range_index import IPRangeIndex
 
 class ASN:
     def __init__(self, db=None):
         self.db = db
+        # index of the ranges in the cached_asn hash, built on the first
+        # lookup. this is the only process that caches new asn ranges
+        self.cached_asn_ranges = None
         # Open the maxminddb ASN offline db
         try:
             self.asn_db = maxminddb.open_database(
@@ -18,37 +21,35 @@ class ASN:
             # errors are printed in IP_info
             pass
 
+    def get_cached_asn_ranges(self) -> IPRangeIndex:
+        """returns the index of the asn ranges cached in the db"""
+        if self.cached_asn_ranges is None:
+            self.cached_asn_ranges = IPRangeIndex()
+            # cached ASNs are sorted by first octet
+            for ranges in self.db.get_asn_cache().values():
+                for asn_range, range_info in json.loads(ranges).items():
+                    self.cached_asn_ranges.add(asn_range, range_info)
+        return self.cached_asn_ranges
+
     def get_cached_asn(self, ip) :
         """
         If this ip belongs to a cached ip range, return the cached asn info of it
         :param ip: str
         if teh range of this ip was found, this function returns a dict with {'number' , 'org'}
         """
-        first_octet: str = utils.get_first_octet(ip)
-        if not first_octet:
-            # invalid ip or no cached asns
-            return
-
-        cached_asn: str = self.db.get_asn_cache(first_octet=first_octet)
-        if not cached_asn:
+        range_info = self.get_cached_asn_ranges().lookup(ip)
+        if not range_info:
             return
 
-        cached_asn: dict = json.loads(cached_asn)
-
-        for range, range_info in cached_asn.items():
-            # convert to objects
-            ip_range = ipaddress.ip_network(range)
-            ip = ipaddress.ip_address(ip)
-            if ip in ip_range:
-                asn_info = {
-                    'asn': {
-                        'org': range_info['org'],
+        asn_info = {
+            'asn': {
+                'org': range_info['org'],
 
-                    }
-                }
-                if 'number' in range_info:
-                    asn_info['asn'].update({"number": range_info['number']})
-                return asn_info
+            }
+        }
+        if 'number' in range_info:
+            asn_info['asn'].update({"number": range_info['number']})
+        return asn_info
 
     def update_asn(self, cached_data, update_period) -> bool:
         """
@@ -96,6 +97,9 @@ class ASN:
         Get the range of the given ip and
         cache the asn of the whole ip range
         """
+        # imported here because it's only needed by this function
+        # and it's slow to import
+        import ipwhois
         try:
             # Cache the range of this ip
             whois_info = ipwhois.IPWhois(address=ip).lookup_rdap()
@@ -105,6 +109,10 @@ class ASN:
 
             if asnorg and asn_cidr not in ('', 'NA'):
                 self.db.set_asn_cache(asnorg, asn_cidr, asn_number)
+                range_info = {'org': asnorg}
+                if asn_number:
+                    range_info['number'] = f'AS{asn_number}'
+                self.get_cached_asn_ranges().add(asn_cidr, range_info)
                 asn_info = {
                     'asn': {
                         'number': f'AS{asn_number}',
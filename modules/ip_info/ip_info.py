@@ -7,7 +7,6 @@ from typing import Union
 import datetime
 import maxminddb
 import ipaddress
-import whois
 import socket
 import requests
 import json
@@ -348,6 +347,9 @@ class IPInfo(IModule, multiprocessing.Process):
             # we already have age info about this domain
             return False
 
+        # the whois library is imported here because it's only needed
+        # by this function and it's slow to import
+        import whois
         # whois library doesn't only raise an exception, it prints the error!
         # the errors are the same exceptions we're handling
         # temorarily change stdout to /dev/null
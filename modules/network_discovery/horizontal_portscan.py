@@ -72,39 +72,59 @@ class HorizontalPortscan():
                 dstips_to_discard.append(dip)
         return dstips_to_discard
 
-    def get_not_estab_dst_ports(self, protocol: str, state: str, profileid: str, twid: str
+    def get_amount_of_dstips_per_port(
+            self, protocol: str, state: str, profileid: str, twid: str
             ) -> dict:
         """
-        Get the list of dstports that we tried to connect to (not established
-        flows)
-          these unknowns are the info this function retrieves
-          profileid -> unknown_dstip:unknown_dstports
+        returns {dport: amount of dstips we tried to connect to on this dport}
+        it's cheaper than reading the data of all the dports in the tw
+        """
+        return self.db.get_tw_data_sizes(
+            profileid, twid, 'Dst', state, protocol, 'Client', 'Ports'
+        )
+
+    def may_trigger_an_evidence(self, cache_key: str, amount_of_dips: int) -> bool:
+        """
+        same as check_if_enough_dstips_to_trigger_an_evidence() but doesn't
+        update the cached thresholds. used to skip the dports that have no
+        chance of triggering an evidence before reading their data
+        """
+        prev_amount_dips = self.cached_tw_thresholds.get(cache_key, 0)
+        return (
+            amount_of_dips >= self.port_scan_minimum_dips
+            and prev_amount_dips + 5 <= amount_of_dips
+        )
 
+    def get_not_estab_dst_port(
+            self, protocol: str, state: str, profileid: str, twid: str, dport
+            ) -> dict:
+        """
+        Get the info of the given dstport that we tried to connect to (not established
+        flows)
          here, the profileid given is the client.
          :return: the following dict
-         #TODO this is wrong, fix it
          {
-             dst_ip: {
-                 totalflows: total flows seen by the profileid
-                 totalpkt: total packets seen by the profileid
-                 totalbytes: total bytes sent by the profileid
-                 stime: timestamp of the first flow seen from this profileid -> this dstip
-                 uid: list of uids where the given profileid was
-                        contacting the dst_ip on this dstport
-                 dstports: dst ports seen in all flows where the given profileid was srcip
-                     {
-                         <str port>: < int spkts sent to this port>
-                     }
+             totalflows: total flows to this dport
+             totalpkt: total packets sent to this dport
+             totalbytes: total bytes sent to this dport
+             dstips: {
+                 dst_ip: {
+                     pkts: src+dst packets sent to this dstip,
+                     spkts: src packets sent to this dstip,
+                     stime: timestamp of the first flow in the uid list,
+                     uid: [uids of flows to this ip]
+                 }
              }
+         }
         """
         # Get the list of dports that we connected as client using TCP not established
         direction = 'Dst'
         role = 'Client'
         type_data = 'Ports'
-        dports: dict = self.db.get_data_from_profile_tw(
-                profileid, twid, direction, state, protocol, role, type_data
+        dport_data: dict = self.db.get_data_of_tw_entry(
+                profileid, twid, direction, state, protocol, role, type_data, dport
             )
-        return dports
+        return dport_data
 
     def get_cache_key(self, profileid: str, twid: str, dport):
         return f'{profileid}:{twid}:dport:{dport}:HorizontalPortscan'
@@ -188,21 +208,45 @@ class HorizontalPortscan():
         # so, practically this is correct to avoid FP
         state = 'Not Established'
         for protocol in ('TCP', 'UDP'):
-
-            dports: dict = self.get_not_estab_dst_ports(
-                protocol, state, profileid, twid
-                )
+            if self.db.is_native_tw_storage():
+                # each dport is stored in its own keys, read only the
+                # amounts here and the data of the candidate dports below
+                dports_data = None
+                dstips_per_port: dict = self.get_amount_of_dstips_per_port(
+                    protocol, state, profileid, twid
+                    )
+            else:
+                # all the dports are stored in 1 json dict, decode it once
+                dports_data: dict = self.db.get_data_from_profile_tw(
+                    profileid, twid, 'Dst', state, protocol, 'Client', 'Ports'
+                ) or {}
+                dstips_per_port = {
+                    dport: len(dport_data.get('dstips', {}))
+                    for dport, dport_data in dports_data.items()
+                }
 
             # For each port, see if the amount is over the threshold
-            for dport in dports.keys():
+            for dport, amount_of_dips in dstips_per_port.items():
+                cache_key: str = self.get_cache_key(profileid, twid, dport)
+                # the resolved dstips are discarded below, so the amount of
+                # dstips can only go down. skip the ports that can't
+                # trigger an evidence without reading their data
+                if not self.may_trigger_an_evidence(cache_key, amount_of_dips):
+                    continue
+
                 # PortScan Type 2. Direction OUT
-                dstips: dict = dports[dport]['dstips']
+                if dports_data is None:
+                    dport_data: dict = self.get_not_estab_dst_port(
+                        protocol, state, profileid, twid, dport
+                    )
+                else:
+                    dport_data: dict = dports_data[dport]
+                dstips: dict = dport_data.get('dstips', {})
 
                 # remove the resolved dstips from dstips dict
                 for ip in self.get_resolved_ips(dstips):
                     dstips.pop(ip)
 
-                cache_key: str = self.get_cache_key(profileid, twid, dport)
                 amount_of_dips = len(dstips)
 
                 if self.check_if_enough_dstips_to_trigger_an_evidence(
@@ -199,38 +199,45 @@ class VerticalPortscan:
             return True
         return False
 
-    def get_not_established_dst_ips(
+    def get_amount_of_dports_per_dstip(
             self, protocol: str, state: str, profileid: str, twid: str
             ) -> dict:
         """
-        Get the list of dstips that we tried to connect to (not established flows)
-          these unknowns are the info this function retrieves
-          profileid -> unknown_dstip:unknown_dstports
+        returns {dstip: amount of dports we tried to connect to on this dstip}
+        it's cheaper than reading the data of all the dstips in the tw
+        """
+        return self.db.get_tw_data_sizes(
+            profileid, twid, 'Dst', state, protocol, 'Client', 'IPs'
+        )
 
+    def get_not_established_dst_ip(
+            self, protocol: str, state: str, profileid: str, twid: str, dstip: str
+            ) -> dict:
+        """
+        Get the info of the given dstip that we tried to connect to (not established flows)
          here, the profileid given is the client.
          :return: the following dict
          {
-             dst_ip: {
-                 totalflows: total flows seen by the profileid
-                 totalpkt: total packets seen by the profileid
-                 totalbytes: total bytes sent by the profileid
-                 stime: timestamp of the first flow seen from this profileid -> this dstip
-                 uid: list of uids where the given profileid was
-                        contacting the dst_ip on this dstport
-                 dstports: dst ports seen in all flows where the given profileid was srcip
-                     {
-                         <str port>: < int spkts sent to this port>
-                     }
-             }
+             totalflows: total flows seen by the profileid
+             totalpkt: total packets seen by the profileid
+             totalbytes: total bytes sent by the profileid
+             stime: timestamp of the first flow seen from this profileid -> this dstip
+             uid: list of uids where the given profileid was
+                    contacting the dst_ip on this dstport
+             dstports: dst ports seen in all flows where the given profileid was srcip
+                 {
+                     <str port>: < int spkts sent to this port>
+                 }
+         }
         """
         direction = 'Dst'
         role = 'Client'
         type_data = 'IPs'
 
-        dstips: dict = self.db.get_data_from_profile_tw(
-            profileid, twid, direction, state, protocol, role, type_data
+        dstip_data: dict = self.db.get_data_of_tw_entry(
+            profileid, twid, direction, state, protocol, role, type_data, dstip
             )
-        return dstips
+        return dstip_data
 
     def get_cache_key(self, profileid: str, twid: str, dstip: str):
         """
@@ -251,30 +258,48 @@ class VerticalPortscan:
         state = 'Not Established'
 
         for protocol in ('TCP', 'UDP'):
-            dstips: dict = self.get_not_established_dst_ips(
-                protocol, state, profileid, twid
-                )
+            if self.db.is_native_tw_storage():
+                # each dstip is stored in its own keys, read only the
+                # amounts here and the data of the candidate dstips below
+                dstips_data = None
+                dports_per_dstip: dict = self.get_amount_of_dports_per_dstip(
+                    protocol, state, profileid, twid
+                    )
+            else:
+                # all the dstips are stored in 1 json dict, decode it once
+                dstips_data: dict = self.db.get_data_from_profile_tw(
+                    profileid, twid, 'Dst', state, protocol, 'Client', 'IPs'
+                ) or {}
+                dports_per_dstip = {
+                    dstip: len(dstip_data.get('dstports', {}))
+                    for dstip, dstip_data in dstips_data.items()
+                }
 
             # For each dstip, see if the amount of ports connections is over the threshold
-            for dstip in dstips.keys():
-
-                dstports: dict = dstips[dstip]['dstports']
-                # Get the total amount of pkts sent to all
-                # ports on the same host
-                pkts_sent = sum(dstports[dport] for dport in dstports)
-                amount_of_dports = len(dstports)
-
+            for dstip, amount_of_dports in dports_per_dstip.items():
                 cache_key = self.get_cache_key(profileid, twid, dstip)
                 if self.check_if_enough_dports_to_trigger_an_evidence(
                         cache_key, amount_of_dports
                         ):
+                    # only read the data of the dstips that triggered an evidence
+                    if dstips_data is None:
+                        dstip_data: dict = self.get_not_established_dst_ip(
+                            protocol, state, profileid, twid, dstip
+                        )
+                    else:
+                        dstip_data: dict = dstips_data[dstip]
+                    dstports: dict = dstip_data['dstports']
+                    # Get the total amount of pkts sent to all
+                    # ports on the same host
+                    pkts_sent = sum(dstports[dport] for dport in dstports)
+
                     evidence_details = {
-                        'timestamp': dstips[dstip]['stime'],
+                        'timestamp': dstip_data['stime'],
                         'pkts_sent': pkts_sent,
                         'protocol': protocol,
                         'profileid': profileid,
                         'twid': twid,
-                        'uid': dstips[dstip]['uid'],
+                        'uid': dstip_data['uid'],
                         'amount_of_dports': amount_of_dports,
                         'dstip': dstip,
                         'state': state,
@@ -5,14 +5,16 @@ import json
 import traceback
 
 # Your imports
-import numpy as np
 import sys
-from tensorflow.python.keras.models import load_model
 
 
 warnings.filterwarnings('ignore', category=FutureWarning)
 warnings.filterwarnings('ignore', category=DeprecationWarning)
 
+# tensorflow takes seconds to import, it's imported by the process of this
+# module in pre_main(), check import_ml_libs()
+np = load_model = None
+
 
 class CCDetection(IModule, multiprocessing.Process):
     # Name: short name of the module. Do not use spaces
@@ -117,8 +119,14 @@ class CCDetection(IModule, multiprocessing.Process):
         # self.print(f'Post Padded Seq sent: {pre_behavioral_model}. Shape: {pre_behavioral_model.shape}')
         return pre_behavioral_model
 
+    def import_ml_libs(self):
+        global np, load_model
+        import numpy as np
+        from tensorflow.python.keras.models import load_model
+
     def pre_main(self):
         utils.drop_root_privs()
+        self.import_ml_libs()
         # TODO: set the decision threshold in the function call
         try:
             # Download lstm model
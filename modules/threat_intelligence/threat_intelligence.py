@@ -12,12 +12,21 @@ import requests
 import threading
 import time
 from slips_files.common.slips_utils import utils
+from slips_files.common.ip_range_index import IPRangeIndex
+
+# returned by get_cached_verdict() when the ioc isn't cached
+NOT_CACHED = object()
 
 
 class ThreatIntel(IModule, multiprocessing.Process, URLhaus):
     name = 'Threat Intelligence'
     description = 'Check if the source IP or destination IP are in a malicious list of IPs'
     authors = ['Frantisek Strasak, Sebastian Garcia, Alya Gomaa']
+    # seconds between the checks for changes in the IoCs, the
+    # update manager keeps adding IoCs while slips is running
+    iocs_refresh_interval = 60
+    # max number of cached verdicts
+    max_cached_verdicts = 100000
 
     def init(self):
         # Get a separator from the database
@@ -29,6 +38,8 @@ class ThreatIntel(IModule, multiprocessing.Process, URLhaus):
             'new_downloaded_file': self.c2,
         }
         self.__read_configuration()
+        # {(ioc type, ioc): (expiration time, verdict)}
+        self.verdicts = {}
         self.get_malicious_ip_ranges()
         self.create_circl_lu_session()
         self.circllu_queue = multiprocessing.Queue()
@@ -66,29 +77,49 @@ class ThreatIntel(IModule, multiprocessing.Process, URLhaus):
         """
         Cache the IoC IP ranges instead of retrieving them from the db
         """
+        self.ioc_version = self.db.get_ioc_version()
         ip_ranges = self.db.get_malicious_ip_ranges()
-        self.cached_ipv6_ranges = {}
-        self.cached_ipv4_ranges = {}
-        for range in ip_ranges.keys():
-            if '.' in range:
-                first_octet = range.split('.')[0]
-                try:
-                    self.cached_ipv4_ranges[first_octet].append(range)
-                except KeyError:
-                    # first time seeing this octet
-                    self.cached_ipv4_ranges[first_octet] = [range]
-            else:
-                # ipv6 range
-                first_octet = range.split(':')[0]
-                try:
-                    self.cached_ipv6_ranges[first_octet].append(range)
-                except KeyError:
-                    # first time seeing this octet
-                    self.cached_ipv6_ranges[first_octet] = [range]
+        # {range: json serialized info of the range}
+        self.ip_ranges_index = IPRangeIndex.build(ip_ranges)
+        self.last_iocs_refresh = time.time()
+
+    def refresh_iocs_if_needed(self):
+        """
+        reloads the ip ranges and forgets the cached verdicts
+        if the IoCs changed since they were last loaded
+        """
+        if time.time() - self.last_iocs_refresh < self.iocs_refresh_interval:
+            return
+        self.last_iocs_refresh = time.time()
+        if self.db.get_ioc_version() == self.ioc_version:
+            return
+        self.verdicts.clear()
+        self.get_malicious_ip_ranges()
+
+    def get_cached_verdict(self, ioc_type: str, ioc: str):
+        """
+        returns the cached result of looking up the given ioc,
+        or NOT_CACHED if it's not cached or expired
+        """
+        if cached := self.verdicts.get((ioc_type, ioc)):
+            expiration_time, verdict = cached
+            if time.time() < expiration_time:
+                return verdict
+        return NOT_CACHED
+
+    def cache_verdict(self, ioc_type: str, ioc: str, verdict):
+        if not self.verdict_cache_ttl:
+            return
+        if len(self.verdicts) >= self.max_cached_verdicts:
+            self.verdicts.clear()
+        self.verdicts[(ioc_type, ioc)] = (
+            time.time() + self.verdict_cache_ttl, verdict
+        )
 
     def __read_configuration(self):
         conf = ConfigParser()
         self.path_to_local_ti_files = conf.local_ti_data_path()
+        self.verdict_cache_ttl = conf.ti_verdict_cache_ttl()
         if not os.path.exists(self.path_to_local_ti_files):
             os.mkdir(self.path_to_local_ti_files)
 
@@ -791,7 +822,12 @@ class ThreatIntel(IModule, multiprocessing.Process, URLhaus):
         if not asn:
             return
 
-        if asn_info := self.db.is_blacklisted_ASN(asn):
+        asn_info = self.get_cached_verdict('asn', asn)
+        if asn_info is NOT_CACHED:
+            asn_info = self.db.is_blacklisted_ASN(asn)
+            self.cache_verdict('asn', asn, asn_info)
+
+        if asn_info:
             asn_info = json.loads(asn_info)
             self.set_evidence_malicious_asn(
                 ip,
@@ -808,33 +844,22 @@ class ThreatIntel(IModule, multiprocessing.Process, URLhaus):
             self, ip, uid, daddr, timestamp, profileid, twid, ip_state
     ):
         """ check if this ip belongs to any of our blacklisted ranges"""
-        ip_obj = ipaddress.ip_address(ip)
-        # Malicious IP ranges are stored in slips sorted by the first octet
-        # so get the ranges that match the fist octet of the given IP
-        if validators.ipv4(ip):
-            first_octet = ip.split('.')[0]
-            ranges_starting_with_octet = self.cached_ipv4_ranges.get(first_octet, [])
-        elif validators.ipv6(ip):
-            first_octet = ip.split(':')[0]
-            ranges_starting_with_octet = self.cached_ipv6_ranges.get(first_octet, [])
-        else:
+        ip_info = self.ip_ranges_index.lookup(ip)
+        if ip_info is None:
             return False
-        for range in ranges_starting_with_octet:
-            if ip_obj in ipaddress.ip_network(range):
-                # ip was found in one of the blacklisted ranges
-                ip_info = self.db.get_malicious_ip_ranges()[range]
-                ip_info = json.loads(ip_info)
-                self.set_evidence_malicious_ip(
-                    ip,
-                    uid,
-                    daddr,
-                    timestamp,
-                    ip_info,
-                    profileid,
-                    twid,
-                    ip_state,
-                )
-                return True
+        # ip was found in one of the blacklisted ranges
+        ip_info = json.loads(ip_info)
+        self.set_evidence_malicious_ip(
+            ip,
+            uid,
+            daddr,
+            timestamp,
+            ip_info,
+            profileid,
+            twid,
+            ip_state,
+        )
+        return True
 
     def search_offline_for_domain(self, domain):
         # Search for this domain in our database of IoC
@@ -866,15 +891,22 @@ class ThreatIntel(IModule, multiprocessing.Process, URLhaus):
         :param ip_state: is basically the answer to "which one is the
         blacklisted IP"? can be 'srcip' or 'dstip'
         """
-        ip_info = self.search_offline_for_ip(ip)
-        if not ip_info:
-            ip_info = self.search_online_for_ip(ip)
+        ip_info = self.get_cached_verdict('ip', ip)
+        if ip_info is NOT_CACHED:
+            ip_info = self.search_offline_for_ip(ip)
+            if not ip_info:
+                ip_info = self.search_online_for_ip(ip)
+                if ip_info:
+                    # the verdict of this ip is cached below, no need to
+                    # drop the cached verdicts of the rest of the IoCs
+                    self.db.add_ips_to_IoC(
+                        {ip: json.dumps(ip_info)}, bump_version=False
+                    )
+            self.cache_verdict('ip', ip, ip_info)
+
         if not ip_info:
             # not malicious
             return False
-        self.db.add_ips_to_IoC({
-                ip: json.dumps(ip_info)
-        })
         self.set_evidence_malicious_ip(
             ip,
             uid,
@@ -919,7 +951,11 @@ class ThreatIntel(IModule, multiprocessing.Process, URLhaus):
             twid
     ):
 
-        url_info = self.search_online_for_url(url)
+        url_info = self.get_cached_verdict('url', url)
+        if url_info is NOT_CACHED:
+            url_info = self.search_online_for_url(url)
+            self.cache_verdict('url', url, url_info)
+
         if not url_info:
             # not malicious
             return False
@@ -943,7 +979,12 @@ class ThreatIntel(IModule, multiprocessing.Process, URLhaus):
         if self.is_ignored_domain(domain):
             return False
 
-        domain_info, is_subdomain = self.search_offline_for_domain(domain)
+        verdict = self.get_cached_verdict('domain', domain)
+        if verdict is NOT_CACHED:
+            verdict = self.search_offline_for_domain(domain)
+            self.cache_verdict('domain', domain, verdict)
+
+        domain_info, is_subdomain = verdict
         if not domain_info:
             return False
 
@@ -1000,11 +1041,14 @@ class ThreatIntel(IModule, multiprocessing.Process, URLhaus):
         self.update_local_file('own_malicious_iocs.csv')
         self.update_local_file('own_malicious_JA3.csv')
         self.update_local_file('own_malicious_JARM.csv')
+        # the ranges in own_malicious_iocs.csv
+        self.get_malicious_ip_ranges()
         self.circllu_calls_thread.start()
 
     def main(self):
         # The channel now can receive an IP address or a domain name
         if msg:= self.get_msg('give_threat_intelligence'):
+            self.refresh_iocs_if_needed()
             # Data is sent in the channel as a json dict so we need to deserialize it first
             data = json.loads(msg['data'])
             # Extract data from dict
@@ -5,7 +5,6 @@ import sys
 
 # Your imports
 import time
-import json
 
 
 class Timeline(IModule, multiprocessing.Process):
@@ -32,7 +31,7 @@ class Timeline(IModule, multiprocessing.Process):
             timestamp = utils.convert_format(timestamp, utils.alerts_format)
         return str(timestamp)
 
-    def process_flow(self, profileid, twid, flow, timestamp: float):
+    def process_flow(self, profileid, twid, flow_dict: dict, timestamp: float):
         """
         Process the received flow  for this profileid and twid
          so its printed by the logprocess later
@@ -41,8 +40,7 @@ class Timeline(IModule, multiprocessing.Process):
 
         try:
             # Convert the common fields to something that can be interpreted
-            uid = next(iter(flow))
-            flow_dict = json.loads(flow[uid])
+            uid = flow_dict['uid']
             profile_ip = profileid.split('_')[1]
             dur = round(float(flow_dict['dur']), 3)
             stime = flow_dict['ts']
@@ -367,14 +365,11 @@ class Timeline(IModule, multiprocessing.Process):
     def main(self):
         # Main loop function
         if msg:= self.get_msg('new_flow'):
-            mdata = msg['data']
-            # Convert from json to dict
-            mdata = json.loads(mdata)
+            mdata = self.decode_msg(msg)
             profileid = mdata['profileid']
             twid = mdata['twid']
             flow = mdata['flow']
             timestamp = mdata['stime']
-            flow = json.loads(flow)
             self.process_flow(
                 profileid, twid, flow, timestamp
             )
@@ -519,17 +519,11 @@ class VT(IModule, multiprocessing.Process):
             return 1
 
         if msg:= self.get_msg('new_flow'):
-            data = msg['data']
-            data = json.loads(data)
+            data = self.decode_msg(msg)
             # profileid = data['profileid']
             # twid = data['twid']
             # stime = data['stime']
-            flow = json.loads(
-                data['flow']
-            )   # this is a dict {'uid':json flow data}
-            # there is only one pair key-value in the dictionary
-            for key, value in flow.items():
-                flow_data = json.loads(value)
+            flow_data = data['flow']
             ip = flow_data['daddr']
             cached_data = self.db.get_ip_info(ip)
             if not cached_data:
@@ -656,7 +656,7 @@ class Main(IObservable):
             self.input_process = self.proc_man.start_input_process()
 
             # obtain the list of active processes
-            self.proc_man.processes = multiprocessing.active_children()
+            self.proc_man.processes = self.proc_man.get_children()
 
             self.db.store_process_PID(
                 'slips.py',
@@ -1,5 +1,7 @@
 import sys
+import time
 import traceback
+from collections import deque
 from abc import ABC, abstractmethod
 from multiprocessing import Process, Event
 
@@ -7,6 +9,7 @@ from slips_files.core.output import Output
 from slips_files.common.slips_utils import utils
 from slips_files.core.database.database_manager import DBManager
 from slips_files.common.abstracts.observer import IObservable
+from slips_files.common.msg_codec import MsgCodec
 
 class IModule(IObservable, ABC):
     """
@@ -15,6 +18,27 @@ class IModule(IObservable, ABC):
     name = ''
     description = 'Template module'
     authors = ['Template Author']
+    # max seconds run() waits for a msg in any of the channels of the module
+    # before calling main() anyway
+    channels_read_timeout = 1
+    # max msgs read from the channels at once, they're given to main() by
+    # get_msg() before reading more
+    channels_read_batch = 100
+    # max msgs buffered per channel, the oldest ones are dropped after that.
+    # only reached by the channels main() never reads
+    channels_buffer_size = 10000
+    # the multiplexed connection and the msgs read from it,
+    # check multiplex_channels()
+    channels_reader = None
+    # set once main() runs for the first time
+    main_called = False
+    # decodes the msgs of the new_flow channel
+    msg_codec = MsgCodec()
+    # (channel, time) of the last msg given to main(), used for measuring
+    # the time the module takes to handle each msg
+    msg_being_handled = None
+    collect_metrics = False
+
     def __init__(self,
                  logger: Output,
                  output_dir,
@@ -25,13 +49,53 @@ class IModule(IObservable, ABC):
         self.redis_port = redis_port
         self.output_dir = output_dir
         self.msg_received = False
+        # {channel_name: msgs read and not yet given to main()},
+        # check multiplex_channels()
+        self.channels_msgs = {}
+        # the channels main() asked for msgs from using get_msg()
+        self.consumed_channels = set()
         # used to tell all slips.py children to stop
         self.termination_event: Event = termination_event
         self.logger = logger
         self.db = DBManager(self.logger, self.output_dir, self.redis_port)
         IObservable.__init__(self)
         self.add_observer(self.logger)
+        self.collect_metrics = self.db.is_collecting_metrics()
         self.init(**kwargs)
+        self.multiplex_channels()
+
+    def multiplex_channels(self):
+        """
+        replaces the connection per channel the module subscribed to in init()
+        with 1 connection subscribed to all of them, this connection is read
+        by run() in a blocking way and the msgs are given to get_msg()
+        per channel, so idle modules don't keep polling redis
+        """
+        # {channel_name: msgs read and not yet given to main()}
+        # the channels that aren't here are read by get_msg() the old way
+        self.channels_msgs = {}
+        self.consumed_channels = set()
+        channels = getattr(self, 'channels', {})
+        subscribed_channels = [
+            channel for channel, pubsub in channels.items() if pubsub
+        ]
+        if not subscribed_channels:
+            return
+
+        # this runs in the main process, the module's name is given
+        # explicitly so it gets its own consumer group when using streams
+        self.channels_reader = self.db.subscribe_to_channels(
+            subscribed_channels, subscriber=self.name
+        )
+        if not self.channels_reader:
+            self.channels_reader = None
+            return
+
+        for channel in subscribed_channels:
+            channels[channel].close()
+            self.channels_msgs[channel] = deque(
+                maxlen=self.channels_buffer_size
+            )
 
     @abstractmethod
     def init(self, **kwargs):
@@ -100,15 +164,91 @@ class IModule(IObservable, ABC):
         """
         pass
 
+    def has_pending_msgs(self) -> bool:
+        """
+        returns True if main() didn't get all the buffered msgs yet.
+        once main() runs, only the channels it reads count, the msgs of the
+        channels a module subscribes to but never reads would otherwise stop
+        it from reading the rest forever
+        """
+        if not self.main_called:
+            return any(self.channels_msgs.values())
+        return any(
+            self.channels_msgs[channel] for channel in self.consumed_channels
+        )
+
+    def read_channels(self):
+        """
+        waits for the next msgs in the channels of this module and
+        buffers them per channel until main() asks for them using get_msg().
+        doesn't read anything if main() didn't get all the buffered msgs yet
+        """
+        if self.channels_reader is None or self.has_pending_msgs():
+            return
+
+        msg = self.db.get_message(
+            self.channels_reader, timeout=self.channels_read_timeout
+        )
+        read = 0
+        while msg:
+            channel = msg['channel']
+            if utils.is_msg_intended_for(msg, channel):
+                self.channels_msgs[channel].append(msg)
+                read += 1
+            if read >= self.channels_read_batch:
+                break
+            msg = self.db.get_message(self.channels_reader, timeout=0)
+
+        self.msg_received = self.has_pending_msgs()
+
     def get_msg(self, channel_name):
+        if channel_name in self.channels_msgs:
+            self.consumed_channels.add(channel_name)
+            msgs = self.channels_msgs[channel_name]
+            if msgs:
+                self.msg_received = True
+                self.track_msg(channel_name)
+                return msgs.popleft()
+            self.msg_received = self.has_pending_msgs()
+            return False
+
         message = self.db.get_message(self.channels[channel_name])
         if utils.is_msg_intended_for(message, channel_name):
             self.msg_received = True
+            self.track_msg(channel_name)
             return message
         else:
             self.msg_received = False
             return False
 
+    def track_msg(self, channel_name: str):
+        """
+        counts the msgs this module consumed from the given channel and
+        starts measuring the time the module takes to handle this msg.
+        the measurement ends when main() asks for the next msg or returns
+        """
+        if not self.collect_metrics:
+            return
+        self.finish_msg_handling()
+        self.db.incr_metric(f'consumed:{self.name}:{channel_name}')
+        self.msg_being_handled = (channel_name, time.time())
+
+    def finish_msg_handling(self):
+        if not self.msg_being_handled:
+            return
+        channel_name, start_time = self.msg_being_handled
+        self.db.observe_handler_latency(
+            self.name, channel_name, time.time() - start_time
+        )
+        self.msg_being_handled = None
+
+    def decode_msg(self, msg) -> dict:
+        """
+        returns the data of the given msg as a dict.
+        used for the channels whose msgs are encoded using MsgCodec (new_flow)
+        """
+        return self.msg_codec.decode(msg['data'])
+
     def run(self):
         """ This is the loop function, it runs non-stop as long as the module is online """
         try:
@@ -127,10 +267,17 @@ class IModule(IObservable, ABC):
 
         error = False
         try:
-            while not self.should_stop():
+            while True:
+                # block until there are msgs to handle instead of
+                # polling the channels in main()
+                self.read_channels()
+                if self.should_stop():
+                    break
                 # keep running main() in a loop as long as the module is online
                 # if a module's main() returns 1, it means there's an error and it needs to stop immediately
                 error: bool = self.main()
+                self.main_called = True
+                self.finish_msg_handling()
                 if error:
                     self.shutdown_gracefully()
 
@@ -141,4 +288,5 @@ class IModule(IObservable, ABC):
             self.print(f'Problem in main() line {exception_line}', 0, 1)
             self.print(traceback.format_exc(), 0, 1)
 
+        self.db.flush_metrics()
         return True
@@ -36,8 +36,13 @@ class ICore(IModule, Process):
         self.redis_port = redis_port
         self.db = DBManager(self.logger, output_dir, redis_port)
         self.msg_received = False
+        # the core processes read their channels the old way,
+        # check IModule.multiplex_channels()
+        self.channels_msgs = {}
+        self.consumed_channels = set()
         IObservable.__init__(self)
         self.add_observer(self.logger)
+        self.collect_metrics = self.db.is_collecting_metrics()
         self.init(**kwargs)
 
     def run(self):
@@ -59,5 +64,6 @@ class ICore(IModule, Process):
             self.print(f'Problem in main() line {exception_line}', 0, 1)
             self.print(traceback.format_exc(), 0, 1)
 
+        self.db.flush_metrics()
         return True
 
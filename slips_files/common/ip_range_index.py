@@ -0,0 +1,101 @@
+import ipaddress
+import socket
+from typing import Any, Dict, Optional
+
+
+class IPRangeIndex:
+    """
+    Longest prefix match of IPv4 and IPv6 addresses against a set of
+    ranges, e.g. the blacklisted ranges of the TI feeds, the ranges of
+    the whitelisted orgs and the cached ASN ranges.
+
+    the networks of each prefix length are kept in a dict keyed by their
+    first address as an int, so a lookup masks the ip with each prefix
+    length in use (longest first) and checks the dict of that length.
+    the cost of a lookup depends on the number of different prefix
+    lengths, not on the number of ranges
+    """
+    def __init__(self):
+        self.clear()
+
+    @classmethod
+    def build(cls, ranges: Dict[str, Any]) -> 'IPRangeIndex':
+        """
+        returns an index of the given {range: value} dict,
+        the invalid ranges are ignored
+        """
+        index = cls()
+        for ip_range, value in ranges.items():
+            index.add(ip_range, value)
+        return index
+
+    def clear(self):
+        # {ip version: {prefix length: {first ip of the network as int: (range, value)}}}
+        self.networks = {4: {}, 6: {}}
+        # {ip version: [(netmask as int, networks of this prefix length), ...]}
+        # of the prefix lengths in use, longest first
+        self.masks = {4: [], 6: []}
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, ip_range: str, value: Any = True) -> bool:
+        """
+        adds the given range to the index,
+        returns False if it's not a valid range
+        """
+        try:
+            network = ipaddress.ip_network(ip_range.strip(), strict=False)
+        except (ValueError, AttributeError):
+            return False
+
+        networks: dict = self.networks[network.version]
+        prefix_len = network.prefixlen
+        if prefix_len not in networks:
+            networks[prefix_len] = {}
+            all_ones = (1 << network.max_prefixlen) - 1
+            self.masks[network.version] = [
+                (all_ones ^ (all_ones >> length), networks[length])
+                for length in sorted(networks, reverse=True)
+            ]
+
+        first_ip = int(network.network_address)
+        if first_ip not in networks[prefix_len]:
+            self.size += 1
+        networks[prefix_len][first_ip] = (ip_range, value)
+        return True
+
+    def lookup_range(self, ip: str) -> Optional[tuple]:
+        """
+        returns a (range, value) tuple of the most specific range the
+        given ip belongs to, or None if it doesn't belong to any range
+        """
+        ip = str(ip)
+        try:
+            if ':' in ip:
+                masks = self.masks[6]
+                ip_int = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+            else:
+                masks = self.masks[4]
+                ip_int = int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+        except OSError:
+            # invalid ip
+            return None
+
+        for mask, networks in masks:
+            if res := networks.get(ip_int & mask):
+                return res
+        return None
+
+    def lookup(self, ip: str) -> Any:
+        """
+        returns the value of the most specific range the given ip
+        belongs to, or None if it doesn't belong to any range
+        """
+        if res := self.lookup_range(ip):
+            return res[1]
+        return None
+
+    def __contains__(self, ip: str) -> bool:
+        return self.lookup_range(ip) is not None
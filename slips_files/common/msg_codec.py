@@ -0,0 +1,46 @@
+import json
+from typing import Union
+
+try:
+    # msgpack msgs are smaller and faster to encode/decode than json
+    import msgpack
+except ImportError:
+    msgpack = None
+
+SUPPORTED_CODECS = ('json', 'msgpack')
+
+
+class MsgCodec:
+    """
+    Encodes the dicts slips publishes in the hot channels (new_flow) once,
+    using json or msgpack (msg_codec in slips.conf), instead of nesting
+    json strings inside json strings.
+
+    the msgpack msgs are published as raw bytes, the subscribers of the
+    channels that carry them read them without decoding them, check RawPubSub.
+
+    decode() detects the codec of each msg by itself, so the subscribers
+    don't need to know the codec the publisher used
+    """
+    def __init__(self, codec: str = 'json'):
+        if codec == 'msgpack' and msgpack is None:
+            # msgpack isn't installed
+            codec = 'json'
+        self.codec = codec
+
+    def encode(self, data: dict) -> Union[str, bytes]:
+        if self.codec == 'msgpack':
+            return msgpack.packb(data, use_bin_type=True)
+        return json.dumps(data)
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        if isinstance(data, str) or data.startswith(b'{'):
+            # json msgs are objects, msgpack maps never start with '{'
+            return json.loads(data)
+
+        if msgpack is None:
+            raise ValueError(
+                "Can't decode a msgpack msg, msgpack isn't installed"
+            )
+        return msgpack.unpackb(data, raw=False)
+
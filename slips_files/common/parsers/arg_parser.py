@@ -283,6 +283,13 @@ class ArgumentParser(argparse.ArgumentParser):
             required=False,
             help='Read flows from a module other than input process.',
         )
+        self.add_argument(
+            '--metrics',
+            action='store_true',
+            required=False,
+            help='Print the msgs published and consumed per channel and module '
+                 'by the slips instance running on the given redis port (-P, default 6379).',
+        )
         self.add_argument(
             '--no-recurse',
             action='store_true',
@@ -639,6 +639,287 @@ class ConfigParser(object):
 
         return period
 
+    def tw_storage_layout(self) -> str:
+        """
+        returns 'json' or 'native', the layout used for storing
+        the ips and ports of each timewindow in redis.
+        always native when using more than 1 profiler worker
+        """
+        if self.profiler_workers() > 1:
+            # the profiles of the dst ips are updated by more than 1 worker,
+            # they would overwrite each other's updates of the json blobs
+            return 'native'
+        return self.configured_tw_storage_layout()
+
+    def configured_tw_storage_layout(self) -> str:
+        """
+        returns the tw_storage_layout in slips.conf, even if it can't be
+        used with the configured number of profiler workers
+        """
+        layout = self.read_configuration(
+             'parameters', 'tw_storage_layout', 'json'
+        )
+        layout = utils.sanitize(layout).lower()
+        return layout if layout in ('json', 'native') else 'json'
+
+    def database_backend(self) -> str:
+        """
+        returns 'redis' or 'memory', where slips stores the profiles
+        and the data the modules share
+        """
+        backend = self.read_configuration(
+             'parameters', 'database_backend', 'redis'
+        )
+        backend = utils.sanitize(backend).lower()
+        return backend if backend in ('redis', 'memory') else 'redis'
+
+    def embedded_mode(self) -> bool:
+        """
+        returns whether slips should run all the modules as threads of the
+        main process instead of starting a process per module
+        """
+        embedded = self.read_configuration(
+            'parameters', 'embedded_mode', 'no'
+        )
+        return 'yes' in embedded.lower()
+
+    def collect_metrics(self) -> bool:
+        """
+        returns whether slips should count the msgs published and consumed
+        per channel and store them in the metrics hash in redis
+        """
+        collect = self.read_configuration(
+            'parameters', 'collect_metrics', 'yes'
+        )
+        return 'yes' in collect.lower()
+
+    def message_transport(self) -> str:
+        """
+        returns 'pubsub' or 'streams', the redis feature used for sending
+        msgs between the slips processes
+        """
+        transport = self.read_configuration(
+             'parameters', 'message_transport', 'pubsub'
+        )
+        transport = utils.sanitize(transport).lower()
+        return transport if transport in ('pubsub', 'streams') else 'pubsub'
+
+    def msg_codec(self) -> str:
+        """
+        returns 'json' or 'msgpack', the encoding of the msgs
+        published in the new_flow channel
+        """
+        codec = self.read_configuration(
+             'parameters', 'msg_codec', 'json'
+        )
+        codec = utils.sanitize(codec).lower()
+        return codec if codec in ('json', 'msgpack') else 'json'
+
+    def streams_maxlen(self) -> int:
+        """
+        returns the approximate max number of msgs kept in each redis stream
+        """
+        maxlen = self.read_configuration(
+             'parameters', 'streams_maxlen', 100000
+        )
+        try:
+            maxlen = int(maxlen)
+        except ValueError:
+            maxlen = 100000
+        return max(maxlen, 1)
+
+    def streams_batch_size(self) -> int:
+        """
+        returns how many msgs each subscriber reads from a stream at once
+        """
+        batch_size = self.read_configuration(
+             'parameters', 'streams_batch_size', 100
+        )
+        try:
+            batch_size = int(batch_size)
+        except ValueError:
+            batch_size = 100
+        return max(batch_size, 1)
+
+    def profiler_workers(self) -> int:
+        """
+        returns the number of profiler processes to start
+        """
+        workers = self.read_configuration(
+             'parameters', 'profiler_workers', 1
+        )
+        try:
+            workers = int(workers)
+        except ValueError:
+            workers = 1
+        return max(workers, 1)
+
+    def tw_closing_check_every(self) -> int:
+        """
+        returns after how many tw modifications slips checks for tws to close
+        """
+        check_every = self.read_configuration(
+             'parameters', 'tw_closing_check_every', 500
+        )
+        try:
+            check_every = int(check_every)
+        except ValueError:
+            check_every = 500
+        return max(check_every, 1)
+
+    def tw_closing_check_interval(self) -> float:
+        """
+        returns the max seconds between 2 checks for tws to close
+        """
+        interval = self.read_configuration(
+             'parameters', 'tw_closing_check_interval', 1
+        )
+        try:
+            interval = float(interval)
+        except ValueError:
+            interval = 1
+        return interval
+
+    def profiler_write_batch_size(self) -> int:
+        """
+        returns the number of flows the profiler queues before
+        flushing their writes to redis. 1 means batching is disabled
+        """
+        batch_size = self.read_configuration(
+             'parameters', 'profiler_write_batch_size', 1
+        )
+        try:
+            batch_size = int(batch_size)
+        except ValueError:
+            batch_size = 1
+        return max(batch_size, 1)
+
+    def profiler_write_batch_timeout(self) -> float:
+        """returns the max time in seconds a queued write waits"""
+        timeout = self.read_configuration(
+             'parameters', 'profiler_write_batch_timeout', 100
+        )
+        try:
+            timeout = float(timeout)
+        except ValueError:
+            timeout = 100
+        # convert to seconds
+        return timeout / 1000
+
+    def archive_flows(self) -> bool:
+        archive = self.read_configuration(
+            'parameters', 'flow_archive', 'no'
+        )
+        return 'yes' in archive.lower()
+
+    def flow_archive_row_group_size(self) -> int:
+        """
+        returns the number of flows of a timewindow written
+        to the flow archive at once
+        """
+        size = self.read_configuration(
+             'parameters', 'flow_archive_row_group_size', 10000
+        )
+        try:
+            size = int(size)
+        except ValueError:
+            size = 10000
+        return max(size, 1)
+
+    def ti_lookup_coalescing_window(self) -> float:
+        """
+        returns the seconds a lookup sent to the TI module isn't sent again
+        for the same profile and tw. 0 means every lookup is sent
+        """
+        window = self.read_configuration(
+             'threatintelligence', 'lookup_coalescing_window', 0
+        )
+        try:
+            window = float(window)
+        except ValueError:
+            window = 0
+        return max(window, 0)
+
+    def ti_verdict_cache_ttl(self) -> float:
+        """
+        returns the seconds the TI module caches the result of
+        looking up an ioc. 0 disables the cache
+        """
+        ttl = self.read_configuration(
+             'threatintelligence', 'verdict_cache_ttl', 3600
+        )
+        try:
+            ttl = float(ttl)
+        except ValueError:
+            ttl = 3600
+        return max(ttl, 0)
+
+    def ip_context_cache_ttl(self) -> float:
+        """
+        returns the max seconds each process caches the info and the DNS
+        resolution of an IP. 0 disables the cache
+        """
+        ttl = self.read_configuration(
+             'parameters', 'ip_context_cache_ttl', 10
+        )
+        try:
+            ttl = float(ttl)
+        except ValueError:
+            ttl = 10
+        return max(ttl, 0)
+
+    def sqlite_write_batch_size(self) -> int:
+        """
+        returns the number of flows queued before inserting them in the
+        sqlite db in 1 transaction. 1 means batching is disabled
+        """
+        batch_size = self.read_configuration(
+             'parameters', 'sqlite_write_batch_size', 1
+        )
+        try:
+            batch_size = int(batch_size)
+        except ValueError:
+            batch_size = 1
+        return max(batch_size, 1)
+
+    def sqlite_write_batch_timeout(self) -> float:
+        """returns the max time in seconds a queued flow waits"""
+        timeout = self.read_configuration(
+             'parameters', 'sqlite_write_batch_timeout', 500
+        )
+        try:
+            timeout = float(timeout)
+        except ValueError:
+            timeout = 500
+        # convert to seconds
+        return timeout / 1000
+
+    def profiler_queue_batch_size(self) -> int:
+        """
+        returns the max number of lines the input process sends to the
+        profiler in 1 queue msg. 1 means batching is disabled
+        """
+        batch_size = self.read_configuration(
+             'parameters', 'profiler_queue_batch_size', 1
+        )
+        try:
+            batch_size = int(batch_size)
+        except ValueError:
+            batch_size = 1
+        return max(batch_size, 1)
+
+    def profiler_queue_batch_timeout(self) -> float:
+        """returns the max time in seconds a line waits in the input process"""
+        timeout = self.read_configuration(
+             'parameters', 'profiler_queue_batch_timeout', 100
+        )
+        try:
+            timeout = float(timeout)
+        except ValueError:
+            timeout = 100
+        # convert to seconds
+        return timeout / 1000
+
     def mac_db_link(self):
         return utils.sanitize(self.read_configuration(
              'threatintelligence', 'mac_db', ''
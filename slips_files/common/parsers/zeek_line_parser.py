@@ -0,0 +1,140 @@
+import json
+from re import split
+from typing import Dict, Optional, Tuple
+
+try:
+    # orjson is a lot faster than the stdlib json, use it when it's installed
+    import orjson
+    JSON_DECODE_ERRORS = (orjson.JSONDecodeError, json.decoder.JSONDecodeError)
+    loads = orjson.loads
+except ImportError:
+    orjson = None
+    JSON_DECODE_ERRORS = (json.decoder.JSONDecodeError,)
+    loads = json.loads
+
+# the zeek log types slips supports. the order matters, a log file belongs
+# to the first type found in its name
+ZEEK_LOG_TYPES = (
+    'conn',
+    'dns',
+    'http',
+    'ssl',
+    'ssh',
+    'dhcp',
+    'ftp',
+    'smtp',
+    'tunnel',
+    'notice',
+    'files',
+    'arp',
+    'software',
+    'weird',
+)
+
+
+class ZeekLineParser:
+    """
+    Parses each zeek line read by slips only once.
+    json lines are parsed using orjson if available, the ts of tab
+    separated lines is read without splitting the whole line, and the
+    #fields header of each tab separated file is cached as
+    a {field_name: index} map
+    """
+    def __init__(self):
+        # {file_type: {field_name: index}} from the #fields header of tsv files
+        self.fields: Dict[str, Dict[str, int]] = {}
+        # {path or file name: zeek log type}, check get_log_type()
+        self.log_types: Dict[str, Optional[str]] = {}
+
+    def parse_json(self, line) -> Optional[dict]:
+        """returns the given json line as a dict or None if it's invalid"""
+        try:
+            return loads(line)
+        except JSON_DECODE_ERRORS:
+            return None
+
+    def get_log_type(self, file_type: str) -> Optional[str]:
+        """
+        returns the zeek log type (conn, dns, etc.) of the given file path
+        or None if it's not supported.
+        only the file name is used, so zeek dirs with 'conn' in their name
+        aren't treated as conn logs
+        """
+        try:
+            return self.log_types[file_type]
+        except KeyError:
+            pass
+
+        file_name = file_type.split('/')[-1]
+        log_type = None
+        for supported_type in ZEEK_LOG_TYPES:
+            if supported_type in file_name:
+                log_type = supported_type
+                break
+        self.log_types[file_type] = log_type
+        return log_type
+
+    def split_tabs_line(self, line: str) -> list:
+        """
+        the data is either \t separated or space separated
+        zeek files that are space separated are either separated by 2 or 3
+        spaces so we can't use python's split()
+        """
+        if '\t' in line:
+            return line.split('\t')
+        return split(r'\s{2,}', line)
+
+    def get_ts_of_tabs_line(self, line: str) -> str:
+        """returns the first field of the given tab separated line"""
+        ts, sep, _ = line.partition('\t')
+        if sep:
+            return ts
+        return split(r'\s{2,}', line, maxsplit=1)[0]
+
+    def parse_ts(self, line: str, is_tabs: bool) -> Tuple:
+        """
+        returns the ts of the given line as a float and the line as it should
+        be sent to the profiler (a dict for json lines and the same str
+        for tab separated lines)
+        returns (False, False) if the line or its ts is invalid
+        """
+        if is_tabs:
+            nline = line
+            timestamp = self.get_ts_of_tabs_line(line)
+        else:
+            nline = self.parse_json(line)
+            if not isinstance(nline, dict):
+                return False, False
+            # In some Zeek files there may not be a ts field
+            # Like in some weird smb files
+            timestamp = nline.get('ts', 0)
+        try:
+            timestamp = float(timestamp)
+        except (ValueError, TypeError):
+            # this ts doesnt repr a float value, ignore it
+            return False, False
+        return timestamp, nline
+
+    def is_fields_header(self, line: str) -> bool:
+        return line.startswith('#fields')
+
+    def set_fields(self, file_type: str, header: str):
+        """
+        caches the {field_name: index} of the given #fields header line
+        """
+        fields = header.rstrip('\n').split('\t')[1:]
+        self.fields[file_type] = {
+            field: idx for idx, field in enumerate(fields)
+        }
+
+    def get_field_index(
+            self, file_type: str, field: str, default: int = None
+    ) -> Optional[int]:
+        """
+        returns the index of the given field in the tab separated lines
+        of the given file, using its cached #fields header
+        """
+        try:
+            return self.fields[file_type][field]
+        except KeyError:
+            return default
@@ -0,0 +1,171 @@
+"""
+Compares the time slips takes to start its modules and the memory they use
+when every module runs in its own process (the default) and when all of them
+run as threads of one process (embedded_mode = yes in slips.conf).
+
+each mode is measured in a new python process using a copy of the given
+config file. the multiprocess mode uses a redis-server on the given port,
+the embedded mode uses database_backend = memory.
+the memory is the sum of the PSS of the benchmark process and all its
+children, so the memory shared by the forked processes is only counted once.
+
+usage:
+    python3 -m slips_files.common.performance_profilers.embedded_mode_benchmark \
+        [config_file] [redis_port]
+"""
+import configparser
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Event
+
+import psutil
+
+DEFAULT_CONFIG_FILE = 'config/slips.conf'
+# don't flush the db of a running slips
+DEFAULT_REDIS_PORT = 32855
+# seconds to wait for the modules to finish their pre_main() before
+# measuring the memory
+SETTLE_TIME = 5
+
+MODES = {
+    'multiprocess': {'embedded_mode': 'no', 'database_backend': 'redis'},
+    'embedded': {'embedded_mode': 'yes', 'database_backend': 'memory'},
+}
+
+
+def write_config(config_file: str, options: dict, output_dir: str) -> str:
+    """
+    writes a copy of the given config file with the given
+    options of the [parameters] section, returns its path
+    """
+    config = configparser.ConfigParser(interpolation=None, comment_prefixes='#')
+    config.read(config_file)
+    for option, value in options.items():
+        config.set('parameters', option, value)
+    path = os.path.join(output_dir, 'slips.conf')
+    with open(path, 'w') as f:
+        config.write(f)
+    return path
+
+
+def get_memory_usage() -> int:
+    """returns the PSS of this process and all its children in bytes"""
+    total = 0
+    current_process = psutil.Process()
+    for process in [current_process] + current_process.children(recursive=True):
+        try:
+            memory = process.memory_full_info()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        total += getattr(memory, 'pss', memory.rss)
+    return total
+
+
+def run_modules(redis_port: int, output_dir: str) -> dict:
+    """
+    starts all the enabled modules the same way slips does using the
+    config file given with -c, returns the measurements
+    """
+    # imported here to use the config file given to this process
+    from managers.process_manager import ProcessManager, ModuleThread
+    from slips_files.common.parsers.config_parser import ConfigParser
+    from slips_files.core.database.database_manager import DBManager
+    from slips_files.core.output import Output
+
+    logger = Output(
+        verbose=0,
+        stderr=os.path.join(output_dir, 'errors.log'),
+        slips_logfile=os.path.join(output_dir, 'slips.log'),
+    )
+    proc_man = ProcessManager(None)
+    to_ignore: list = ConfigParser().get_disabled_modules('zeek_log_file')
+    module_classes = proc_man.import_modules(
+        proc_man.get_modules(to_ignore)[0]
+    )[0]
+    termination_event = Event()
+
+    start_time = time.time()
+    DBManager(logger, output_dir, redis_port)
+    modules = []
+    for module_class in module_classes.values():
+        module = module_class(logger, output_dir, redis_port, termination_event)
+        modules.append(proc_man.start_module(module))
+    startup_time = time.time() - start_time
+
+    time.sleep(SETTLE_TIME)
+    memory = get_memory_usage()
+    processes = len(psutil.Process().children(recursive=True))
+
+    termination_event.set()
+    for module in modules:
+        module.join(3)
+        if not isinstance(module, ModuleThread) and module.is_alive():
+            proc_man.kill_process_tree(module.pid)
+
+    return {
+        'modules': len(modules),
+        'processes': processes,
+        'startup_time': startup_time,
+        'memory': memory,
+    }
+
+
+def benchmark_mode(mode: str, config_file: str, redis_port: int) -> dict:
+    """runs the given mode in a new process and returns its measurements"""
+    with tempfile.TemporaryDirectory() as output_dir:
+        config = write_config(config_file, MODES[mode], output_dir)
+        res = subprocess.run(
+            [
+                sys.executable, '-m', __spec__.name,
+                '--run', str(redis_port), output_dir, '-c', config
+            ],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+    # the measurements are in the last line, the modules may print before it
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def main():
+    if sys.argv[1:2] == ['--run']:
+        redis_port, output_dir = int(sys.argv[2]), sys.argv[3]
+        print(json.dumps(run_modules(redis_port, output_dir)), flush=True)
+        # the processes started by Output and the modules keep the stdout
+        # pipe open, and the threads of the embedded modules are done with
+        for child in psutil.Process().children(recursive=True):
+            child.kill()
+        os._exit(0)
+
+    config_file = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CONFIG_FILE
+    redis_port = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_REDIS_PORT
+
+    results = {}
+    for mode in MODES:
+        results[mode] = benchmark_mode(mode, config_file, redis_port)
+        print(
+            f'{mode:>12}: started {results[mode]["modules"]} modules in '
+            f'{results[mode]["startup_time"] * 1000:.2f} ms, '
+            f'{results[mode]["memory"] / 2**20:.2f} MB, '
+            f'{results[mode]["processes"]} child processes'
+        )
+
+    # the redis-server started for the multiprocess mode
+    from slips_files.core.database.redis_db.database import RedisDB
+    RedisDB.close_redis_server(redis_port)
+
+    multiprocess, embedded = results['multiprocess'], results['embedded']
+    if embedded['startup_time'] and embedded['memory']:
+        print(
+            f'     speedup: '
+            f'{multiprocess["startup_time"] / embedded["startup_time"]:.2f}x '
+            f'faster startup, '
+            f'{multiprocess["memory"] / embedded["memory"]:.2f}x less memory'
+        )
+
+
+if __name__ == '__main__':
+    main()
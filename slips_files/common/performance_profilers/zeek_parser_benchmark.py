@@ -0,0 +1,94 @@
+"""
+Compares the time slips takes to parse zeek lines using ZeekLineParser
+with the json.loads/split based parsing slips used before it.
+
+usage:
+    python3 -m slips_files.common.performance_profilers.zeek_parser_benchmark \
+        [zeek_dir] [repetitions]
+"""
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+from re import split
+from typing import List, Tuple
+
+from slips_files.common.parsers.zeek_line_parser import (
+    ZeekLineParser,
+    ZEEK_LOG_TYPES,
+    orjson,
+)
+
+DEFAULT_ZEEK_DIR = 'dataset/test9-mixed-zeek-dir'
+
+
+def read_lines(zeek_dir: str) -> List[Tuple[str, str]]:
+    """returns (file path, line) of all the flows in the supported zeek logs"""
+    lines = []
+    for file in sorted(os.listdir(zeek_dir)):
+        if Path(file).stem not in ZEEK_LOG_TYPES:
+            continue
+        path = os.path.join(zeek_dir, file)
+        with open(path) as f:
+            lines.extend(
+                (path, line) for line in f if line and not line.startswith('#')
+            )
+    return lines
+
+
+def is_tabs_dir(lines: List[Tuple[str, str]]) -> bool:
+    return bool(lines) and not lines[0][1].startswith('{')
+
+
+def legacy_parse(lines: List[Tuple[str, str]], is_tabs: bool):
+    """the parsing slips did before using ZeekLineParser"""
+    for path, line in lines:
+        if is_tabs:
+            nline = line.split('\t') if '\t' in line else split(r'\s{2,}', line)
+            timestamp = nline[0]
+        else:
+            nline = json.loads(line)
+            timestamp = nline.get('ts', 0)
+        float(timestamp)
+        file_type = path.split('/')[-1]
+        for log_type in ZEEK_LOG_TYPES:
+            if log_type in file_type:
+                break
+
+
+def fast_parse(lines: List[Tuple[str, str]], is_tabs: bool):
+    parser = ZeekLineParser()
+    for path, line in lines:
+        parser.parse_ts(line, is_tabs)
+        parser.get_log_type(path)
+
+
+def main():
+    zeek_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ZEEK_DIR
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    lines = read_lines(zeek_dir)
+    is_tabs = is_tabs_dir(lines)
+    print(
+        f'Parsing {len(lines)} {"tab separated" if is_tabs else "json"} '
+        f'lines from {zeek_dir} {repetitions} times. '
+        f'orjson is {"" if orjson else "not "}installed.'
+    )
+
+    results = {}
+    for name, func in (('legacy', legacy_parse), ('fast', fast_parse)):
+        results[name] = min(
+            timeit.repeat(
+                lambda: func(lines, is_tabs), number=1, repeat=repetitions
+            )
+        )
+        per_line = results[name] / max(len(lines), 1) * 1e6
+        print(f'{name:>8}: {results[name] * 1000:.2f} ms ({per_line:.2f} us/line)')
+
+    if results['fast']:
+        print(f' speedup: {results["legacy"] / results["fast"]:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -60,9 +60,30 @@ class DBManager(IObservable):
     def subscribe(self, *args, **kwargs):
         return self.rdb.subscribe(*args, **kwargs)
 
+    def subscribe_to_channels(self, *args, **kwargs):
+        return self.rdb.subscribe_to_channels(*args, **kwargs)
+
     def publish_stop(self, *args, **kwargs):
         return self.rdb.publish_stop(*args, **kwargs)
 
+    def start_write_batch(self, *args, **kwargs):
+        return self.rdb.start_write_batch(*args, **kwargs)
+
+    def is_write_batch_active(self, *args, **kwargs):
+        return self.rdb.is_write_batch_active(*args, **kwargs)
+
+    def is_tw_modified_in_write_batch(self, *args, **kwargs):
+        return self.rdb.is_tw_modified_in_write_batch(*args, **kwargs)
+
+    def get_write_batch_len(self, *args, **kwargs):
+        return self.rdb.get_write_batch_len(*args, **kwargs)
+
+    def flush_write_batch(self, *args, **kwargs):
+        return self.rdb.flush_write_batch(*args, **kwargs)
+
+    def stop_write_batch(self, *args, **kwargs):
+        return self.rdb.stop_write_batch(*args, **kwargs)
+
     def get_message(self, *args, **kwargs):
         return self.rdb.get_message(*args, **kwargs)
 
@@ -72,6 +93,9 @@ class DBManager(IObservable):
     def get_ip_info(self, *args, **kwargs):
         return self.rdb.get_ip_info(*args, **kwargs)
 
+    def get_ip_context(self, *args, **kwargs):
+        return self.rdb.get_ip_context(*args, **kwargs)
+
     def set_new_ip(self, *args, **kwargs):
         return self.rdb.set_new_ip(*args, **kwargs)
 
@@ -311,6 +335,9 @@ class DBManager(IObservable):
     def get_whitelist(self, *args, **kwargs):
         return self.rdb.get_whitelist(*args, **kwargs)
 
+    def get_whitelist_version(self, *args, **kwargs):
+        return self.rdb.get_whitelist_version(*args, **kwargs)
+
     def store_dhcp_server(self, *args, **kwargs):
         return self.rdb.store_dhcp_server(*args, **kwargs)
 
@@ -427,6 +454,9 @@ class DBManager(IObservable):
     def give_threat_intelligence(self, *args, **kwargs):
         return self.rdb.give_threat_intelligence(*args, **kwargs)
 
+    def get_ioc_version(self, *args, **kwargs):
+        return self.rdb.get_ioc_version(*args, **kwargs)
+
     def delete_ips_from_IoC_ips(self, *args, **kwargs):
         return self.rdb.delete_ips_from_IoC_ips(*args, **kwargs)
 
@@ -532,6 +562,15 @@ class DBManager(IObservable):
     def get_data_from_profile_tw(self, *args, **kwargs):
         return self.rdb.get_data_from_profile_tw(*args, **kwargs)
 
+    def get_data_of_tw_entry(self, *args, **kwargs):
+        return self.rdb.get_data_of_tw_entry(*args, **kwargs)
+
+    def is_native_tw_storage(self, *args, **kwargs):
+        return self.rdb.is_native_tw_storage(*args, **kwargs)
+
+    def get_tw_data_sizes(self, *args, **kwargs):
+        return self.rdb.get_tw_data_sizes(*args, **kwargs)
+
     def getOutTuplesfromProfileTW(self, *args, **kwargs):
         return self.rdb.getOutTuplesfromProfileTW(*args, **kwargs)
 
@@ -547,6 +586,9 @@ class DBManager(IObservable):
     def get_timewindow(self, *args, **kwargs):
         return self.rdb.get_timewindow(*args, **kwargs)
 
+    def get_last_tw_cache_stats(self, *args, **kwargs):
+        return self.rdb.get_last_tw_cache_stats(*args, **kwargs)
+
     def add_out_http(self, *args, **kwargs):
         return self.rdb.add_out_http(*args, **kwargs)
 
@@ -574,6 +616,9 @@ class DBManager(IObservable):
     def get_all_flows(self, *args, **kwargs):
         return self.sqlite.get_all_flows(*args, **kwargs)
 
+    def get_flows_fields(self, *args, **kwargs):
+        return self.sqlite.get_flows_fields(*args, **kwargs)
+
     def get_all_contacted_ips_in_profileid_twid(self, *args, **kwargs):
         """
         Get all the contacted IPs in a given profile and TW
@@ -697,6 +742,33 @@ class DBManager(IObservable):
     def check_TW_to_close(self, *args, **kwargs):
         return self.rdb.check_TW_to_close(*args, **kwargs)
 
+    def close_modified_tws(self, *args, **kwargs):
+        return self.rdb.close_modified_tws(*args, **kwargs)
+
+    def publish_many(self, *args, **kwargs):
+        return self.rdb.publish_many(*args, **kwargs)
+
+    def get_streams_lag(self, *args, **kwargs):
+        return self.rdb.get_streams_lag(*args, **kwargs)
+
+    def incr_metric(self, *args, **kwargs):
+        return self.rdb.incr_metric(*args, **kwargs)
+
+    def set_metric(self, *args, **kwargs):
+        return self.rdb.set_metric(*args, **kwargs)
+
+    def observe_handler_latency(self, *args, **kwargs):
+        return self.rdb.observe_handler_latency(*args, **kwargs)
+
+    def flush_metrics(self, *args, **kwargs):
+        return self.rdb.flush_metrics(*args, **kwargs)
+
+    def is_collecting_metrics(self, *args, **kwargs):
+        return self.rdb.is_collecting_metrics(*args, **kwargs)
+
+    def get_metrics(self, *args, **kwargs):
+        return self.rdb.get_metrics(*args, **kwargs)
+
     def check_health(self):
         self.rdb.pubsub.check_health()
 
@@ -826,6 +898,12 @@ class DBManager(IObservable):
     def add_altflow(self, *args, **kwargs):
         return self.sqlite.add_altflow(*args, **kwargs)
 
+    def flush_flows(self, *args, **kwargs):
+        return self.sqlite.flush_flows(*args, **kwargs)
+
+    def flush_flows_if_needed(self, *args, **kwargs):
+        return self.sqlite.flush_flows_if_needed(*args, **kwargs)
+
     def insert(self, *args, **kwargs):
         return self.sqlite.insert(*args, **kwargs)
 
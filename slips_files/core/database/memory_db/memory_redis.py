@@ -0,0 +1,523 @@
+import fnmatch
+import os
+import queue
+import threading
+from collections import defaultdict
+from functools import wraps
+from typing import Dict, List, Optional, Set
+
+from redis.exceptions import ConnectionError, DataError
+
+
+def encode(value) -> str:
+    """
+    converts the given value to the str redis would store,
+    the same way redis-py does
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        raise DataError(
+            "Invalid input of type: 'bool'. Convert to a "
+            "bytes, string, int or float first."
+        )
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    raise DataError(
+        f"Invalid input of type: '{type(value).__name__}'. Convert to a "
+        f"bytes, string, int or float first."
+    )
+
+
+def locked(method):
+    """runs the given method of MemoryRedis while holding its lock"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class ZSet(dict):
+    """{member: score} of a sorted set"""
+
+    def sorted_items(self) -> list:
+        # redis sorts the members with the same score lexicographically
+        return sorted(self.items(), key=lambda item: (item[1], item[0]))
+
+
+def slice_indices(length: int, start: int, end: int):
+    """converts redis' inclusive start and end indices to python's"""
+    if start < 0:
+        start = max(length + start, 0)
+    if end < 0:
+        end = length + end
+    return start, end + 1
+
+
+def parse_score_bound(bound):
+    """
+    returns (score, is_exclusive) of the given zrangebyscore bound,
+    e.g. 5, '(5', '-inf' or '+inf'
+    """
+    bound = encode(bound)
+    exclusive = bound.startswith('(')
+    if exclusive:
+        bound = bound[1:]
+    return float(bound), exclusive
+
+
+class MemoryPubSub:
+    """
+    Same API as redis' PubSub for the channels of a MemoryRedis.
+    used by the modules running in the same process as the publishers
+    """
+    def __init__(self, memory_redis, ignore_subscribe_messages=False):
+        self.memory_redis = memory_redis
+        self.msgs = queue.Queue()
+        self.channels: Set[str] = set()
+        # max number of msgs waiting to be read, 0 means no limit. when it's
+        # exceeded the subscription is closed, the same way redis closes the
+        # pub/sub clients that exceed their output buffer limit
+        self.max_pending_msgs = 0
+        self.disconnected = False
+
+    def subscribe(self, *channels, **kwargs):
+        for channel in channels:
+            self.channels.add(channel)
+            self.memory_redis.add_subscriber(channel, self)
+
+    def unsubscribe(self, *channels):
+        for channel in channels or list(self.channels):
+            self.channels.discard(channel)
+            self.memory_redis.remove_subscriber(channel, self)
+
+    def close(self):
+        self.unsubscribe()
+
+    def put(self, channel: str, message: str):
+        if self.max_pending_msgs and self.msgs.qsize() >= self.max_pending_msgs:
+            self.unsubscribe()
+            self.msgs = queue.Queue()
+            self.disconnected = True
+            return
+        self.msgs.put((channel, message))
+
+    def get_message(self, ignore_subscribe_messages=False, timeout=0.0) -> Optional[dict]:
+        if self.disconnected:
+            raise ConnectionError(
+                'the subscription was closed because it had too many '
+                'pending msgs'
+            )
+        try:
+            if timeout and timeout > 0:
+                channel, data = self.msgs.get(timeout=timeout)
+            else:
+                channel, data = self.msgs.get_nowait()
+        except queue.Empty:
+            return None
+        return {
+            'type': 'message',
+            'pattern': None,
+            'channel': channel,
+            'data': data,
+        }
+
+
+class MemoryPipeline:
+    """
+    Queues the cmds of a MemoryRedis and runs them at once on execute(),
+    same as redis' pipelines
+    """
+    def __init__(self, memory_redis):
+        self.memory_redis = memory_redis
+        self.cmds = []
+
+    def __len__(self):
+        return len(self.cmds)
+
+    def __getattr__(self, cmd):
+        method = getattr(self.memory_redis, cmd)
+
+        def queue_cmd(*args, **kwargs):
+            self.cmds.append((method, args, kwargs))
+            return self
+        return queue_cmd
+
+    def execute(self) -> list:
+        cmds, self.cmds = self.cmds, []
+        with self.memory_redis.lock:
+            return [method(*args, **kwargs) for method, args, kwargs in cmds]
+
+    def reset(self):
+        self.cmds = []
+
+
+class MemoryRedis:
+    """
+    Stores the data slips stores in redis in the memory of the slips
+    process, used when database_backend = memory in slips.conf.
+
+    Implements the subset of the redis-py client (decode_responses=True)
+    used by RedisDB with the same args and return values, so the
+    RedisDB/ProfileHandler logic is the same for both backends.
+    the data is only visible to the threads of the process that
+    created it, it's never sent over a socket.
+    """
+    def __init__(self, port: int = 0):
+        # the redis port slips would have used, check config_get()
+        self.port = port
+        self.lock = threading.RLock()
+        # {key: str, dict (hash), set, list or ZSet}
+        self.data = {}
+        # {channel: subscribed MemoryPubSub objs}
+        self.subscribers: Dict[str, list] = defaultdict(list)
+
+    def get_value(self, name, type_, create=False):
+        """returns the value of the given key or None if it doesn't exist"""
+        value = self.data.get(name)
+        if value is None and create:
+            value = self.data[name] = type_()
+        return value
+
+    # ---------------- server ----------------
+
+    def ping(self):
+        return True
+
+    def config_set(self, name, value):
+        return True
+
+    def config_get(self, pattern='*'):
+        if pattern == 'port':
+            return {'port': str(self.port)}
+        return {}
+
+    def client_setname(self, name):
+        return True
+
+    def client_list(self):
+        return []
+
+    def info(self, section=None):
+        return {'process_id': os.getpid()}
+
+    def save(self):
+        # nothing to save, the data is lost when slips stops
+        return True
+
+    @locked
+    def dbsize(self) -> int:
+        return len(self.data)
+
+    @locked
+    def flushdb(self):
+        self.data.clear()
+        return True
+
+    @locked
+    def delete(self, *names) -> int:
+        return sum(self.data.pop(name, None) is not None for name in names)
+
+    @locked
+    def exists(self, *names) -> int:
+        return sum(name in self.data for name in names)
+
+    @locked
+    def keys(self, pattern='*') -> List[str]:
+        return [key for key in self.data if fnmatch.fnmatchcase(key, pattern)]
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return MemoryPipeline(self)
+
+    # ---------------- strings ----------------
+
+    @locked
+    def get(self, name):
+        return self.data.get(name)
+
+    @locked
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False, keepttl=False):
+        if (nx and name in self.data) or (xx and name not in self.data):
+            return None
+        self.data[name] = encode(value)
+        return True
+
+    @locked
+    def incr(self, name, amount=1) -> int:
+        value = int(self.data.get(name, 0)) + amount
+        self.data[name] = str(value)
+        return value
+
+    # ---------------- hashes ----------------
+
+    @locked
+    def hset(self, name, key=None, value=None, mapping=None) -> int:
+        items = {}
+        if key is not None:
+            items[key] = value
+        if mapping:
+            items.update(mapping)
+        if not items:
+            raise DataError("'hset' with no key value pairs")
+
+        hash_ = self.get_value(name, dict, create=True)
+        added = 0
+        for field, val in items.items():
+            field = encode(field)
+            added += field not in hash_
+            hash_[field] = encode(val)
+        return added
+
+    def hmset(self, name, mapping) -> bool:
+        self.hset(name, mapping=mapping)
+        return True
+
+    @locked
+    def hsetnx(self, name, key, value) -> int:
+        hash_ = self.get_value(name, dict, create=True)
+        if key in hash_:
+            return 0
+        hash_[key] = encode(value)
+        return 1
+
+    @locked
+    def hget(self, name, key):
+        hash_ = self.data.get(name)
+        return hash_.get(key) if hash_ else None
+
+    @locked
+    def hmget(self, name, keys, *args) -> list:
+        if isinstance(keys, str):
+            keys = [keys]
+        keys = list(keys) + list(args)
+        hash_ = self.data.get(name) or {}
+        return [hash_.get(key) for key in keys]
+
+    @locked
+    def hgetall(self, name) -> dict:
+        return dict(self.data.get(name) or {})
+
+    @locked
+    def hkeys(self, name) -> list:
+        return list(self.data.get(name) or {})
+
+    @locked
+    def hvals(self, name) -> list:
+        return list((self.data.get(name) or {}).values())
+
+    @locked
+    def hlen(self, name) -> int:
+        return len(self.data.get(name) or {})
+
+    @locked
+    def hexists(self, name, key) -> bool:
+        return key in (self.data.get(name) or {})
+
+    @locked
+    def hdel(self, name, *keys) -> int:
+        hash_ = self.data.get(name)
+        if not hash_:
+            return 0
+        deleted = sum(hash_.pop(key, None) is not None for key in keys)
+        if not hash_:
+            del self.data[name]
+        return deleted
+
+    @locked
+    def hincrby(self, name, key, amount=1) -> int:
+        hash_ = self.get_value(name, dict, create=True)
+        value = int(hash_.get(key, 0)) + int(amount)
+        hash_[key] = str(value)
+        return value
+
+    @locked
+    def hincrbyfloat(self, name, key, amount=1.0) -> float:
+        hash_ = self.get_value(name, dict, create=True)
+        value = float(hash_.get(key, 0)) + float(amount)
+        hash_[key] = repr(value)
+        return value
+
+    # ---------------- sets ----------------
+
+    @locked
+    def sadd(self, name, *values) -> int:
+        set_ = self.get_value(name, set, create=True)
+        before = len(set_)
+        set_.update(encode(value) for value in values)
+        return len(set_) - before
+
+    @locked
+    def srem(self, name, *values) -> int:
+        set_ = self.data.get(name)
+        if not set_:
+            return 0
+        before = len(set_)
+        set_.difference_update(encode(value) for value in values)
+        removed = before - len(set_)
+        if not set_:
+            del self.data[name]
+        return removed
+
+    @locked
+    def sismember(self, name, value) -> bool:
+        return encode(value) in (self.data.get(name) or ())
+
+    @locked
+    def smembers(self, name) -> set:
+        return set(self.data.get(name) or ())
+
+    @locked
+    def scard(self, name) -> int:
+        return len(self.data.get(name) or ())
+
+    # ---------------- sorted sets ----------------
+
+    @locked
+    def zadd(self, name, mapping, nx=False, xx=False, ch=False, incr=False):
+        zset = self.get_value(name, ZSet, create=True)
+        added = 0
+        for member, score in mapping.items():
+            member = encode(member)
+            exists = member in zset
+            if (nx and exists) or (xx and not exists):
+                continue
+            if incr:
+                score = zset.get(member, 0) + float(score)
+                zset[member] = score
+                return score
+            added += not exists
+            zset[member] = float(score)
+        return added
+
+    @locked
+    def zincrby(self, name, amount, value) -> float:
+        zset = self.get_value(name, ZSet, create=True)
+        value = encode(value)
+        score = zset.get(value, 0) + float(amount)
+        zset[value] = score
+        return score
+
+    @locked
+    def zscore(self, name, value) -> Optional[float]:
+        return (self.data.get(name) or {}).get(encode(value))
+
+    @locked
+    def zrem(self, name, *values) -> int:
+        zset = self.data.get(name)
+        if not zset:
+            return 0
+        removed = sum(zset.pop(encode(value), None) is not None for value in values)
+        if not zset:
+            del self.data[name]
+        return removed
+
+    @locked
+    def zcard(self, name) -> int:
+        return len(self.data.get(name) or {})
+
+    @locked
+    def zrank(self, name, value) -> Optional[int]:
+        zset = self.data.get(name)
+        value = encode(value)
+        if not zset or value not in zset:
+            return None
+        return [member for member, _ in zset.sorted_items()].index(value)
+
+    def format_zset_items(self, items, withscores, score_cast_func):
+        if withscores:
+            return [(member, score_cast_func(score)) for member, score in items]
+        return [member for member, _ in items]
+
+    @locked
+    def zrange(self, name, start, end, desc=False, withscores=False,
+               score_cast_func=float) -> list:
+        zset = self.data.get(name)
+        if not zset:
+            return []
+        items = zset.sorted_items()
+        if desc:
+            items.reverse()
+        start, end = slice_indices(len(items), start, end)
+        return self.format_zset_items(
+            items[start:end], withscores, score_cast_func
+        )
+
+    def zrevrange(self, name, start, end, withscores=False,
+                  score_cast_func=float) -> list:
+        return self.zrange(
+            name, start, end, desc=True,
+            withscores=withscores, score_cast_func=score_cast_func
+        )
+
+    @locked
+    def zrangebyscore(self, name, min, max, start=None, num=None,
+                      withscores=False, score_cast_func=float) -> list:
+        zset = self.data.get(name)
+        if not zset:
+            return []
+        min_score, min_exclusive = parse_score_bound(min)
+        max_score, max_exclusive = parse_score_bound(max)
+        items = [
+            (member, score) for member, score in zset.sorted_items()
+            if (score > min_score if min_exclusive else score >= min_score)
+            and (score < max_score if max_exclusive else score <= max_score)
+        ]
+        if start is not None and num is not None:
+            items = items[start:] if num < 0 else items[start:start + num]
+        return self.format_zset_items(items, withscores, score_cast_func)
+
+    # ---------------- lists ----------------
+
+    @locked
+    def rpush(self, name, *values) -> int:
+        list_ = self.get_value(name, list, create=True)
+        list_.extend(encode(value) for value in values)
+        return len(list_)
+
+    @locked
+    def lpush(self, name, *values) -> int:
+        list_ = self.get_value(name, list, create=True)
+        for value in values:
+            list_.insert(0, encode(value))
+        return len(list_)
+
+    @locked
+    def lrange(self, name, start, end) -> list:
+        list_ = self.data.get(name) or []
+        start, end = slice_indices(len(list_), start, end)
+        return list_[start:end]
+
+    @locked
+    def llen(self, name) -> int:
+        return len(self.data.get(name) or [])
+
+    # ---------------- pub/sub ----------------
+
+    def pubsub(self, ignore_subscribe_messages=False, **kwargs):
+        return MemoryPubSub(self, ignore_subscribe_messages)
+
+    @locked
+    def add_subscriber(self, channel: str, pubsub: MemoryPubSub):
+        if pubsub not in self.subscribers[channel]:
+            self.subscribers[channel].append(pubsub)
+
+    @locked
+    def remove_subscriber(self, channel: str, pubsub: MemoryPubSub):
+        if pubsub in self.subscribers[channel]:
+            self.subscribers[channel].remove(pubsub)
+
+    @locked
+    def publish(self, channel, message) -> int:
+        # the bytes are given to the subscribers as is, like the msgpack
+        # msgs read by the redis clients that don't decode the msgs
+        if not isinstance(message, bytes):
+            message = encode(message)
+        subscribers = list(self.subscribers.get(channel, ()))
+        for pubsub in subscribers:
+            pubsub.put(channel, message)
+        return len(subscribers)
@@ -0,0 +1,159 @@
+import json
+import os
+import time
+import uuid
+from dataclasses import asdict, fields
+from typing import Dict, List, Optional, Tuple
+
+try:
+    # parquet files are read column by column, without json decoding
+    # every flow
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+
+# the columns stored for every flow, the rest are the fields of the flow
+ARCHIVE_COLUMNS = ('profileid', 'label')
+
+
+def is_pyarrow_installed() -> bool:
+    return pa is not None
+
+
+def get_archive_dir(output_dir: str) -> str:
+    return os.path.join(output_dir, 'flows.parquet')
+
+
+def get_archived_flow_types(archive_dir: str) -> List[str]:
+    """returns the types of the archived flows, e.g. ['conn', 'dns']"""
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(os.listdir(archive_dir))
+
+
+def read_archived_flows(
+        archive_dir: str,
+        flow_type: str,
+        columns: Optional[List[str]] = None,
+        twids: Optional[List[str]] = None,
+        ) -> 'pa.Table':
+    """
+    returns the archived flows of the given type as an arrow table,
+    use .to_pandas() on it to get a pandas dataframe
+    :param flow_type: the type_ of the flows to read, e.g. 'conn'
+    :param columns: the columns to read, all of them by default
+    :param twids: the timewindows to read the flows of, e.g. ['timewindow1'],
+    all of them by default. only the files of these timewindows are read
+    """
+    dataset = ds.dataset(
+        os.path.join(archive_dir, flow_type),
+        format='parquet',
+        partitioning='hive'
+    )
+    flows_filter = ds.field('twid').isin(twids) if twids else None
+    return dataset.to_table(columns=columns, filter=flows_filter)
+
+
+class FlowArchive:
+    """
+    Writes the flows of the profiler to parquet files partitioned by
+    flow type and timewindow in the output dir, next to flows.sqlite.
+    <output_dir>/flows.parquet/<flow type>/twid=<twid>/part-<writer id>-<n>.parquet
+
+    the flows are queued per flow type and timewindow, and each batch of
+    row_group_size flows is written to a new file, so the archived flows
+    can be read while slips is still running.
+    check read_archived_flows() for reading them
+
+    the columns of each flow type are the fields of its dataclass, the
+    int and float fields are stored as doubles and the rest as strings
+    """
+    # max seconds a queued flow waits before being written
+    flush_interval = 30
+
+    def __init__(self, output_dir: str, row_group_size: int):
+        self.archive_dir = get_archive_dir(output_dir)
+        self.row_group_size = row_group_size
+        # {(flow type, twid): [flow, ...]}
+        self.queued_flows: Dict[Tuple[str, str], List[dict]] = {}
+        # {flow type: arrow schema of the flows of this type}
+        self.schemas = {}
+        self.files_written = 0
+        # each profiler worker has its own archive, and they share the same
+        # pid in embedded_mode, so the files are named after the archive
+        self.writer_id = uuid.uuid4().hex
+        self.last_flush = time.time()
+
+    def add_flow(self, flow, profileid: str, twid: str, label: str):
+        if flow.type_ not in self.schemas:
+            self.schemas[flow.type_] = self.get_schema(flow)
+
+        row = asdict(flow)
+        row.update({'profileid': profileid, 'label': label})
+        key = (flow.type_, twid)
+        queued_flows = self.queued_flows.setdefault(key, [])
+        queued_flows.append(row)
+        if len(queued_flows) >= self.row_group_size:
+            self.write_flows(key)
+        self.flush_if_needed()
+
+    def flush_if_needed(self):
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """writes the queued flows of all flow types and timewindows"""
+        self.last_flush = time.time()
+        for key in list(self.queued_flows):
+            self.write_flows(key)
+
+    def get_schema(self, flow) -> 'pa.Schema':
+        """returns the schema of the flows of the type of the given flow"""
+        schema = [pa.field(column, pa.string()) for column in ARCHIVE_COLUMNS]
+        for field in fields(flow):
+            if field.type in (int, float):
+                column_type = pa.float64()
+            else:
+                column_type = pa.string()
+            schema.append(pa.field(field.name, column_type))
+        return pa.schema(schema)
+
+    def to_float(self, value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    def to_str(self, value):
+        if value is None:
+            return None
+        if isinstance(value, (list, dict)):
+            return json.dumps(value)
+        return str(value)
+
+    def write_flows(self, key: Tuple[str, str]):
+        """writes the queued flows of the given flow type and twid to a new file"""
+        flows = self.queued_flows.pop(key, [])
+        if not flows:
+            return
+
+        flow_type, twid = key
+        schema = self.schemas[flow_type]
+        columns = {}
+        for field in schema:
+            convert = self.to_float if field.type == pa.float64() else self.to_str
+            columns[field.name] = [convert(flow.get(field.name)) for flow in flows]
+        table = pa.Table.from_pydict(columns, schema=schema)
+
+        partition_dir = os.path.join(self.archive_dir, flow_type, f'twid={twid}')
+        os.makedirs(partition_dir, exist_ok=True)
+        filename = f'part-{self.writer_id}-{self.files_written}.parquet'
+        # files starting with a dot are skipped by the readers,
+        # so they never read a partially written file
+        tmp_path = os.path.join(partition_dir, f'.{filename}')
+        pq.write_table(table, tmp_path, row_group_size=len(flows))
+        os.replace(tmp_path, os.path.join(partition_dir, filename))
+        self.files_written += 1
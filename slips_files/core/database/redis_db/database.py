@@ -3,7 +3,14 @@ from slips_files.common.parsers.config_parser import ConfigParser
 from slips_files.core.database.redis_db.ioc_handler import IoCHandler
 from slips_files.core.database.redis_db.alert_handler import AlertHandler
 from slips_files.core.database.redis_db.profile_handler import ProfileHandler
+from slips_files.core.database.redis_db.tw_counters_handler import TWCountersHandler
+from slips_files.core.database.redis_db.streams_handler import StreamsHandler
+from slips_files.core.database.redis_db.metrics_handler import MetricsHandler
+from slips_files.core.database.redis_db.ip_context_handler import IPContextHandler
+from slips_files.core.database.redis_db.raw_pubsub import RawPubSub
 from slips_files.common.abstracts.observer import IObservable
+from slips_files.common.msg_codec import MsgCodec
+from slips_files.core.database.memory_db.memory_redis import MemoryRedis
 
 import os
 import signal
@@ -11,6 +18,7 @@ import redis
 import time
 import json
 import subprocess
+from collections import OrderedDict
 from datetime import datetime
 import ipaddress
 import sys
@@ -19,7 +27,16 @@ import validators
 RUNNING_IN_DOCKER = os.environ.get('IS_IN_A_DOCKER_CONTAINER', False)
 
 
-class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
+class RedisDB(
+        IoCHandler,
+        AlertHandler,
+        ProfileHandler,
+        TWCountersHandler,
+        StreamsHandler,
+        MetricsHandler,
+        IPContextHandler,
+        IObservable
+        ):
     """Main redis db class."""
     # this db should be a singelton per port. meaning no 2 instances should be created for the same port at the same
     # time
@@ -73,6 +90,9 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
         'cpu_profile',
         'memory_profile'
         }
+    # the channels whose msgs are encoded using MsgCodec, they may be binary
+    # (msgpack) so they're read without decoding them, check RawPubSub
+    binary_channels = {'new_flow'}
     # The name is used to print in the outputprocess
     name = 'DB'
     separator = '_'
@@ -98,6 +118,24 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
     max_retries = 150
     # to keep track of connection retries. once it reaches max_retries, slips will terminate
     connection_retry = 0
+    # when the profiler enables write batching, the hot per-flow writes are
+    # queued in this redis pipeline instead of being sent one by one.
+    # check start_write_batch()
+    write_batch = None
+    # {(key, field): value} of the hash fields that are queued in the
+    # write_batch and not yet in redis. reads of these fields are served
+    # from here so the batching is invisible to the profiler
+    write_batch_overlay = {}
+    # set when a TW is marked as modified while batching, the check for tws
+    # to close is done once after the batch is flushed
+    check_tws_after_flush = False
+    # the profileid_twid of the tws whose tw_modified msg is queued in the
+    # write_batch, check is_tw_modified_in_write_batch()
+    write_batch_modified_tws = set()
+    # max amount of profiles to keep the last TW of in memory
+    last_tw_cache_size = 10000
+    # max amount of profiles each process remembers are in the db
+    known_profiles_cache_size = 100000
 
     def __new__(
             cls,
@@ -172,6 +210,58 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
         cls.deletePrevdb = conf.deletePrevdb()
         cls.disabled_detections = conf.disabled_detections()
         cls.width = conf.get_tw_width_as_float()
+        cls.native_tw_storage = conf.tw_storage_layout() == 'native'
+        cls.tw_closing_check_every = conf.tw_closing_check_every()
+        cls.tw_closing_check_interval = conf.tw_closing_check_interval()
+        # min heap of (modification time, profileid_twid) of the tws modified
+        # by this process, used for closing tws without scanning ModifiedTW
+        cls.tws_modification_heap = []
+        # {profileid_twid: last modification time}, used to skip the
+        # outdated entries of the heap
+        cls.tws_last_modification = {}
+        cls.modifications_since_tw_check = 0
+        cls.last_tw_check_time = time.time()
+        # {profileid: (last twid, start, end)} LRU cache of the last TW of
+        # each profile, check get_cached_last_twid()
+        cls.last_tw_cache = OrderedDict()
+        cls.last_tw_cache_hits = 0
+        cls.last_tw_cache_misses = 0
+        # {profileid: None} LRU cache of the profileids this process knows
+        # are in the db, check is_known_profile()
+        cls.known_profiles = OrderedDict()
+        # send the msgs between processes using redis streams instead of
+        # pub/sub, check StreamsHandler
+        cls.use_streams = conf.message_transport() == 'streams'
+        # all the modules run as threads of this process and share this obj,
+        # the msgs are sent using an in-process event bus, check ModuleThread
+        cls.embedded_mode = conf.embedded_mode()
+        # keep the db in the memory of this process instead of redis,
+        # check MemoryRedis. the processes can't see the memory of each
+        # other, so it's only used when all the modules are threads of
+        # this process. slips refuses to start otherwise, check Checker
+        cls.in_memory = (
+            conf.database_backend() == 'memory' and cls.embedded_mode
+        )
+        if cls.in_memory or cls.embedded_mode:
+            # streams aren't supported by MemoryRedis
+            cls.use_streams = False
+        cls.streams_maxlen = conf.streams_maxlen()
+        cls.streams_batch_size = conf.streams_batch_size()
+        # encodes the msgs of the new_flow channel
+        cls.msg_codec = MsgCodec(conf.msg_codec())
+        # the metrics of this process that aren't in redis yet,
+        # check MetricsHandler
+        cls.collect_metrics = conf.collect_metrics()
+        cls.reset_metrics()
+        # {(ioc, ip_state, profileid, twid, dns query): last time it was
+        # sent to the TI module}, check is_ti_request_coalesced()
+        cls.ti_coalescing_window = conf.ti_lookup_coalescing_window()
+        cls.ti_requests_sent = {}
+        # the context of the IPs cached by this process,
+        # check IPContextHandler
+        cls.ip_context_cache_ttl = conf.ip_context_cache_ttl()
+        cls.reset_ip_context_cache()
+        cls.last_metrics_flush = time.time()
 
     @classmethod
     def set_slips_internal_time(cls, timestamp):
@@ -189,6 +279,13 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
         """Flushes and Starts the DB and """
         try:
             cls.connect_to_redis_server()
+            # the client used for publishing and subscribing. in embedded
+            # mode the subscribers are in this process, so the msgs don't
+            # have to go through redis
+            cls.bus = cls.r
+            cls.raw_bus = cls.raw_r
+            if cls.embedded_mode and not cls.in_memory:
+                cls.bus = cls.raw_bus = MemoryRedis(cls.redis_port)
             # Set the memory limits of the output buffer,  For normal clients: no limits
             # for pub-sub 4GB maximum buffer size
             # and 2GB for soft limit
@@ -217,7 +314,9 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
             return False
 
     @staticmethod
-    def start_redis_instance(port: int, db: int) -> redis.StrictRedis:
+    def start_redis_instance(
+            port: int, db: int, decode_responses=True
+            ) -> redis.StrictRedis:
         # set health_check_interval to avoid redis ConnectionReset errors:
         # if the connection is idle for more than 30 seconds,
         # a round trip PING/PONG will be attempted before next redis cmd.
@@ -226,13 +325,15 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
         # retry_on_timeout=True after the command times out, it will be retried once,
         # if the retry is successful, it will return normally; if it fails, an exception will be thrown
 
+        # decode_responses=False is only used to read the msgs of the
+        # binary channels, check RawPubSub
         return redis.StrictRedis(
                 host='localhost',
                 port=port,
                 db=db,
                 charset='utf-8',
                 socket_keepalive=True,
-                decode_responses=True,
+                decode_responses=decode_responses,
                 retry_on_timeout=True,
                 health_check_interval=20,
         )
@@ -242,6 +343,13 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
         """
         Connects to the given port and Sets r and rcache
         """
+        if cls.in_memory:
+            cls.r = MemoryRedis(cls.redis_port)
+            # MemoryRedis gives the published bytes to the subscribers as is
+            cls.raw_r = cls.r
+            cls.rcache = MemoryRedis(6379)
+            return True
+
         if cls.start_server:
             #  starts the redis server using cli. we don't need that when using -k
             os.system(
@@ -250,6 +358,10 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
         try:
             # db 0 changes everytime we run slips
             cls.r = cls.start_redis_instance(cls.redis_port, 0)
+            # reads the msgs of the binary channels without decoding them
+            cls.raw_r = cls.start_redis_instance(
+                cls.redis_port, 0, decode_responses=False
+            )
 
             # port 6379 db 0 is cache, delete it using -cc flag
             cls.rcache = cls.start_redis_instance(6379, 1)
@@ -303,28 +415,169 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
 
     def publish(self, channel, data):
         """Publish something"""
-        self.r.publish(channel, data)
+        # keep the msgs in order with the writes of the same flow,
+        # they're sent when the batch is flushed
+        client = self.bus if self.write_batch is None else self.write_batch
+        self.incr_metric(f'published:{channel}')
+        if self.use_streams:
+            self.add_to_stream(client, channel, data)
+            return
+        client.publish(channel, data)
+
+    def publish_many(self, channel, msgs: list):
+        """Publishes all the given msgs to the given channel in one round trip"""
+        pipe = self.write_batch
+        if pipe is None:
+            pipe = self.bus.pipeline(transaction=False)
+
+        self.incr_metric(f'published:{channel}', len(msgs))
+        for data in msgs:
+            if self.use_streams:
+                self.add_to_stream(pipe, channel, data)
+            else:
+                pipe.publish(channel, data)
+
+        if self.write_batch is None:
+            pipe.execute()
+
+    def start_write_batch(self):
+        """
+        Starts queueing the per-flow profile writes and publishes in one
+        redis pipeline (MULTI/EXEC) instead of doing a round trip per write.
+        the batch is sent to redis using flush_write_batch()
+        this is only used by the profiler process.
+        """
+        if self.write_batch is not None:
+            return
+        self.write_batch = self.r.pipeline(transaction=True)
+        self.write_batch_overlay = {}
+        self.write_batch_modified_tws = set()
+
+    def is_write_batch_active(self) -> bool:
+        return self.write_batch is not None
 
-    def subscribe(self, channel: str, ignore_subscribe_messages=True):
-        """Subscribe to channel"""
+    def is_tw_modified_in_write_batch(self, profileid: str, twid: str) -> bool:
+        """
+        returns True if the tw_modified msg of the given tw is queued in the
+        write batch, meaning a flow of the batch was added to this tw
+        """
+        return f'{profileid}{self.separator}{twid}' in self.write_batch_modified_tws
+
+    def get_write_batch_len(self) -> int:
+        """returns the number of redis cmds waiting in the batch"""
+        return len(self.write_batch) if self.write_batch is not None else 0
+
+    def flush_write_batch(self):
+        """
+        Sends all the queued writes to redis in one round trip.
+        the batch stays active after flushing
+        """
+        if self.write_batch is None:
+            return
+
+        if len(self.write_batch):
+            self.write_batch.execute()
+        self.write_batch_overlay = {}
+        self.write_batch_modified_tws = set()
+
+        if self.check_tws_after_flush:
+            self.check_tws_after_flush = False
+            self.close_modified_tws()
+            # send the tw_closed msgs queued while closing
+            if len(self.write_batch):
+                self.write_batch.execute()
+
+    def stop_write_batch(self):
+        """flushes the remaining writes and goes back to writing directly"""
+        self.flush_write_batch()
+        self.write_batch = None
+
+    def hset_batched(self, key: str, field: str, value: str):
+        """
+        hset that is queued in the write batch if one is active
+        """
+        if self.write_batch is None:
+            self.r.hset(key, field, value)
+            return
+        self.write_batch.hset(key, field, value)
+        self.write_batch_overlay[(key, field)] = value
+
+    def hget_batched(self, key: str, field: str):
+        """
+        hget that sees the values queued in the write batch and
+        not yet flushed to redis
+        """
+        try:
+            return self.write_batch_overlay[(key, field)]
+        except KeyError:
+            return self.r.hget(key, field)
+
+    def subscribe(
+            self,
+            channel: str,
+            ignore_subscribe_messages=True,
+            subscriber: str = None
+            ):
+        """
+        Subscribe to channel
+        :param subscriber: the name of the subscribing module, used as the
+        consumer group of the channel's stream when using redis streams
+        """
         # For when a TW is modified
         if channel not in self.supported_channels:
             return False
 
-        self.pubsub = self.r.pubsub()
+        if self.use_streams:
+            return self.subscribe_to_streams([channel], subscriber=subscriber)
+
+        self.pubsub = self.get_pubsub([channel])
         self.pubsub.subscribe(
             channel,
             ignore_subscribe_messages=ignore_subscribe_messages
             )
         return self.pubsub
 
+    def subscribe_to_channels(self, channels: list, subscriber: str = None):
+        """
+        Subscribes to all the given channels using 1 connection.
+        the returned obj receives the msgs of all of them, the channel
+        of each msg is in msg['channel']
+        :param subscriber: the name of the subscribing module, used as the
+        consumer group of the channels' streams when using redis streams
+        """
+        channels = [
+            channel for channel in channels
+            if channel in self.supported_channels
+        ]
+        if not channels:
+            return False
+
+        if self.use_streams:
+            return self.subscribe_to_streams(channels, subscriber=subscriber)
+
+        pubsub = self.get_pubsub(channels, ignore_subscribe_messages=True)
+        pubsub.subscribe(*channels)
+        return pubsub
+
+    def get_pubsub(self, channels: list, **kwargs):
+        """
+        returns a PubSub obj of the bus to subscribe to the given channels.
+        the binary channels are read using a client that doesn't decode
+        their msgs
+        """
+        if self.binary_channels.intersection(channels):
+            return RawPubSub(
+                self.raw_bus.pubsub(**kwargs), self.binary_channels
+            )
+        return self.bus.pubsub(**kwargs)
+
     def publish_stop(self):
         """
         Publish stop command to terminate slips
         to shutdown slips gracefully, this function should only be used by slips.py
         """
         self.print('Sending the stop signal to all listeners', 0, 3)
-        self.r.publish('control_channel', 'stop_slips')
+        self.publish('control_channel', 'stop_slips')
 
     def get_message(self, channel, timeout=0.0000001):
         """
@@ -571,7 +824,7 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
         is_new_info = False
         for info_type, info_val in to_store.items():
             if (
-                    info_type not in cached_ip_info
+                    cached_ip_info.get(info_type) != info_val
                     and not is_new_info
             ):
                 is_new_info = True
@@ -580,7 +833,8 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
 
         self.rcache.hset('IPsInfo', ip, json.dumps(cached_ip_info))
         if is_new_info:
-            self.r.publish('ip_info_change', ip)
+            # the processes caching the context of this ip drop it
+            self.publish_ip_context_change('ip_info_change', ip)
 
     def get_redis_pid(self):
         """returns the pid of the current redis server"""
@@ -654,7 +908,7 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
         """
         :param hrs: float, how many hours to look back for resolutions
         """
-        ip_info = self.get_dns_resolution(ip)
+        ip_info = self.get_ip_context(ip)['dns_resolution']
         if ip_info == {}:
             return False
 
@@ -675,6 +929,7 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
 
     def delete_dns_resolution(self , ip):
         self.r.hdel("DNSresolution" , ip)
+        self.publish_ip_context_change('dns_info_change', ip)
 
     def should_store_resolution(self, query: str, answers: list, qtype_name: str):
         # don't store queries ending with arpa as dns resolutions, they're reverse dns
@@ -769,6 +1024,9 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
             # we store ALL dns resolutions seen since starting slips
             # store with the IP as the key
             self.r.hset('DNSresolution', answer, ip_info)
+            # the processes caching the context of this ip drop it,
+            # check IPContextHandler
+            self.publish_ip_context_change('dns_info_change', answer)
             # store with the domain as the key:
             self.r.hset('ResolvedDomains', domains[0], answer)
             # these ips will be associated with the query in our db
@@ -1199,6 +1457,7 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
         """
         # info will be stored in OrgInfo key {'facebook_asn': .., 'twitter_domains': ...}
         self.rcache.hset('OrgInfo', f'{org}_{info_type}', org_info)
+        self.bump_whitelist_version()
 
     def get_org_info(self, org, info_type) -> str:
         """
@@ -1229,6 +1488,17 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
         :param whitelist_dict: the dict of IPs, domains or orgs to store
         """
         self.r.hset('whitelist', type_, json.dumps(whitelist_dict))
+        self.bump_whitelist_version()
+
+    def bump_whitelist_version(self):
+        """
+        the modules keep a compiled copy of the whitelist in memory,
+        changing the version tells them to compile it again
+        """
+        self.r.incr('whitelist_version')
+
+    def get_whitelist_version(self) -> int:
+        return int(self.r.get('whitelist_version') or 0)
 
     def get_all_whitelist(self):
         """Return dict of 3 keys: IPs, domains, organizations or mac"""
@@ -1401,3 +1671,9 @@ class RedisDB(IoCHandler, AlertHandler, ProfileHandler, IObservable):
 
     def get_stdfile(self, file_type):
         return self.r.get(file_type)
+
+
+# the slips processes are forked from the main process after the db is
+# initialized, registered once here and not every time the db is initialized
+os.register_at_fork(after_in_child=RedisDB.reset_metrics)
+os.register_at_fork(after_in_child=RedisDB.reset_ip_context_cache)
@@ -1,5 +1,6 @@
 import json
 import ast
+import time
 
 class IoCHandler():
     """
@@ -7,6 +8,42 @@ class IoCHandler():
     Contains all the logic related to setting and retrieving evidence and alerts in the db
     """
     name = 'DB'
+    # max number of lookups remembered for coalescing the TI requests
+    max_ti_requests_sent = 100000
+
+    def bump_ioc_version(self):
+        """
+        called whenever the IoCs change, so the processes caching
+        them know their cache is outdated
+        """
+        self.rcache.incr('IoC_version')
+
+    def get_ioc_version(self) -> int:
+        return int(self.rcache.get('IoC_version') or 0)
+
+    def is_ti_request_coalesced(self, request: tuple) -> bool:
+        """
+        returns True if the same lookup was sent to the TI module less
+        than ti_coalescing_window seconds ago, so it doesn't have to be
+        sent again
+        """
+        if not self.ti_coalescing_window:
+            return False
+
+        now = time.time()
+        last_sent = self.ti_requests_sent.get(request)
+        if last_sent is not None and now - last_sent < self.ti_coalescing_window:
+            return True
+
+        if len(self.ti_requests_sent) >= self.max_ti_requests_sent:
+            # forget the lookups that are out of the window
+            self.ti_requests_sent = {
+                req: sent_at
+                for req, sent_at in self.ti_requests_sent.items()
+                if now - sent_at < self.ti_coalescing_window
+            }
+        self.ti_requests_sent[request] = now
+        return False
 
 
     def set_loaded_ti_files(self, number_of_loaded_files: int):
@@ -38,9 +75,16 @@ class IoCHandler():
             # sometimes we want to send teh dns query/answer to check it for blacklisted ips/domains
             data_to_send.update(extra_info)
 
-        self.publish(
-            'give_threat_intelligence', json.dumps(data_to_send)
+        # the same ioc seen by the same profile in the same tw
+        # would only give the same evidence again
+        request = (
+            str(lookup), ip_state, str(profileid), str(twid),
+            data_to_send.get('dns_query')
         )
+        if not self.is_ti_request_coalesced(request):
+            self.publish(
+                'give_threat_intelligence', json.dumps(data_to_send)
+            )
 
         return data_to_send
 
@@ -49,24 +93,32 @@ class IoCHandler():
         Delete old IPs from IoC
         """
         self.rcache.hdel('IoC_ips', *ips)
+        self.bump_ioc_version()
 
     def delete_domains_from_IoC_domains(self, domains):
         """
         Delete old domains from IoC
         """
         self.rcache.hdel('IoC_domains', *domains)
+        self.bump_ioc_version()
 
-    def add_ips_to_IoC(self, ips_and_description: dict) -> None:
+    def add_ips_to_IoC(
+            self, ips_and_description: dict, bump_version=True
+            ) -> None:
         """
         Store a group of IPs in the db as they were obtained from an IoC source
         :param ips_and_description: is {ip: json.dumps{'source':..,
                                                         'tags':..,
                                                         'threat_level':... ,
                                                         'description':...}}
-
+        :param bump_version: False when the processes caching the IoCs
+        already know about these IPs, e.g. the online hits of the TI module,
+        so they don't drop their whole cache because of them
         """
         if ips_and_description:
             self.rcache.hmset('IoC_ips', ips_and_description)
+            if bump_version:
+                self.bump_ioc_version()
 
     def add_domains_to_IoC(self, domains_and_description: dict) -> None:
         """
@@ -77,6 +129,7 @@ class IoCHandler():
         """
         if domains_and_description:
             self.rcache.hmset('IoC_domains', domains_and_description)
+            self.bump_ioc_version()
 
     def add_ip_range_to_IoC(self, malicious_ip_ranges: dict) -> None:
         """
@@ -86,6 +139,7 @@ class IoCHandler():
         """
         if malicious_ip_ranges:
             self.rcache.hmset('IoC_ip_ranges', malicious_ip_ranges)
+            self.bump_ioc_version()
 
     def add_asn_to_IoC(self, blacklisted_ASNs: dict):
         """
@@ -95,6 +149,7 @@ class IoCHandler():
         """
         if blacklisted_ASNs:
             self.rcache.hmset('IoC_ASNs', blacklisted_ASNs)
+            self.bump_ioc_version()
 
     def is_blacklisted_ASN(self, ASN) -> bool:
         return self.rcache.hget('IoC_ASNs', ASN)
@@ -243,17 +298,23 @@ class IoCHandler():
         description: description of the subdomain if found
         bool: True if we found a match for exactly the given domain False if we matched a subdomain
         """
-        domain_description = self.rcache.hget('IoC_domains', domain)
-        if domain_description is None:
-            # try to match subdomain
-            ioc_domains = self.rcache.hgetall('IoC_domains')
-            for malicious_domain, description in ioc_domains.items():
-                #  if the we contacted images.google.com and we have google.com in our blacklists, we find a match
-                if malicious_domain in domain:
-                    return description, True
-            return False, False
-        else:
-            return domain_description, False
+        # the given domain followed by its parent domains, e.g.
+        # images.google.com, google.com, com
+        labels = domain.split('.')
+        domains = ['.'.join(labels[i:]) for i in range(len(labels))]
+        # the IoC_domains hash is the index of the blacklisted domains,
+        # so matching a subdomain costs 1 lookup per label instead of
+        # getting and checking all the blacklisted domains
+        descriptions = self.rcache.hmget('IoC_domains', domains)
+        if descriptions[0] is not None:
+            return descriptions[0], False
+
+        # if we contacted images.google.com and we have google.com in our
+        # blacklists, we find a match. the most specific one is returned
+        for description in descriptions[1:]:
+            if description is not None:
+                return description, True
+        return False, False
 
     def delete_feed(self, url: str):
         """
@@ -276,6 +337,7 @@ class IoCHandler():
             if feed_to_delete in ip_description['source']:
                 # this entry has the given feed as source, delete it
                 self.rcache.hdel('IoC_ips', ip)
+        self.bump_ioc_version()
 
     def is_profile_malicious(self, profileid: str) -> str:
         return self.r.hget(profileid, 'labeled_as_malicious') if profileid else False
@@ -448,7 +510,7 @@ class IoCHandler():
             domain_data = json.dumps(domain_data)
             self.rcache.hset('DomainsInfo', domain, domain_data)
             # Publish the changes
-            self.r.publish('dns_info_change', domain)
+            self.publish_ip_context_change('dns_info_change', domain)
 
     def setInfoForURLs(self, url: str, urldata: dict):
         """
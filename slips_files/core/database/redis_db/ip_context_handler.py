@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+
+class IPContextHandler:
+    """
+    Helper class for the Redis class in database.py
+    Contains the logic of caching the context of the IPs, meaning their
+    info in IPsInfo (SNI, rDNS, ASN, etc.) and their DNS resolution, in the
+    memory of each process.
+    the whitelist, the evidence process and flowalerts ask for the context
+    of the same IPs with every flow, so the hot IPs are read from redis and
+    json decoded once instead of once per lookup.
+
+    the cached context of an IP is dropped when its info or its DNS
+    resolution change (the ip_info_change and dns_info_change channels),
+    and after ip_context_cache_ttl seconds at most.
+    the changes are always published using redis' pub/sub, check
+    publish_ip_context_change(). they're never sent in redis streams, the
+    in-process bus or the write batch of the profiler, so no change is
+    delayed or missed by the subscription of each process
+    """
+    name = 'DB'
+    # max number of IPs each process caches the context of
+    max_cached_ip_contexts = 10000
+    # max seconds between the checks for the IPs whose context changed
+    ip_context_invalidation_interval = 0.1
+    # max number of changes read in each check. if more changes are
+    # pending, the whole cache is dropped instead of reading all of them
+    max_pending_ip_context_changes = 10000
+    # the modules share the cache when they run as threads (embedded_mode)
+    ip_context_lock = threading.RLock()
+
+    @classmethod
+    def reset_ip_context_cache(cls):
+        """
+        the slips processes are forked from the main process, each of them
+        should start with an empty cache and its own subscription
+        """
+        # {ip: (time it was cached, context)}
+        cls.ip_contexts = OrderedDict()
+        # subscribed to the changes when the first context is cached
+        cls.ip_context_changes = None
+        cls.last_ip_context_invalidation = 0
+
+    def publish_ip_context_change(self, channel: str, key: str):
+        """
+        :param channel: ip_info_change or dns_info_change
+        :param key: the IP or the domain whose info changed
+        """
+        self.r.publish(channel, key)
+
+    @classmethod
+    def drop_ip_context_cache(cls):
+        """
+        drops the cached contexts and the changes pending in the
+        subscription. nothing is cached before subscribing again,
+        so no change is missed
+        """
+        cls.ip_contexts.clear()
+        if cls.ip_context_changes is not None:
+            try:
+                cls.ip_context_changes.close()
+            except redis.exceptions.ConnectionError:
+                pass
+        cls.ip_context_changes = None
+
+    @classmethod
+    def invalidate_changed_ip_contexts(cls):
+        """drops the cached context of the IPs whose info changed"""
+        now = time.time()
+        since_last_check = now - cls.last_ip_context_invalidation
+        if since_last_check < cls.ip_context_invalidation_interval:
+            return
+        cls.last_ip_context_invalidation = now
+
+        if since_last_check > cls.ip_context_cache_ttl:
+            # every cached context is expired, no need to read the changes
+            # that were published since the last check
+            cls.drop_ip_context_cache()
+
+        if cls.ip_context_changes is None:
+            # the subscribe msgs aren't ignored, get_message() returns None
+            # for the ignored msgs and that would stop the loop below
+            cls.ip_context_changes = cls.r.pubsub()
+            # redis closes the pub/sub clients that exceed its output buffer
+            # limit, MemoryRedis does the same using this limit
+            if hasattr(cls.ip_context_changes, 'max_pending_msgs'):
+                cls.ip_context_changes.max_pending_msgs = (
+                    cls.max_pending_ip_context_changes
+                )
+            cls.ip_context_changes.subscribe(
+                'ip_info_change', 'dns_info_change'
+            )
+            # nothing was cached before subscribing
+            return
+
+        try:
+            for _ in range(cls.max_pending_ip_context_changes):
+                msg = cls.ip_context_changes.get_message(timeout=0)
+                if msg is None:
+                    return
+                if msg['type'] == 'message':
+                    cls.ip_contexts.pop(msg['data'], None)
+        except redis.exceptions.ConnectionError:
+            # redis drops the subscribers whose pending msgs exceed its
+            # pubsub output buffer limit
+            cls.drop_ip_context_cache()
+            return
+        # too many pending changes
+        cls.drop_ip_context_cache()
+
+    def get_ip_context(self, ip: str) -> dict:
+        """
+        returns {'ip_info': the info of the ip in IPsInfo or {},
+                 'dns_resolution': the DNS resolution of the ip or {},
+                 'sni': the first SNI of the ip or None,
+                 'domains': the domains that resolved to this ip}
+        the returned dicts are shared by all the callers in this process,
+        don't modify them
+        """
+        if not self.ip_context_cache_ttl:
+            return self.read_ip_context(ip)
+
+        with self.ip_context_lock:
+            self.invalidate_changed_ip_contexts()
+            if cached := self.ip_contexts.get(ip):
+                cached_at, context = cached
+                if time.time() - cached_at < self.ip_context_cache_ttl:
+                    self.ip_contexts.move_to_end(ip)
+                    return context
+
+            # read after checking for changes, a change published while
+            # reading drops this context the next time
+            context = self.read_ip_context(ip)
+            self.ip_contexts[ip] = (time.time(), context)
+            self.ip_contexts.move_to_end(ip)
+            if len(self.ip_contexts) > self.max_cached_ip_contexts:
+                self.ip_contexts.popitem(last=False)
+            return context
+
+    def read_ip_context(self, ip: str) -> dict:
+        ip_info = self.get_ip_info(ip) or {}
+        dns_resolution = self.get_dns_resolution(ip)
+
+        sni = None
+        try:
+            sni = ip_info['SNI']
+            if isinstance(sni, list):
+                # a list of {'server_name': .., 'dport': ..}
+                sni = sni[0]
+            if isinstance(sni, dict):
+                sni = sni.get('server_name')
+        except (KeyError, IndexError):
+            pass
+
+        return {
+            'ip_info': ip_info,
+            'dns_resolution': dns_resolution,
+            'sni': sni or None,
+            'domains': dns_resolution.get('domains', []),
+        }
@@ -0,0 +1,149 @@
+import threading
+import time
+from typing import Dict
+
+# upper bounds in milliseconds of the buckets of the handler latency histograms
+LATENCY_BUCKETS_MS = (1, 10, 100, 1000, 10000)
+
+
+def format_metrics(metrics: Dict[str, str]) -> str:
+    """
+    returns the given fields of the metrics hash as human readable text.
+    used by --metrics
+    """
+    published, consumed, latency_sum, histograms, gauges = {}, {}, {}, {}, {}
+    for field, value in sorted(metrics.items()):
+        kind, _, name = field.partition(':')
+        if kind == 'published':
+            published[name] = int(value)
+        elif kind == 'consumed':
+            consumed[name] = int(value)
+        elif kind == 'latency_sum':
+            latency_sum[name] = float(value)
+        elif kind == 'latency':
+            name, _, bucket = name.rpartition(':')
+            histograms.setdefault(name, {})[bucket] = int(value)
+        elif kind == 'gauge':
+            gauges[name] = value
+
+    lines = ['Published msgs per channel:']
+    lines.extend(
+        f'  {channel}: {count}'
+        for channel, count in sorted(published.items(), key=lambda x: -x[1])
+    )
+
+    lines.append('Consumed msgs and handler latency per module and channel:')
+    for name, count in sorted(consumed.items(), key=lambda x: -x[1]):
+        module, _, channel = name.partition(':')
+        avg = latency_sum.get(name, 0) / count if count else 0
+        buckets = ' '.join(
+            f'{bucket}:{hits}'
+            for bucket, hits in sorted(
+                histograms.get(name, {}).items(),
+                # le_<ms>ms
+                key=lambda x: float(x[0][3:-2])
+            )
+        )
+        lines.append(
+            f'  {module} <- {channel}: {count} msgs, '
+            f'avg {avg:.2f}ms [{buckets}]'
+        )
+
+    lines.append('Gauges:')
+    lines.extend(f'  {name}: {value}' for name, value in gauges.items())
+    return '\n'.join(lines)
+
+
+class MetricsHandler:
+    """
+    Helper class for the Redis class in database.py
+    Contains the logic of counting the msgs published per channel, consumed
+    per module, the time the modules take to handle them and the depth of
+    the profiler queue.
+
+    the counters are kept in the memory of each process and added to the
+    'metrics' hash in redis every metrics_flush_interval seconds,
+    check format_metrics() for the fields of this hash
+    """
+    name = 'DB'
+    metrics_key = 'metrics'
+    # max seconds the metrics of a process stay in its memory
+    metrics_flush_interval = 5
+    # the modules share the counters when they run as threads (embedded_mode)
+    metrics_lock = threading.Lock()
+
+    def incr_metric(self, field: str, amount=1):
+        if not self.collect_metrics:
+            return
+        with self.metrics_lock:
+            self.metrics_counters[field] = (
+                self.metrics_counters.get(field, 0) + amount
+            )
+        self.flush_metrics_if_needed()
+
+    def set_metric(self, field: str, value):
+        """sets the value of a gauge, e.g. the size of a queue"""
+        if not self.collect_metrics:
+            return
+        self.metrics_gauges[f'gauge:{field}'] = value
+        self.flush_metrics_if_needed()
+
+    def observe_handler_latency(self, module: str, channel: str, seconds: float):
+        """
+        adds the time the given module took to handle a msg of the given
+        channel to its latency histogram
+        """
+        if not self.collect_metrics:
+            return
+        ms = seconds * 1000
+        for bucket in LATENCY_BUCKETS_MS:
+            if ms <= bucket:
+                bucket = f'le_{bucket}ms'
+                break
+        else:
+            bucket = 'le_infms'
+
+        name = f'{module}:{channel}'
+        self.incr_metric(f'latency:{name}:{bucket}')
+        self.incr_metric(f'latency_sum:{name}', ms)
+
+    def flush_metrics_if_needed(self):
+        if time.time() - self.last_metrics_flush >= self.metrics_flush_interval:
+            self.flush_metrics()
+
+    def flush_metrics(self):
+        """adds the metrics in the memory of this process to redis"""
+        self.last_metrics_flush = time.time()
+        with self.metrics_lock:
+            counters = self.metrics_counters.copy()
+            gauges = self.metrics_gauges.copy()
+            self.metrics_counters.clear()
+            self.metrics_gauges.clear()
+        if not (counters or gauges):
+            return
+
+        pipe = self.r.pipeline(transaction=False)
+        for field, amount in counters.items():
+            if isinstance(amount, float):
+                pipe.hincrbyfloat(self.metrics_key, field, amount)
+            else:
+                pipe.hincrby(self.metrics_key, field, amount)
+        if gauges:
+            pipe.hset(self.metrics_key, mapping=gauges)
+        pipe.execute()
+
+    @classmethod
+    def reset_metrics(cls):
+        """
+        the slips processes are forked from the main process, they shouldn't
+        add the metrics the main process didn't flush yet to redis again
+        """
+        cls.metrics_counters = {}
+        cls.metrics_gauges = {}
+        cls.metrics_lock = threading.Lock()
+
+    def is_collecting_metrics(self) -> bool:
+        return self.collect_metrics
+
+    def get_metrics(self) -> Dict[str, str]:
+        return self.r.hgetall(self.metrics_key)
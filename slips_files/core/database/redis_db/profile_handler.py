@@ -1,4 +1,5 @@
 from dataclasses import asdict
+import heapq
 import redis
 import time
 import json
@@ -51,11 +52,11 @@ class ProfileHandler(IObservable):
 
     def getOutTuplesfromProfileTW(self, profileid, twid):
         """Get the out tuples"""
-        return self.r.hget(profileid + self.separator + twid, 'OutTuples')
+        return self.get_tuples_of_profile_tw(profileid, twid, 'OutTuples')
 
     def getInTuplesfromProfileTW(self, profileid, twid):
         """Get the in tuples"""
-        return self.r.hget(profileid + self.separator + twid, 'InTuples')
+        return self.get_tuples_of_profile_tw(profileid, twid, 'InTuples')
     def get_dhcp_flows(self, profileid, twid) -> list:
         """
         returns a dict of dhcp flows that happened in this profileid and twid
@@ -88,6 +89,8 @@ class ProfileHandler(IObservable):
         """
         try:
             # First check if we are not in the last TW. Since this will be the majority of cases
+            if twid := self.get_cached_last_twid(profileid, flowtime):
+                return twid
             try:
                 [(lasttwid, lasttw_start_time)] = self.get_last_twid_of_profile(profileid)
                 lasttw_start_time = float(lasttw_start_time)
@@ -109,6 +112,7 @@ class ProfileHandler(IObservable):
                         0,
                     )
                     twid = lasttwid
+                    self.cache_last_twid(profileid, twid, lasttw_start_time)
                 elif lasttw_end_time <= flowtime:
                     # The flow was not in the last TW, its NEWER than it
                     self.print(
@@ -130,6 +134,8 @@ class ProfileHandler(IObservable):
                         twid = self.addNewTW(profileid, new_start)
                         self.print(f'Creating the TW id {twid}. Start: {new_start}.', 3, 0)
                         temp_end = new_start + self.width
+                    # the flow is in the last TW we created
+                    self.cache_last_twid(profileid, twid, new_start)
 
                 else:
                     # The flow was not in the last TW, its OLDER that it
@@ -184,12 +190,54 @@ class ProfileHandler(IObservable):
 
                 # Add this TW, of this profile, to the DB
                 twid = self.addNewTW(profileid, startoftw)
+                self.cache_last_twid(profileid, twid, startoftw)
                 # self.print("First TW ({}) created for profile {}.".format(twid, profileid), 0, 1)
             return twid
         except Exception as e:
             self.print('Error in get_timewindow().', 0, 1)
             self.print(e, 0, 1)
 
+    def get_cached_last_twid(self, profileid, flowtime):
+        """
+        Returns the last TW of the given profile from the in-process cache
+        if the given flowtime falls in it, otherwise returns None.
+        TWs never overlap, so a cached TW is still the right one for the
+        flows inside it even if another process created newer TWs.
+        """
+        try:
+            twid, start, end = self.last_tw_cache[profileid]
+            flowtime = float(flowtime)
+        except (KeyError, ValueError, TypeError):
+            self.last_tw_cache_misses += 1
+            return None
+
+        if start <= flowtime < end:
+            self.last_tw_cache.move_to_end(profileid)
+            self.last_tw_cache_hits += 1
+            return twid
+
+        self.last_tw_cache_misses += 1
+        return None
+
+    def cache_last_twid(self, profileid, twid, start):
+        """caches the last TW of the given profile, evicting the least recently used one"""
+        start = float(start)
+        self.last_tw_cache[profileid] = (twid, start, start + self.width)
+        self.last_tw_cache.move_to_end(profileid)
+        if len(self.last_tw_cache) > self.last_tw_cache_size:
+            self.last_tw_cache.popitem(last=False)
+
+    def invalidate_cached_last_twid(self, profileid):
+        self.last_tw_cache.pop(profileid, None)
+
+    def get_last_tw_cache_stats(self) -> Dict[str, int]:
+        """returns the hits and misses of the last TW cache of this process"""
+        return {
+            'hits': self.last_tw_cache_hits,
+            'misses': self.last_tw_cache_misses,
+            'size': len(self.last_tw_cache),
+        }
+
     def add_out_http(
         self,
         profileid,
@@ -394,6 +442,23 @@ class ProfileHandler(IObservable):
         # Get the state. Established, NotEstablished
         summaryState = self.getFinalStateFromFlags(state, pkts)
 
+        if self.native_tw_storage:
+            self.incr_port_counters(
+                profileid,
+                twid,
+                f'{port_type}Ports{role}{proto}{summaryState}',
+                port,
+                ip_key,
+                ip,
+                pkts,
+                int(spkts or 0),
+                totbytes,
+                starttime,
+                uid
+            )
+            self.markProfileTWAsModified(profileid, twid, starttime)
+            return
+
         old_profileid_twid_data = self.get_data_from_profile_tw(
             profileid,
             twid,
@@ -443,7 +508,7 @@ class ProfileHandler(IObservable):
         data = json.dumps(old_profileid_twid_data)
         hash_key = f'{profileid}{self.separator}{twid}'
         key_name = f'{port_type}Ports{role}{proto}{summaryState}'
-        self.r.hset(hash_key, key_name, str(data))
+        self.hset_batched(hash_key, key_name, str(data))
         self.markProfileTWAsModified(profileid, twid, starttime)
     def getFinalStateFromFlags(self, state, pkts):
         """
@@ -609,7 +674,16 @@ class ProfileHandler(IObservable):
             # Not Establihed]
             # Example: key_name = 'SrcPortClientTCPEstablished'
             key = direction + type_data + role + protocol.upper() + state
-            data = self.r.hget(f'{profileid}{self.separator}{twid}', key)
+            if self.native_tw_storage:
+                return self.get_native_tw_data(
+                    profileid,
+                    twid,
+                    key,
+                    type_data,
+                    self.get_ip_key_of_role(role)
+                )
+
+            data = self.hget_batched(f'{profileid}{self.separator}{twid}', key)
 
             if data:
                 return json.loads(data)
@@ -627,6 +701,106 @@ class ProfileHandler(IObservable):
             ,0,1)
             self.print(traceback.print_exc(), 0, 1)
 
+    def is_native_tw_storage(self) -> bool:
+        """
+        returns True if the data of the tws is stored using the native
+        layout, check TWCountersHandler
+        """
+        return self.native_tw_storage
+
+    def get_ip_key_of_role(self, role: str) -> str:
+        """
+        If we are the Client, we store the dstips of each port
+        If we are the Server, we store the srcips of each port
+        """
+        return 'srcips' if role == 'Server' else 'dstips'
+
+    def get_data_of_tw_entry(
+        self,
+        profileid: str,
+        twid: str,
+        direction: str,
+        state: str,
+        protocol: str,
+        role: str,
+        type_data: str,
+        entry: str,
+    ) -> dict:
+        """
+        Same as get_data_from_profile_tw() but returns the data of only
+        one port or ip of the given key.
+        :param entry: the port when type_data is 'Ports' or the ip
+        when type_data is 'IPs'
+        """
+        if not self.native_tw_storage:
+            data = self.get_data_from_profile_tw(
+                profileid, twid, direction, state, protocol, role, type_data
+            )
+            return data.get(str(entry), {}) if data else {}
+
+        key = direction + type_data + role + protocol.upper() + state
+        data = self.get_native_tw_data(
+            profileid,
+            twid,
+            key,
+            type_data,
+            self.get_ip_key_of_role(role),
+            entry=str(entry),
+        )
+        return data.get(str(entry), {})
+
+    def get_tw_data_sizes(
+        self,
+        profileid: str,
+        twid: str,
+        direction: str,
+        state: str,
+        protocol: str,
+        role: str,
+        type_data: str,
+    ) -> dict:
+        """
+        Returns {port: amount of ips that used this port} when type_data is
+        'Ports', and {ip: amount of dst ports used with this ip} when
+        type_data is 'IPs'.
+        Used by the portscan detections to find the candidate ports/ips
+        without reading all the data of the TW
+        """
+        if self.native_tw_storage:
+            key = direction + type_data + role + protocol.upper() + state
+            return self.get_native_tw_data_sizes(
+                profileid, twid, key, type_data, self.get_ip_key_of_role(role)
+            )
+
+        data = self.get_data_from_profile_tw(
+            profileid, twid, direction, state, protocol, role, type_data
+        )
+        if not data:
+            return {}
+        inner_key = (
+            self.get_ip_key_of_role(role) if type_data == 'Ports' else 'dstports'
+        )
+        return {
+            entry: len(entry_data.get(inner_key, {}))
+            for entry, entry_data in data.items()
+        }
+
+    def get_tuples_of_profile_tw(self, profileid, twid, direction) -> str:
+        """
+        returns the json str of the OutTuples or InTuples of the given TW
+        :param direction: 'OutTuples' or 'InTuples'
+        """
+        if not self.native_tw_storage:
+            return self.hget_batched(profileid + self.separator + twid, direction)
+
+        self.send_queued_tw_writes()
+        tuples = self.r.hgetall(self.get_tw_data_key(profileid, twid, direction))
+        if not tuples:
+            return None
+        return json.dumps({
+            tupleid: json.loads(data) for tupleid, data in tuples.items()
+        })
+
 
     def update_ip_info(
         self,
@@ -685,12 +859,16 @@ class ProfileHandler(IObservable):
         :param ip: the ip that we want to update the times we contacted
         """
 
+        if self.native_tw_storage:
+            self.incr_times_contacted(profileid, twid, direction, ip)
+            return
+
         # Get the hash of the timewindow
         profileid_twid = f'{profileid}{self.separator}{twid}'
 
         # Get the DstIPs data for this tw in this profile
         # The format is {'1.1.1.1' :  3}
-        ips_contacted = self.r.hget(profileid_twid, f'{direction}IPs')
+        ips_contacted = self.hget_batched(profileid_twid, f'{direction}IPs')
         if not ips_contacted:
             ips_contacted = {}
 
@@ -703,7 +881,7 @@ class ProfileHandler(IObservable):
             ips_contacted[ip] = 1
 
         ips_contacted = json.dumps(ips_contacted)
-        self.r.hset(profileid_twid, f'{direction}IPs', str(ips_contacted))
+        self.hset_batched(profileid_twid, f'{direction}IPs', str(ips_contacted))
 
     def add_ips(self, profileid, twid, flow, role):
         """
@@ -774,6 +952,21 @@ class ProfileHandler(IObservable):
         key_name = (
             f'{direction}IPs{role}{flow.proto.upper()}{summaryState}'
         )
+        if self.native_tw_storage:
+            self.incr_ip_counters(
+                profileid,
+                twid,
+                key_name,
+                ip,
+                str(flow.dport),
+                int(flow.pkts),
+                int(flow.spkts or 0),
+                int(flow.bytes),
+                starttime,
+                uid
+            )
+            return True
+
         # Get the previous data about this key
         old_profileid_twid_data = self.get_data_from_profile_tw(
             profileid,
@@ -796,7 +989,7 @@ class ProfileHandler(IObservable):
         )
 
         # Store this data in the profile hash
-        self.r.hset(
+        self.hset_batched(
             f'{profileid}{self.separator}{twid}',
             key_name,
             json.dumps(profileid_twid_data)
@@ -877,27 +1070,26 @@ class ProfileHandler(IObservable):
             'label': label,
             'flow_type': flow.type_,
             'module_labels': {},
+            'uid': flow.uid,
         }
 
-        # Convert to json string
-        flow_dict = json.dumps(flow_dict)
         # The key was not there before. So this flow is not repeated
         # Store the label in our uniq set, and increment it by 1
         if label:
-            self.r.zincrby('labels', 1, label)
-
-        flow_dict = {flow.uid: flow_dict}
+            if self.write_batch is not None:
+                self.write_batch.zincrby('labels', 1, label)
+            else:
+                self.r.zincrby('labels', 1, label)
 
-        # Get the dictionary and convert to json string
-        flow_dict = json.dumps(flow_dict)
-        # Prepare the data to publish.
+        # Prepare the data to publish. it's encoded only once,
+        # the modules decode it using IModule.decode_msg()
         to_send = {
             'profileid': profileid,
             'twid': twid,
             'flow': flow_dict,
             'stime': flow.starttime,
         }
-        to_send = json.dumps(to_send)
+        to_send = self.msg_codec.encode(to_send)
 
         # set the pcap/file stime in the analysis key
         if self.first_flow:
@@ -1120,7 +1312,7 @@ class ProfileHandler(IObservable):
         """Receive an IP and we want the profileid"""
         try:
             profileid = f'profile{self.separator}{str(daddr_as_obj)}'
-            if self.r.sismember('profiles', profileid):
+            if self.is_known_profile(profileid):
                 return profileid
             return False
         except redis.exceptions.ResponseError as inst:
@@ -1154,21 +1346,34 @@ class ProfileHandler(IObservable):
         """
         Get the src ip for a specific TW for a specific profileid
         """
-        return self.r.hget(profileid + self.separator + twid, 'SrcIPs')
+        if self.native_tw_storage:
+            return json.dumps(self.get_times_contacted(profileid, twid, 'Src'))
+        return self.hget_batched(profileid + self.separator + twid, 'SrcIPs')
 
     def getDstIPsfromProfileTW(self, profileid, twid):
         """
         Get the dst ip for a specific TW for a specific profileid
         """
-        return self.r.hget(profileid + self.separator + twid, 'DstIPs')
+        if self.native_tw_storage:
+            return json.dumps(self.get_times_contacted(profileid, twid, 'Dst'))
+        return self.hget_batched(profileid + self.separator + twid, 'DstIPs')
 
     def getT2ForProfileTW(self, profileid, twid, tupleid, tuple_key: str):
         """
         Get T1 and the previous_time for this previous_time, twid and tupleid
         """
         try:
+            if self.native_tw_storage:
+                data = self.hget_batched(
+                    self.get_tw_data_key(profileid, twid, tuple_key), tupleid
+                )
+                if not data:
+                    return False, False
+                (_, previous_two_timestamps) = json.loads(data)
+                return previous_two_timestamps
+
             hash_id = profileid + self.separator + twid
-            data = self.r.hget(hash_id, tuple_key)
+            data = self.hget_batched(hash_id, tuple_key)
             if not data:
                 return False, False
             data = json.loads(data)
@@ -1186,7 +1391,33 @@ class ProfileHandler(IObservable):
 
     def has_profile(self, profileid):
         """Check if we have the given profile"""
-        return self.r.sismember('profiles', profileid) if profileid else False
+        return self.is_known_profile(profileid) if profileid else False
+
+    def is_known_profile(self, profileid: str) -> bool:
+        """
+        Checks if the given profile is in the db using the in-process cache
+        of known profiles first.
+        profiles are never removed from the db, so only the profiles we haven't
+        seen before in this process are checked in redis
+        """
+        if profileid in self.known_profiles:
+            self.known_profiles.move_to_end(profileid)
+            return True
+        if self.r.sismember('profiles', profileid):
+            self.cache_known_profile(profileid)
+            return True
+        return False
+
+    def cache_known_profile(self, profileid: str):
+        """
+        remembers that the given profile is in the db. only the
+        known_profiles_cache_size most recently seen profiles are kept,
+        the rest are checked in redis again
+        """
+        self.known_profiles[profileid] = None
+        self.known_profiles.move_to_end(profileid)
+        if len(self.known_profiles) > self.known_profiles_cache_size:
+            self.known_profiles.popitem(last=False)
 
     def get_profiles_len(self) -> int:
         """Return the amount of profiles. Redis should be faster than python to do this count"""
@@ -1262,6 +1493,7 @@ class ProfileHandler(IObservable):
             # Add the new TW to the index of TW
             data = {str(twid): float(startoftw)}
             self.r.zadd(f'tws{profileid}', data)
+            self.invalidate_cached_last_twid(profileid)
             self.print(f'Created and added to DB the new older '
                        f'TW with id {twid}. Time: {startoftw} '
                        ,0,4)
@@ -1295,6 +1527,7 @@ class ProfileHandler(IObservable):
             # Add the new TW to the index of TW
             data = {twid: float(startoftw)}
             self.r.zadd(f'tws{profileid}', data)
+            self.invalidate_cached_last_twid(profileid)
             self.print(f'Created and added to DB for profile '
                        f'{profileid} on TW with id {twid}. Time: {startoftw} ', 0, 4)
 
@@ -1597,12 +1830,13 @@ class ProfileHandler(IObservable):
         Duration is only needed for registration purposes in the profile. Nothing operational
         """
         try:
-            if self.r.sismember('profiles', str(profileid)):
+            if self.is_known_profile(str(profileid)):
                 # we already have this profile
                 return False
 
             # Add the profile to the index. The index is called 'profiles'
             self.r.sadd('profiles', str(profileid))
+            self.cache_known_profile(str(profileid))
             # Create the hashmap with the profileid. The hasmap of each profile is named with the profileid
             # Add the start time of profile
             self.r.hset(profileid, 'starttime', starttime)
@@ -1677,6 +1911,98 @@ class ProfileHandler(IObservable):
         self.r.zrem('ModifiedTW', profileid_tw)
         self.publish('tw_closed', profileid_tw)
 
+    def mark_tws_as_closed(self, profileid_tws: list):
+        """
+        Same as markProfileTWAsClosed() but closes all the given tws
+        in one round trip
+        """
+        if not profileid_tws:
+            return
+        self.r.sadd('ClosedTW', *profileid_tws)
+        self.r.zrem('ModifiedTW', *profileid_tws)
+        self.publish_many('tw_closed', profileid_tws)
+
+    def schedule_tw_closing(self, profileid_tw: str, modification_time: float):
+        """
+        Keeps track of the modification time of the given tw in
+        an in-process min heap, and tells whether it's time to look for
+        tws to close. instead of checking on every modification,
+        we check every tw_closing_check_every modifications or
+        tw_closing_check_interval seconds, whichever comes first.
+        the heap has 1 entry per tw, a tw modified again only updates its
+        last modification time, and its entry is pushed again with this
+        time when it's popped
+        :return: True if close_modified_tws() should be called
+        """
+        if profileid_tw not in self.tws_last_modification:
+            heapq.heappush(
+                self.tws_modification_heap, (modification_time, profileid_tw)
+            )
+        self.tws_last_modification[profileid_tw] = modification_time
+        self.modifications_since_tw_check += 1
+        return (
+            self.modifications_since_tw_check >= self.tw_closing_check_every
+            or modification_time - self.last_tw_check_time
+            >= self.tw_closing_check_interval
+        )
+
+    def close_modified_tws(self):
+        """
+        Closes the tws that were modified by this process and weren't
+        modified since sit - width, using the min heap filled by
+        schedule_tw_closing() instead of scanning ModifiedTW in redis.
+        tws modified by other processes are closed by check_TW_to_close()
+        """
+        self.modifications_since_tw_check = 0
+        self.last_tw_check_time = time.time()
+
+        sit = float(self.getSlipsInternalTime())
+        modification_time = sit - self.width
+
+        candidates = []
+        heap = self.tws_modification_heap
+        while heap and heap[0][0] <= modification_time:
+            _, profileid_tw = heapq.heappop(heap)
+            last_modification = self.tws_last_modification.get(profileid_tw)
+            if last_modification is None:
+                continue
+            if last_modification > modification_time:
+                # the tw was modified again after this entry was pushed
+                heapq.heappush(heap, (last_modification, profileid_tw))
+                continue
+            del self.tws_last_modification[profileid_tw]
+            candidates.append(profileid_tw)
+
+        if not candidates:
+            return
+
+        # other processes may have modified or closed these tws,
+        # ModifiedTW in redis is the source of truth
+        pipe = self.r.pipeline(transaction=False)
+        for profileid_tw in candidates:
+            pipe.zscore('ModifiedTW', profileid_tw)
+        scores = pipe.execute()
+
+        to_close = []
+        for profileid_tw, last_modified in zip(candidates, scores):
+            if last_modified is None:
+                # already closed
+                continue
+            if last_modified > modification_time:
+                # modified later by another process, check it again later
+                self.schedule_tw_closing(profileid_tw, last_modified)
+                continue
+            self.print(
+                f'The profile id {profileid_tw} has to be closed because it was'
+                f' last modifed on {last_modified} and we are closing everything older '
+                f'than {modification_time}. Current time {sit}.',
+                3,
+                0,
+            )
+            to_close.append(profileid_tw)
+
+        self.mark_tws_as_closed(to_close)
+
     def markProfileTWAsModified(self, profileid, twid, timestamp):
         """
         Mark a TW in a profile as modified
@@ -1685,19 +2011,41 @@ class ProfileHandler(IObservable):
         2- Add the timestamp received to the time_of_last_modification
            in the TW itself
         3- To update the internal time of slips
-        4- To check if we should 'close' some TW
+        4- To check if we should 'close' some TW, this isn't done on every
+           modification, check schedule_tw_closing()
         """
         timestamp = time.time()
+        profileid_tw = f'{profileid}{self.separator}{twid}'
         data = {
-            f'{profileid}{self.separator}{twid}': float(timestamp)
+            profileid_tw: float(timestamp)
         }
-        self.r.zadd('ModifiedTW', data)
-        self.publish(
-            'tw_modified',
-            f'{profileid}:{twid}'
-            )
+        if self.write_batch is not None:
+            self.write_batch.zadd('ModifiedTW', data)
+        else:
+            self.r.zadd('ModifiedTW', data)
+
+        # the msgs queued in the write batch are received once the whole
+        # batch is in redis, the modules would read the same tw once per
+        # msg. the profiler doesn't add 2 flows to the same tw in one batch,
+        # so this is 1 msg per flow and tw, check
+        # Profiler.flush_write_batch_if_tw_modified()
+        if profileid_tw not in self.write_batch_modified_tws:
+            self.publish(
+                'tw_modified',
+                f'{profileid}:{twid}'
+                )
+        if self.write_batch is not None:
+            self.write_batch_modified_tws.add(profileid_tw)
+
+        if not self.schedule_tw_closing(profileid_tw, timestamp):
+            return
+
+        if self.write_batch is not None:
+            # the tws to close are checked once the batch is flushed
+            self.check_tws_after_flush = True
+            return
         # Check if we should close some TW
-        self.check_TW_to_close()
+        self.close_modified_tws()
 
     def publish_new_letter(self, new_symbol:str, profileid:str, twid:str, tupleid:str, flow):
         """
@@ -1759,8 +2107,14 @@ class ProfileHandler(IObservable):
             profileid_twid = f'{profileid}{self.separator}{twid}'
 
             # prev_symbols is a dict with {tulpeid: ['symbols_so_far', [timestamps]]}
-            prev_symbols: str = self.r.hget(profileid_twid, direction) or '{}'
-            prev_symbols: dict = json.loads(prev_symbols)
+            if self.native_tw_storage:
+                # each tuple is stored in its own field, only read this one
+                tuples_key = self.get_tw_data_key(profileid, twid, direction)
+                prev_tuple = self.hget_batched(tuples_key, tupleid)
+                prev_symbols = {tupleid: json.loads(prev_tuple)} if prev_tuple else {}
+            else:
+                prev_symbols: str = self.hget_batched(profileid_twid, direction) or '{}'
+                prev_symbols: dict = json.loads(prev_symbols)
 
             try:
                 # Get the last symbols of letters in the DB
@@ -1799,8 +2153,13 @@ class ProfileHandler(IObservable):
                 )
                 prev_symbols[tupleid] = symbol
 
-            prev_symbols = json.dumps(prev_symbols)
-            self.r.hset(profileid_twid, direction, prev_symbols)
+            if self.native_tw_storage:
+                self.hset_batched(
+                    tuples_key, tupleid, json.dumps(prev_symbols[tupleid])
+                )
+            else:
+                prev_symbols = json.dumps(prev_symbols)
+                self.hset_batched(profileid_twid, direction, prev_symbols)
             self.markProfileTWAsModified(profileid, twid, flow.starttime)
 
         except Exception:
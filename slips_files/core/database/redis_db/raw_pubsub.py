@@ -0,0 +1,53 @@
+from typing import Iterable, Optional, Union
+
+
+def decode_msg_data(
+        channel: str,
+        data: Union[str, bytes],
+        binary_channels: Iterable[str]
+        ) -> Union[str, bytes]:
+    """
+    returns the data of the msgs of the binary channels as bytes, and
+    decodes the rest as utf-8 like the other redis clients of slips
+    """
+    if isinstance(data, bytes) and channel not in binary_channels:
+        return data.decode('utf-8')
+    return data
+
+
+class RawPubSub:
+    """
+    Used instead of redis' PubSub obj when subscribing to binary channels,
+    meaning the channels whose msgs may be encoded using msgpack
+    (check MsgCodec).
+
+    the msgs are read using a redis client that doesn't decode them
+    (decode_responses=False), so the msgpack msgs are given to the
+    subscriber as the exact bytes that were published. the msgs of the
+    rest of the channels are decoded as utf-8.
+
+    get_message() returns the msgs in the same format as PubSub.get_message()
+    """
+    def __init__(self, pubsub, binary_channels: Iterable[str]):
+        """
+        :param pubsub: the PubSub obj of a client with decode_responses=False
+        """
+        self.pubsub = pubsub
+        self.binary_channels = binary_channels
+
+    def __getattr__(self, attr):
+        # subscribe(), unsubscribe(), close() etc. of the PubSub obj
+        return getattr(self.pubsub, attr)
+
+    def get_message(self, *args, **kwargs) -> Optional[dict]:
+        msg = self.pubsub.get_message(*args, **kwargs)
+        if not msg:
+            return msg
+
+        for field in ('channel', 'pattern'):
+            if isinstance(msg[field], bytes):
+                msg[field] = msg[field].decode('utf-8')
+        msg['data'] = decode_msg_data(
+            msg['channel'], msg['data'], self.binary_channels
+        )
+        return msg
@@ -0,0 +1,270 @@
+import multiprocessing
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+import redis
+
+from slips_files.core.database.redis_db.raw_pubsub import decode_msg_data
+
+
+class StreamSubscription:
+    """
+    Used instead of redis' PubSub obj when message_transport = streams
+    in slips.conf.
+
+    Each subscribing process reads the streams of its channels using its own
+    consumer group, so every subscriber gets every msg like in pub/sub.
+    the msgs are read in batches using XREADGROUP and acked once the
+    subscriber asks for the next batch, so the msgs a module didn't finish
+    handling before it crashed or restarted are delivered to it again.
+
+    get_message() returns the msgs in the same format as PubSub.get_message()
+    so the modules don't have to know which transport is used.
+    """
+    def __init__(
+            self,
+            r: redis.StrictRedis,
+            raw_r: redis.StrictRedis,
+            streams: Dict[str, str],
+            batch_size: int,
+            binary_channels: Iterable[str] = (),
+            subscriber: Optional[str] = None
+            ):
+        """
+        :param raw_r: the client with decode_responses=False used to read
+        the msgs, so the msgs of the binary channels aren't decoded
+        :param streams: {stream key: channel}
+        :param subscriber: the name of the subscribing module, the consumer
+        group is named after it. defaults to the name of the process that
+        reads the msgs
+        """
+        self.r = r
+        self.raw_r = raw_r
+        self.binary_channels = binary_channels
+        self.streams = streams
+        self.batch_size = batch_size
+        self.subscriber = subscriber
+        # the modules subscribe in their __init__, which runs in the main
+        # process, so the group is created in the module's own process when
+        # it reads its first msg. it starts reading from the msgs published
+        # after subscribing, same as pub/sub
+        self.start_ids = {
+            stream: self.get_last_id(stream) for stream in streams
+        }
+        self.group = None
+        # (stream, msg id, data) read from redis and not yet given to
+        # the subscriber
+        self.buffer = deque()
+        # {stream: ids of the msgs given to the subscriber and not yet acked}
+        self.to_ack = {}
+        # start by reading the msgs that were delivered to this consumer
+        # and never acked, then switch to the new ones ('>')
+        self.last_ids = {stream: '0' for stream in streams}
+
+    def get_last_id(self, stream: str) -> str:
+        try:
+            return self.r.xinfo_stream(stream)['last-generated-id']
+        except redis.exceptions.ResponseError:
+            # no such stream, nothing was published yet
+            return '0'
+
+    def create_groups(self):
+        # the group is named after the subscribing module to be able to
+        # replay the unacked msgs after restarting the module.
+        # there's only one consumer per group, it uses the same name so that
+        # a restarted subscriber can claim the pending msgs of the old one
+        self.group = (
+            self.subscriber or multiprocessing.current_process().name
+        )
+        for stream, start_id in self.start_ids.items():
+            try:
+                self.r.xgroup_create(
+                    stream, self.group, id=start_id, mkstream=True
+                )
+            except redis.exceptions.ResponseError as ex:
+                if 'BUSYGROUP' not in str(ex):
+                    raise
+                # the group already exists, this is a restarted subscriber
+
+    def ack(self):
+        for stream, ids in self.to_ack.items():
+            if ids:
+                self.r.xack(stream, self.group, *ids)
+        self.to_ack = {}
+
+    def drop_trimmed_pending_msgs(self):
+        """
+        acks the pending msgs of this consumer that were trimmed from the
+        streams (because of streams_maxlen) and can't be delivered again
+        """
+        for stream, last_id in self.last_ids.items():
+            if last_id == '>':
+                continue
+            # these are the msgs the last XREADGROUP tried to replay
+            pending = self.r.xpending_range(
+                stream,
+                self.group,
+                '-' if last_id == '0' else last_id,
+                '+',
+                self.batch_size,
+                consumername=self.group
+            )
+            pipe = self.r.pipeline(transaction=False)
+            for msg in pending:
+                pipe.xrange(stream, msg['message_id'], msg['message_id'])
+            entries = pipe.execute()
+            if trimmed_ids := [
+                msg['message_id']
+                for msg, entry in zip(pending, entries)
+                if not entry
+            ]:
+                self.r.xack(stream, self.group, *trimmed_ids)
+
+    def read(self, timeout: float):
+        """reads the next batch of msgs from the streams to the buffer"""
+        if self.group is None:
+            self.create_groups()
+
+        self.ack()
+        replaying = any(last_id != '>' for last_id in self.last_ids.values())
+        # don't block while replaying the pending msgs. BLOCK 0 means block
+        # forever, so tiny timeouts don't block either
+        block = None if replaying else int(timeout * 1000) or None
+        try:
+            res = self.raw_r.xreadgroup(
+                self.group,
+                self.group,
+                self.last_ids,
+                count=self.batch_size,
+                block=block
+            )
+        except TypeError:
+            # redis-py can't parse the pending msgs that were trimmed
+            self.drop_trimmed_pending_msgs()
+            return
+
+        entries_per_stream = {
+            stream.decode('utf-8'): entries for stream, entries in res or ()
+        }
+        if replaying:
+            for stream, last_id in self.last_ids.items():
+                if last_id == '>':
+                    continue
+                if entries := entries_per_stream.get(stream):
+                    self.last_ids[stream] = entries[-1][0].decode('utf-8')
+                else:
+                    # done replaying this stream
+                    self.last_ids[stream] = '>'
+
+        for stream, entries in entries_per_stream.items():
+            channel = self.streams[stream]
+            trimmed_ids = []
+            for msg_id, fields in entries:
+                msg_id = msg_id.decode('utf-8')
+                if not fields:
+                    # a pending msg that was trimmed from the stream,
+                    # redis replays its id without the data
+                    trimmed_ids.append(msg_id)
+                    continue
+                data = decode_msg_data(
+                    channel, fields.get(b'data'), self.binary_channels
+                )
+                self.buffer.append((stream, msg_id, data))
+            if trimmed_ids:
+                self.r.xack(stream, self.group, *trimmed_ids)
+
+        if replaying and not self.buffer:
+            self.read(timeout)
+
+    def get_message(self, timeout=0.0, ignore_subscribe_messages=True) -> Optional[dict]:
+        if not self.buffer:
+            self.read(timeout)
+            if not self.buffer:
+                return None
+
+        stream, msg_id, data = self.buffer.popleft()
+        self.to_ack.setdefault(stream, []).append(msg_id)
+        return {
+            'type': 'message',
+            'pattern': None,
+            'channel': self.streams[stream],
+            'data': data,
+        }
+
+    def unsubscribe(self, *args):
+        self.ack()
+
+    def close(self):
+        if self.group is not None:
+            self.ack()
+
+
+class StreamsHandler:
+    """
+    Helper class for the Redis class in database.py
+    Contains the logic of using redis streams instead of pub/sub to send
+    msgs between the slips processes (message_transport = streams in slips.conf).
+
+    Unlike pub/sub, the msgs aren't lost if a subscriber is slow or
+    restarting, they stay in the stream until they're acked.
+    each stream is capped at ~streams_maxlen msgs to bound redis' memory usage
+    """
+    name = 'DB'
+
+    def get_stream_key(self, channel: str) -> str:
+        return f'stream{self.separator}{channel}'
+
+    def add_to_stream(self, client, channel: str, data):
+        """
+        :param client: the redis client or pipeline to send the msg with
+        """
+        client.xadd(
+            self.get_stream_key(channel),
+            {'data': data},
+            maxlen=self.streams_maxlen,
+            approximate=True
+        )
+
+    def subscribe_to_streams(
+            self,
+            channels: List[str],
+            subscriber: Optional[str] = None
+            ) -> StreamSubscription:
+        return StreamSubscription(
+            self.r,
+            self.raw_r,
+            {self.get_stream_key(channel): channel for channel in channels},
+            self.streams_batch_size,
+            binary_channels=self.binary_channels,
+            subscriber=subscriber
+        )
+
+    def get_streams_lag(self) -> Dict[str, Dict[str, dict]]:
+        """
+        returns {channel: {consumer group: {'pending': int, 'lag': int}}}
+        pending is the number of msgs read by the consumer and not yet acked,
+        lag is the number of msgs in the stream the consumer didn't read yet
+        """
+        streams_lag = {}
+        for channel in self.supported_channels:
+            stream = self.get_stream_key(channel)
+            try:
+                groups = self.r.xinfo_groups(stream)
+            except redis.exceptions.ResponseError:
+                # no such stream
+                continue
+
+            channel_lag = {}
+            for group in groups:
+                lag = group.get('lag')
+                if lag is None:
+                    # redis < 7 doesn't report the lag of the groups
+                    lag = len(
+                        self.r.xrange(stream, min=f'({group["last-delivered-id"]}')
+                    )
+                channel_lag[group['name']] = {
+                    'pending': group['pending'],
+                    'lag': lag,
+                }
+            streams_lag[channel] = channel_lag
+        return streams_lag
@@ -0,0 +1,278 @@
+from typing import Dict, List, Tuple
+
+
+class TWCountersHandler:
+    """
+    Helper class for the Redis class in database.py
+    Contains the logic of the native layout of the data of each timewindow
+    (used when tw_storage_layout = native in slips.conf).
+
+    Instead of storing every DstIPs/SrcIPs/DstPorts.. key of a TW as one
+    json blob that has to be read, updated and written back for each flow,
+    every counter is stored in its own redis key and updated with
+    ZINCRBY/HINCRBY/RPUSH, so the cost of adding a flow doesn't depend on
+    how many ips or ports the profile contacted in this TW.
+
+    For a key_name like 'DstPortsClientTCPNot Established' the layout is
+        <profileid>_<twid>_<key_name>  zset of ports scored by totalflows
+        .._<port>  hash of totalpkt and totalbytes
+        .._<port>_<dstips|srcips>  set of the ips that used this port
+        .._<port>_<dstips|srcips>_<ip>  hash of pkts, spkts and stime
+        .._<port>_<dstips|srcips>_<ip>_uids  list of uids
+
+    and for a key_name like 'DstIPsClientTCPEstablished'
+        <profileid>_<twid>_<key_name>  zset of ips scored by totalflows
+        .._<ip>  hash of totalpkt, totalbytes and stime
+        .._<ip>_uids  list of uids
+        .._<ip>_dstports  hash of {dport: spkts}
+    """
+    name = 'DB'
+
+    def get_tw_data_key(self, profileid: str, twid: str, key_name: str) -> str:
+        return f'{profileid}{self.separator}{twid}{self.separator}{key_name}'
+
+    def get_tw_counters_pipeline(self) -> Tuple[object, bool]:
+        """
+        returns the pipeline to queue the counter updates in and whether the
+        caller should execute it.
+        if the profiler is batching its writes, the updates are queued in the
+        write batch and sent with it
+        """
+        if self.write_batch is not None:
+            return self.write_batch, False
+        return self.r.pipeline(transaction=False), True
+
+    def send_queued_tw_writes(self):
+        """
+        the native keys are read directly from redis, so the updates
+        queued in the write batch of the profiler are sent before reading
+        them, otherwise the reads would miss them
+        """
+        if self.write_batch is not None and len(self.write_batch):
+            self.write_batch.execute()
+            self.write_batch_overlay = {}
+            self.write_batch_modified_tws = set()
+
+    def incr_port_counters(
+            self,
+            profileid: str,
+            twid: str,
+            key_name: str,
+            port: str,
+            ip_key: str,
+            ip: str,
+            pkts: int,
+            spkts: int,
+            totbytes: int,
+            starttime: str,
+            uid: str
+    ):
+        """
+        the native equivalent of updating the json of the port in add_port()
+        :param ip_key: 'dstips' or 'srcips'
+        """
+        base = self.get_tw_data_key(profileid, twid, key_name)
+        port_key = f'{base}{self.separator}{port}'
+        ips_key = f'{port_key}{self.separator}{ip_key}'
+        ip_data_key = f'{ips_key}{self.separator}{ip}'
+
+        pipe, should_execute = self.get_tw_counters_pipeline()
+        pipe.zincrby(base, 1, port)
+        pipe.hincrby(port_key, 'totalpkt', pkts)
+        pipe.hincrby(port_key, 'totalbytes', totbytes)
+        pipe.sadd(ips_key, ip)
+        pipe.hincrby(ip_data_key, 'pkts', pkts)
+        pipe.hincrby(ip_data_key, 'spkts', spkts)
+        pipe.hsetnx(ip_data_key, 'stime', starttime)
+        pipe.rpush(f'{ip_data_key}{self.separator}uids', uid)
+        if should_execute:
+            pipe.execute()
+
+    def incr_ip_counters(
+            self,
+            profileid: str,
+            twid: str,
+            key_name: str,
+            ip: str,
+            dport: str,
+            pkts: int,
+            spkts: int,
+            totbytes: int,
+            starttime: str,
+            uid: str
+    ):
+        """
+        the native equivalent of update_ip_info()
+        """
+        base = self.get_tw_data_key(profileid, twid, key_name)
+        ip_key = f'{base}{self.separator}{ip}'
+
+        pipe, should_execute = self.get_tw_counters_pipeline()
+        pipe.zincrby(base, 1, ip)
+        pipe.hincrby(ip_key, 'totalpkt', pkts)
+        pipe.hincrby(ip_key, 'totalbytes', totbytes)
+        pipe.hsetnx(ip_key, 'stime', starttime)
+        pipe.rpush(f'{ip_key}{self.separator}uids', uid)
+        pipe.hincrby(f'{ip_key}{self.separator}dstports', dport, spkts)
+        if should_execute:
+            pipe.execute()
+
+    def incr_times_contacted(
+            self, profileid: str, twid: str, direction: str, ip: str
+    ):
+        """
+        the native equivalent of update_times_contacted()
+        :param direction: 'Dst' or 'Src'
+        """
+        key = self.get_tw_data_key(profileid, twid, f'{direction}IPs')
+        pipe, should_execute = self.get_tw_counters_pipeline()
+        pipe.hincrby(key, ip, 1)
+        if should_execute:
+            pipe.execute()
+
+    def get_times_contacted(
+            self, profileid: str, twid: str, direction: str
+    ) -> Dict[str, int]:
+        """
+        returns {ip: times contacted} of the given TW stored using
+        incr_times_contacted()
+        """
+        key = self.get_tw_data_key(profileid, twid, f'{direction}IPs')
+        self.send_queued_tw_writes()
+        contacted = self.r.hgetall(key)
+        return {ip: int(times) for ip, times in contacted.items()}
+
+    def read_port_entries(
+            self, base: str, ports: List[Tuple[str, float]], ip_key: str
+    ) -> dict:
+        """
+        builds the same dict add_port() stores in json for the given ports
+        :param ports: list of (port, totalflows)
+        """
+        pipe = self.r.pipeline(transaction=False)
+        for port, _ in ports:
+            port_key = f'{base}{self.separator}{port}'
+            pipe.hgetall(port_key)
+            pipe.smembers(f'{port_key}{self.separator}{ip_key}')
+        res = pipe.execute()
+
+        data = {}
+        ips_of_ports = []
+        for idx, (port, totalflows) in enumerate(ports):
+            port_counters, ips = res[2 * idx], res[2 * idx + 1]
+            data[port] = {
+                'totalflows': int(totalflows),
+                'totalpkt': int(port_counters.get('totalpkt', 0)),
+                'totalbytes': int(port_counters.get('totalbytes', 0)),
+                ip_key: {},
+            }
+            ips_of_ports.extend((port, ip) for ip in ips)
+
+        pipe = self.r.pipeline(transaction=False)
+        for port, ip in ips_of_ports:
+            ip_data_key = (
+                f'{base}{self.separator}{port}{self.separator}'
+                f'{ip_key}{self.separator}{ip}'
+            )
+            pipe.hgetall(ip_data_key)
+            pipe.lrange(f'{ip_data_key}{self.separator}uids', 0, -1)
+        res = pipe.execute()
+
+        for idx, (port, ip) in enumerate(ips_of_ports):
+            ip_data, uids = res[2 * idx], res[2 * idx + 1]
+            data[port][ip_key][ip] = {
+                'pkts': int(ip_data.get('pkts', 0)),
+                'spkts': int(ip_data.get('spkts', 0)),
+                'stime': ip_data.get('stime', ''),
+                'uid': uids,
+            }
+        return data
+
+    def read_ip_entries(
+            self, base: str, ips: List[Tuple[str, float]]
+    ) -> dict:
+        """
+        builds the same dict update_ip_info() stores in json for the given ips
+        :param ips: list of (ip, totalflows)
+        """
+        pipe = self.r.pipeline(transaction=False)
+        for ip, _ in ips:
+            ip_key = f'{base}{self.separator}{ip}'
+            pipe.hgetall(ip_key)
+            pipe.lrange(f'{ip_key}{self.separator}uids', 0, -1)
+            pipe.hgetall(f'{ip_key}{self.separator}dstports')
+        res = pipe.execute()
+
+        data = {}
+        for idx, (ip, totalflows) in enumerate(ips):
+            ip_data, uids, dstports = res[3 * idx: 3 * idx + 3]
+            data[ip] = {
+                'totalflows': int(totalflows),
+                'totalpkt': int(ip_data.get('totalpkt', 0)),
+                'totalbytes': int(ip_data.get('totalbytes', 0)),
+                'stime': ip_data.get('stime', ''),
+                'uid': uids,
+                'dstports': {
+                    port: int(spkts) for port, spkts in dstports.items()
+                },
+            }
+        return data
+
+    def get_native_tw_data(
+            self,
+            profileid: str,
+            twid: str,
+            key_name: str,
+            type_data: str,
+            ip_key: str,
+            entry: str = None,
+    ) -> dict:
+        """
+        returns the data of the given key of the TW in the same format as
+        get_data_from_profile_tw()
+        :param type_data: 'Ports' or 'IPs'
+        :param entry: a port or an ip. if given, only the data of this
+        entry is returned
+        """
+        base = self.get_tw_data_key(profileid, twid, key_name)
+        self.send_queued_tw_writes()
+        if entry is None:
+            entries = self.r.zrange(base, 0, -1, withscores=True)
+        else:
+            totalflows = self.r.zscore(base, entry)
+            entries = [] if totalflows is None else [(entry, totalflows)]
+
+        if not entries:
+            return {}
+
+        if type_data == 'Ports':
+            return self.read_port_entries(base, entries, ip_key)
+        return self.read_ip_entries(base, entries)
+
+    def get_native_tw_data_sizes(
+            self,
+            profileid: str,
+            twid: str,
+            key_name: str,
+            type_data: str,
+            ip_key: str,
+    ) -> Dict[str, int]:
+        """
+        returns {port: amount of ips that used it} when type_data is 'Ports'
+        and {ip: amount of dst ports used with it} when type_data is 'IPs'
+        without reading the rest of the data of the TW
+        """
+        base = self.get_tw_data_key(profileid, twid, key_name)
+        self.send_queued_tw_writes()
+        entries = self.r.zrange(base, 0, -1)
+        if not entries:
+            return {}
+
+        pipe = self.r.pipeline(transaction=False)
+        for entry in entries:
+            entry_key = f'{base}{self.separator}{entry}'
+            if type_data == 'Ports':
+                pipe.scard(f'{entry_key}{self.separator}{ip_key}')
+            else:
+                pipe.hlen(f'{entry_key}{self.separator}dstports')
+        return dict(zip(entries, pipe.execute()))
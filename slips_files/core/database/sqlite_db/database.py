@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Dict
 import os.path
 import sqlite3
 import json
@@ -6,8 +6,10 @@ import csv
 from dataclasses import asdict
 from threading import Lock
 from time import sleep
+import time
 from slips_files.core.output import Output
 from slips_files.common.abstracts.observer import IObservable
+from slips_files.common.parsers.config_parser import ConfigParser
 
 class SQLiteDB(IObservable):
     """Stores all the flows slips reads and handles labeling them"""
@@ -15,6 +17,8 @@ class SQLiteDB(IObservable):
     # used to lock each call to commit()
     cursor_lock = Lock()
     trial = 0
+    # the size of the page cache of each connection in KiB when batching
+    cache_size = 16000
 
     def __init__(self,
                  logger: Output,
@@ -23,8 +27,19 @@ class SQLiteDB(IObservable):
         self.logger = logger
         self.add_observer(self.logger)
         self._flows_db = os.path.join(output_dir, 'flows.sqlite')
+        self.read_configuration()
+        # {insert query: rows waiting to be inserted using this query},
+        # check queue_flow_insert()
+        self.write_batch = {}
+        self.rows_in_write_batch = 0
+        self.last_write_batch_flush = time.time()
         self.connect()
 
+    def read_configuration(self):
+        conf = ConfigParser()
+        self.write_batch_size = conf.sqlite_write_batch_size()
+        self.write_batch_timeout = conf.sqlite_write_batch_timeout()
+
     def connect(self):
         """
         Creates the db if it doesn't exist and connects to it
@@ -39,10 +54,80 @@ class SQLiteDB(IObservable):
         self.conn = sqlite3.connect(self._flows_db, check_same_thread=False, timeout=20)
 
         self.cursor = self.conn.cursor()
+        if self.is_write_batch_enabled():
+            self.set_write_batch_pragmas()
         if db_newly_created:
             # only init tables if the db is newly created
             self.init_tables()
 
+    def set_write_batch_pragmas(self):
+        """
+        uses WAL so the readers in the other slips processes don't block
+        the writer and vice versa, and so the db is only synced to disk at
+        checkpoints instead of on every commit
+        """
+        try:
+            self.cursor.execute('PRAGMA journal_mode=WAL')
+            self.cursor.execute('PRAGMA synchronous=NORMAL')
+            self.cursor.execute(f'PRAGMA cache_size=-{self.cache_size}')
+        except sqlite3.Error as e:
+            # another process is changing the journal mode,
+            # the db works the same without these pragmas
+            self.print(f"Error setting the sqlite pragmas: {e}", 0, 1)
+
+    def is_write_batch_enabled(self) -> bool:
+        return self.write_batch_size > 1
+
+    def queue_flow_insert(self, query: str, parameters: tuple):
+        """
+        queues the given insert instead of running it in its own
+        transaction, the queued rows are inserted in 1 transaction once
+        there are write_batch_size of them or the oldest one waited for
+        write_batch_timeout
+        """
+        if not self.is_write_batch_enabled():
+            self.execute(query, parameters)
+            return
+
+        self.write_batch.setdefault(query, []).append(parameters)
+        self.rows_in_write_batch += 1
+        self.flush_flows_if_needed()
+
+    def flush_flows_if_needed(self):
+        if not self.rows_in_write_batch:
+            return
+        if (
+            self.rows_in_write_batch < self.write_batch_size
+            and time.time() - self.last_write_batch_flush < self.write_batch_timeout
+        ):
+            return
+        self.flush_flows()
+
+    def flush_flows(self):
+        """inserts all the queued rows in 1 transaction"""
+        self.last_write_batch_flush = time.time()
+        if not self.rows_in_write_batch:
+            return
+
+        self.cursor_lock.acquire(True)
+        try:
+            self.cursor.execute('BEGIN')
+            for query, rows in self.write_batch.items():
+                self.cursor.executemany(query, rows)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            # don't block waiting for the db to be unlocked, the rows stay
+            # queued and are inserted by the next flush
+            self.print(f"Error inserting {self.rows_in_write_batch} queued "
+                       f"rows: {e}. Retrying later", 0, 1)
+            return
+        finally:
+            self.cursor_lock.release()
+
+        self.write_batch = {}
+        self.rows_in_write_batch = 0
+
     def get_number_of_tables(self):
         """
         returns the number of tables in the current db
@@ -62,6 +147,15 @@ class SQLiteDB(IObservable):
         for table_name, schema in table_schema.items():
             self.create_table(table_name, schema)
 
+        # the modules look up the flows of a profileid or of a
+        # profileid and twid, uid is already indexed by its primary key
+        indexes = {
+            'flows_profileid_twid': 'flows (profileid, twid)',
+            'altflows_profileid_twid': 'altflows (profileid, twid)',
+            }
+        for index_name, columns in indexes.items():
+            self.create_index(index_name, columns)
+
     def _init_db(self):
         """
         creates the db if it doesn't exist and clears it if it exists
@@ -72,6 +166,10 @@ class SQLiteDB(IObservable):
         query = f"CREATE TABLE IF NOT EXISTS {table_name} ({schema})"
         self.execute(query)
 
+    def create_index(self, index_name, columns):
+        query = f"CREATE INDEX IF NOT EXISTS {index_name} ON {columns}"
+        self.execute(query)
+
     def print(self, text, verbose=1, debug=0):
         """
         Function to use to print text using the outputqueue of slips.
@@ -109,37 +207,65 @@ class SQLiteDB(IObservable):
 
     def get_altflow_from_uid(self, profileid, twid, uid) -> dict:
         """ Given a uid, get the alternative flow associated with it """
-        condition = f'uid = "{uid}"'
-        altflow = self.select('altflows', condition=condition)
+        altflow = self.select('altflows', condition='uid = ?', params=(uid,))
         if altflow:
             flow: str = altflow[0][1]
             return json.loads(flow)
         return False
 
     def get_all_contacted_ips_in_profileid_twid(self, profileid, twid) -> dict:
-        all_flows: dict = self.get_all_flows_in_profileid_twid(profileid, twid)
-
-        if not all_flows:
-            return {}
+        """returns {daddr: uid} of the flows in the given profileid and twid"""
+        flows: dict = self.get_flows_fields(['daddr'], profileid, twid)
+        return {flow['daddr']: uid for uid, flow in flows.items()}
 
-        contacted_ips = {}
-        for uid, flow in all_flows.items():
-            # get the daddr of this flow
-            daddr = flow['daddr']
-            contacted_ips[daddr] = uid
-        return contacted_ips
+    def get_flows_condition(self, profileid=None, twid=None):
+        """
+        returns the WHERE clause and its parameters for the
+        flows of the given profileid and twid
+        """
+        conditions, params = [], []
+        if profileid:
+            conditions.append('profileid = ?')
+            params.append(profileid)
+        if twid:
+            conditions.append('twid = ?')
+            params.append(twid)
+        return ' AND '.join(conditions), tuple(params)
 
+    def get_flows_fields(
+            self, fields: List[str], profileid=None, twid=None
+            ) -> Dict[str, dict]:
+        """
+        returns only the given fields of the flows in the given profileid
+        and twid, {uid: {field: value}}
+        the fields are extracted by sqlite using the (profileid, twid)
+        index, so the whole flows aren't json decoded for a few fields.
+        the value of a field the flow doesn't have is None
+        """
+        # json_object(field1, json_extract(flow, '$.field1'), ...)
+        extracted_fields = ', '.join(['?, json_extract(flow, ?)'] * len(fields))
+        params = []
+        for field in fields:
+            params.extend((field, f'$.{field}'))
+
+        condition, condition_params = self.get_flows_condition(profileid, twid)
+        flows = self.select(
+            'flows',
+            columns=f'uid, json_object({extracted_fields})',
+            condition=condition,
+            params=tuple(params) + condition_params,
+        )
+        return {uid: json.loads(flow) for uid, flow in flows}
 
     def get_all_flows_in_profileid_twid(self, profileid, twid):
-        condition = f'profileid = "{profileid}" ' \
-                    f'AND twid = "{twid}"'
-        all_flows: list = self.select('flows', condition=condition)
+        condition, params = self.get_flows_condition(profileid, twid)
+        all_flows: list = self.select(
+            'flows', columns='uid, flow', condition=condition, params=params
+        )
         if not all_flows:
             return False
         res = {}
-        for flow in all_flows:
-            uid = flow[0]
-            flow = flow[1]
+        for uid, flow in all_flows:
             res[uid] = json.loads(flow)
         return res
 
@@ -148,13 +274,13 @@ class SQLiteDB(IObservable):
         Return a list of all the flows in this profileid
         [{'uid':flow},...]
         """
-        condition = f'profileid = "{profileid}"'
-        flows = self.select('flows', condition=condition)
+        condition, params = self.get_flows_condition(profileid)
+        flows = self.select(
+            'flows', columns='uid, flow', condition=condition, params=params
+        )
         all_flows = {}
         if flows:
-            for flow in flows:
-                uid = flow[0]
-                flow: str = flow[1]
+            for uid, flow in flows:
                 all_flows[uid] = json.loads(flow)
 
         return all_flows
@@ -177,11 +303,11 @@ class SQLiteDB(IObservable):
         """
         for uid in uids:
             # add the label to the flow (conn.log flow)
-            query = f'UPDATE flows SET label="{new_label}" WHERE uid="{uid}"'
-            self.execute(query)
+            query = 'UPDATE flows SET label = ? WHERE uid = ?'
+            self.execute(query, (new_label, uid))
             # add the label to the altflow (dns, http, whatever it is)
-            query = f'UPDATE altflows SET label="{new_label}" WHERE uid="{uid}"'
-            self.execute(query)
+            query = 'UPDATE altflows SET label = ? WHERE uid = ?'
+            self.execute(query, (new_label, uid))
 
     def export_labeled_flows(self, output_dir, format):
         if 'tsv' in format:
@@ -241,12 +367,13 @@ class SQLiteDB(IObservable):
         Returns the flow with the given uid
         the flow returned is read from conn.log
         """
-        condition = f'uid = "{uid}"'
+        condition, params = 'uid = ?', (uid,)
         if twid:
-            condition += f'AND twid = "{twid}"'
+            condition += ' AND twid = ?'
+            params += (twid,)
 
-        res = self.select('flows', condition=condition)
-        res = res[0][1] if res else {}
+        res = self.select('flows', columns='flow', condition=condition, params=params)
+        res = res[0][0] if res else {}
         return {uid: res}
 
     def add_flow(
@@ -254,7 +381,7 @@ class SQLiteDB(IObservable):
             ):
         if hasattr(flow, 'aid'):
             parameters = (profileid, twid, flow.uid, json.dumps(asdict(flow)), label, flow.aid)
-            self.execute(
+            self.queue_flow_insert(
                 'INSERT OR REPLACE INTO flows (profileid, twid, uid, flow, label, aid) '
                 'VALUES (?, ?, ?, ?, ?, ?);',
                 parameters,
@@ -262,7 +389,7 @@ class SQLiteDB(IObservable):
         else:
             parameters = (profileid, twid, flow.uid, json.dumps(asdict(flow)), label)
 
-            self.execute(
+            self.queue_flow_insert(
                 'INSERT OR REPLACE INTO flows (profileid, twid, uid, flow, label) '
                 'VALUES (?, ?, ?, ?, ?);',
                 parameters,
@@ -273,15 +400,8 @@ class SQLiteDB(IObservable):
         returns the total number of flows
          in the db for this profileid and twid if given
         """
-        condition = ''
-        if profileid:
-            condition = f'profileid="{profileid}"'
-        elif twid and not profileid:
-            condition += f'twid= "{twid}"'
-        elif profileid and twid:
-            condition += f'AND twid= "{twid}"'
-
-        flows = self.get_count('flows', condition=condition)
+        condition, params = self.get_flows_condition(profileid, twid)
+        flows = self.get_count('flows', condition=condition, params=params)
         # flows += self.get_count('altflows', condition=condition)
         return flows
 
@@ -290,7 +410,7 @@ class SQLiteDB(IObservable):
             self, flow, profileid: str, twid:str, label='benign'
             ):
         parameters = (profileid, twid, flow.uid, json.dumps(asdict(flow)), label, flow.type_)
-        self.execute(
+        self.queue_flow_insert(
             'INSERT OR REPLACE INTO altflows (profileid, twid, uid, flow, label, flow_type) '
             'VALUES (?, ?, ?, ?, ?, ?);',
             parameters,
@@ -333,15 +453,19 @@ class SQLiteDB(IObservable):
         self.execute(query)
 
 
-    def select(self, table_name, columns="*", condition=None):
+    def select(self, table_name, columns="*", condition=None, params=None):
+        """
+        :param params: the values of the ? placeholders in the
+        columns and condition
+        """
         query = f"SELECT {columns} FROM {table_name}"
         if condition:
             query += f" WHERE {condition}"
-        self.execute(query)
+        self.execute(query, params)
         result = self.fetchall()
         return result
 
-    def get_count(self, table, condition=None):
+    def get_count(self, table, condition=None, params=None):
         """
         returns th enumber of matching rows in the given table based on a specific contioins
         """
@@ -350,11 +474,12 @@ class SQLiteDB(IObservable):
         if condition:
             query += f" WHERE {condition}"
 
-        self.execute(query)
+        self.execute(query, params)
         return self.fetchone()[0]
 
 
     def close(self):
+        self.flush_flows()
         self.cursor.close()
         self.conn.close()
 
@@ -384,6 +509,9 @@ class SQLiteDB(IObservable):
         since sqlite is terrible with multi-process applications
         this should be used instead of all calls to commit() and execute()
         """
+        if self.rows_in_write_batch:
+            # the queries of this process should see the rows it queued
+            self.flush_flows()
         try:
             self.cursor_lock.acquire(True)
             #start a transaction
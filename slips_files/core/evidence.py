@@ -57,8 +57,8 @@ class Evidence(ICore):
             else:
                 self.popup_alerts = False
 
-        self.c1 = self.db.subscribe('evidence_added')
-        self.c2 = self.db.subscribe('new_blame')
+        self.c1 = self.db.subscribe('evidence_added', subscriber=self.name)
+        self.c2 = self.db.subscribe('new_blame', subscriber=self.name)
         self.channels = {
             'evidence_added': self.c1,
             'new_blame': self.c2,
@@ -206,33 +206,12 @@ class Evidence(ICore):
         except TypeError:
             # sometimes this function is called before the flow is add to our database
             return [], []
-        domains_to_check_src = []
-        domains_to_check_dst = []
-        try:
-            domains_to_check_src.append(
-                self.db.get_ip_info(flow['saddr'])
-                .get('SNI', [{}])[0]
-                .get('server_name')
-            )
-        except (KeyError, TypeError):
-            pass
-        try:
-            # self.print(f"DNS of src IP {self.column_values['saddr']}:
-            # {self.db.get_dns_resolution(self.column_values['saddr'])}")
-            src_dns_domains = self.db.get_dns_resolution(flow['saddr'])
-            src_dns_domains = src_dns_domains.get('domains', [])
-
-            domains_to_check_src.extend(iter(src_dns_domains))
-        except (KeyError, TypeError):
-            pass
-        try:
-            domains_to_check_dst.append(
-                self.db.get_ip_info(flow['daddr'])
-                .get('SNI', [{}])[0]
-                .get('server_name')
-            )
-        except (KeyError, TypeError):
-            pass
+        src_context = self.db.get_ip_context(flow['saddr'])
+        domains_to_check_src = [src_context['sni']] if src_context['sni'] else []
+        domains_to_check_src.extend(src_context['domains'])
+
+        dst_context = self.db.get_ip_context(flow['daddr'])
+        domains_to_check_dst = [dst_context['sni']] if dst_context['sni'] else []
 
         return domains_to_check_dst, domains_to_check_src
 
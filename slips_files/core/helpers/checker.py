@@ -1,4 +1,5 @@
 import psutil
+import redis
 import sys
 import os
 import subprocess
@@ -84,8 +85,22 @@ class Checker:
             print('Debug and verbose values range from 0 to 3.')
             self.main.terminate_slips()
 
-        # Check if redis server running
-        if not self.main.args.killall and self.main.redis_man.check_redis_database() is False:
+        if (
+                self.main.conf.database_backend() == 'memory'
+                and not self.main.conf.embedded_mode()
+        ):
+            # the modules run in their own processes, they can't see
+            # the memory of each other
+            print('database_backend = memory requires embedded_mode = yes. '
+                  'Stopping Slips.')
+            self.main.terminate_slips()
+
+        # Check if redis server running. it's not used by the memory backend
+        if (
+                not self.main.args.killall
+                and self.main.conf.database_backend() != 'memory'
+                and self.main.redis_man.check_redis_database() is False
+        ):
             print('Redis database is not running. Stopping Slips')
             self.main.terminate_slips()
 
@@ -120,6 +135,10 @@ class Checker:
             self.main.print_version()
             self.main.terminate_slips()
 
+        if self.main.args.metrics:
+            self.print_metrics()
+            self.main.terminate_slips()
+
         if (
             self.main.args.interface
             and self.main.args.blocking
@@ -144,6 +163,34 @@ class Checker:
             print("Can't use -s and -d together")
             self.main.terminate_slips()
 
+    def print_metrics(self):
+        """
+        prints the metrics hash of the slips instance running on the given
+        port. doesn't use the DB class because it flushes the db
+        """
+        from slips_files.core.database.redis_db.metrics_handler import (
+            format_metrics,
+            MetricsHandler
+        )
+        redis_port = int(self.main.args.port) if self.main.args.port else 6379
+        r = redis.StrictRedis(
+            host='localhost',
+            port=redis_port,
+            db=0,
+            charset='utf-8',
+            decode_responses=True,
+        )
+        try:
+            metrics = r.hgetall(MetricsHandler.metrics_key)
+        except redis.exceptions.ConnectionError:
+            print(f'Redis is not running on port {redis_port}.')
+            return
+        if not metrics:
+            print(f'No metrics found in redis port {redis_port}. '
+                  f'Make sure collect_metrics is enabled in slips.conf.')
+            return
+        print(format_metrics(metrics))
+
     def delete_blocking_chain(self):
         # start only the blocking module process and the db
         from multiprocessing import Queue, active_children
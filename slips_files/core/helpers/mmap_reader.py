@@ -0,0 +1,71 @@
+import mmap
+from typing import Iterator
+
+import numpy as np
+
+# how many bytes to count the new lines of at once
+COUNT_CHUNK_SIZE = 2 ** 24
+NEW_LINE = ord('\n')
+
+
+def _read_chunks(reader, chunk_size=2 ** 16):
+    """yields (64 kilobytes) at a time from the file"""
+    while True:
+        b = reader(chunk_size)
+        if not b:
+            break
+        yield b
+
+
+def count_lines(path: str) -> int:
+    """
+    returns the number of \n in the given file.
+    the file is mapped to memory and scanned with numpy instead of being
+    copied to python bytes chunk by chunk
+    """
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return 0
+        except OSError:
+            # not a regular file, can't be mapped to memory
+            return sum(buf.count(b'\n') for buf in _read_chunks(f.raw.read))
+
+        with mm:
+            return _count_new_lines(mm)
+
+
+def _count_new_lines(buffer) -> int:
+    """
+    counts the \n in the given buffer without copying it.
+    the numpy views of the buffer are released when this function returns,
+    so the caller can close it
+    """
+    content = np.frombuffer(buffer, dtype=np.uint8)
+    count = 0
+    for start in range(0, len(content), COUNT_CHUNK_SIZE):
+        chunk = content[start: start + COUNT_CHUNK_SIZE]
+        count += int(np.count_nonzero(chunk == NEW_LINE))
+    return count
+
+
+def read_lines(path: str) -> Iterator[str]:
+    """
+    yields the lines of the given file, including the \n.
+    reading lines from the memory mapped file is faster than iterating
+    over a python text file
+    """
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # empty file or not a regular file
+            for line in f:
+                yield line.decode('utf-8', errors='replace')
+            return
+
+        with mm:
+            for line in iter(mm.readline, b''):
+                yield line.decode('utf-8', errors='replace')
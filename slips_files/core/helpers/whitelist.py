@@ -4,8 +4,10 @@ import validators
 from slips_files.common.imports import *
 from slips_files.common.abstracts.observer import IObservable
 from slips_files.core.output import Output
+from slips_files.common.ip_range_index import IPRangeIndex
 import tld
 import os
+import time
 
 
 class Whitelist(IObservable):
@@ -20,6 +22,13 @@ class Whitelist(IObservable):
         self.org_info_path = 'slips_files/organizations_info/'
         self.ignored_flow_types = ('arp')
         self.db = db
+        # {org: IPRangeIndex of the ranges of this org}
+        self.org_ranges = {}
+        # the parts of the whitelist that apply to flows,
+        # check compile_flows_whitelist()
+        self.flows_whitelist = None
+        self.flows_whitelist_version = None
+        self.last_flows_whitelist_check = 0
 
     def print(self, text, verbose=1, debug=0):
         """
@@ -49,6 +58,9 @@ class Whitelist(IObservable):
            }
         )
 
+    # max seconds between the checks for changes in the whitelist
+    flows_whitelist_check_interval = 5
+
     def read_configuration(self):
         conf = ConfigParser()
         self.whitelist_path = conf.whitelist_path()
@@ -56,8 +68,17 @@ class Whitelist(IObservable):
     def is_whitelisted_asn(self, ip, org):
         ip_data = self.db.get_ip_info(ip)
         try:
-            ip_asn = ip_data['asn']['asnorg']
             org_asn = json.loads(self.db.get_org_info(org, 'asn'))
+        except (KeyError, TypeError):
+            return
+        return self.is_asn_in_org(ip_data, org, org_asn)
+
+    def is_asn_in_org(self, ip_data, org, org_asn: list):
+        """
+        checks if the asn in the given ip info belongs to the given org
+        """
+        try:
+            ip_asn = ip_data['asn']['asnorg']
             if (
                 ip_asn
                 and ip_asn != 'Unknown'
@@ -164,19 +185,104 @@ class Whitelist(IObservable):
         return False
 
 
+    def compile_flows_whitelist(self):
+        """
+        keeps the entries of the whitelist that ignore flows in the
+        memory of this process, as sets and indexes, so checking a flow
+        doesn't read the whole whitelist from the db.
+        compiled again when the whitelist or the info of the orgs change
+        """
+        self.flows_whitelist_version = self.db.get_whitelist_version()
+        self.org_ranges = {}
+        compiled = {
+            # whitelisted ips and macs by the direction they're whitelisted in
+            'src_ips': set(),
+            'dst_ips': set(),
+            # any direction, used for the dns answers
+            'ips': set(),
+            'macs': set(),
+            'src_macs': set(),
+            'dst_macs': set(),
+            # whitelisted domains, their subdomains are whitelisted too
+            'domains': set(),
+            'src_domains': set(),
+            'dst_domains': set(),
+            # [(org, from_, org asn, org domains), ...]
+            'orgs': [],
+        }
+
+        def add(entries: dict, key: str):
+            for entry, info in entries.items():
+                if not self.should_ignore_flows(info['what_to_ignore']):
+                    continue
+                compiled[key].add(entry)
+                if self.should_ignore_from(info['from']):
+                    compiled[f'src_{key}'].add(entry)
+                if self.should_ignore_to(info['from']):
+                    compiled[f'dst_{key}'].add(entry)
+
+        add(self.db.get_whitelist('IPs'), 'ips')
+        add(self.db.get_whitelist('domains'), 'domains')
+        add(self.db.get_whitelist('mac'), 'macs')
+
+        for org, info in self.db.get_whitelist('organizations').items():
+            if not self.should_ignore_flows(info['what_to_ignore']):
+                continue
+            try:
+                org_asn = json.loads(self.db.get_org_info(org, 'asn'))
+                org_domains = json.loads(self.db.get_org_info(org, 'domains'))
+            except (KeyError, TypeError):
+                org_asn, org_domains = [], []
+            compiled['orgs'].append((org, info['from'], org_asn, org_domains))
+
+        self.flows_whitelist = compiled
+
+    def get_flows_whitelist(self) -> dict:
+        """
+        returns the compiled whitelist of flows,
+        compiles it again if the whitelist changed
+        """
+        now = time.time()
+        if now - self.last_flows_whitelist_check >= self.flows_whitelist_check_interval:
+            self.last_flows_whitelist_check = now
+            if self.db.get_whitelist_version() != self.flows_whitelist_version:
+                self.flows_whitelist = None
+
+        if self.flows_whitelist is None:
+            self.compile_flows_whitelist()
+        return self.flows_whitelist
+
+    def is_subdomain_of_any(self, domain: str, whitelisted_domains: set) -> bool:
+        """
+        checks if the given domain or any of its parent
+        domains are in the given set
+        If slack.com was whitelisted, then test.slack.com
+        should be ignored too. But not 'slack.com.test'
+        """
+        if not domain or not whitelisted_domains:
+            return False
+        labels = domain.split('.')
+        return any(
+            '.'.join(labels[i:]) in whitelisted_domains
+            for i in range(len(labels))
+        )
+
     def is_whitelisted_flow(self, flow) -> bool:
         """
         Checks if the src IP or dst IP or domain or organization of this flow is whitelisted.
         """
+        whitelist: dict = self.get_flows_whitelist()
         saddr = flow.saddr
         daddr = flow.daddr
         flow_type = flow.type_
-        # get the domains of the IPs this flow
-        (
-            domains_to_check_dst,
-            domains_to_check_src,
-        ) = self.get_domains_of_flow(saddr, daddr)
-        # check if we have whitelisted domains
+
+        # the domains of the IPs of this flow are read from the db
+        # only if they're needed
+        domains_of_flow = []
+        def get_domains_of_flow():
+            if not domains_of_flow:
+                domains_of_flow.extend(self.get_domains_of_flow(saddr, daddr))
+            return domains_of_flow
 
         # first get the domains of the flows we ewnt to check if whitelisted
         # Domain names are stored in different zeek files using different names.
@@ -186,158 +292,80 @@ class Whitelist(IObservable):
             domains_to_check.append(flow.server_name)
         elif flow_type == 'http':
             domains_to_check.append(flow.host)
-        elif flow_type == 'ssl':
-            domains_to_check.append(flow.subject.replace(
-                'CN=', ''
-            ))
         elif flow_type == 'dns':
             domains_to_check.append(flow.query)
 
-
-        for domain in domains_to_check:
-            if self.is_whitelisted_domain(domain, saddr, daddr, 'flows'):
-                return True
-
-
-
-        if whitelisted_IPs := self.db.get_whitelist('IPs'):
-            # self.print('Check the IPs')
-            # Check if the IPs are whitelisted
-            ips_to_whitelist = list(whitelisted_IPs.keys())
-
-            if saddr in ips_to_whitelist:
-                # The flow has the src IP to whitelist
-                from_ = whitelisted_IPs[saddr]['from']
-                what_to_ignore = whitelisted_IPs[saddr]['what_to_ignore']
-                if ('src' in from_ or 'both' in from_) and (
-                        self.should_ignore_flows(what_to_ignore)
-                ):
-                    # self.print(f"Whitelisting the src IP {column_values['saddr']}")
+        if domains_to_check and whitelist['domains']:
+            for domain in domains_to_check:
+                if self.is_subdomain_of_any(domain, whitelist['domains']):
                     return True
 
-            if daddr in ips_to_whitelist:   # should be if and not elif
-                # The flow has the dst IP to whitelist
-                from_ = whitelisted_IPs[daddr]['from']
-                what_to_ignore = whitelisted_IPs[daddr]['what_to_ignore']
-                if ('dst' in from_ or 'both' in from_) and (
-                    self.should_ignore_flows(what_to_ignore)
-                ):
-                    # self.print(f"Whitelisting the dst IP {column_values['daddr']}")
+            domains_to_check_dst, domains_to_check_src = get_domains_of_flow()
+            for domain in domains_to_check_src:
+                if self.is_subdomain_of_any(domain, whitelist['src_domains']):
+                    return True
+            for domain in domains_to_check_dst:
+                if self.is_subdomain_of_any(domain, whitelist['dst_domains']):
                     return True
 
-            if flow_type == 'dns':
-                # check all answers
-                for answer in flow.answers:
-                    if answer in ips_to_whitelist:
-                        # #TODO the direction doesn't matter here right?
-                        # direction = whitelisted_IPs[daddr]['from']
-                        what_to_ignore = whitelisted_IPs[answer]['what_to_ignore']
-                        if self.should_ignore_flows(what_to_ignore):
-                            # self.print(f"Whitelisting the IP {answer} due to its presence in a dns answer")
-                            return True
+        if saddr in whitelist['src_ips'] or daddr in whitelist['dst_ips']:
+            return True
 
+        if flow_type == 'dns' and whitelist['ips']:
+            # check all answers
+            for answer in flow.answers:
+                if answer in whitelist['ips']:
+                    return True
 
-        if whitelisted_macs := self.db.get_whitelist('mac'):
+        if whitelist['src_macs']:
             # try to get the mac address of the current flow
             src_mac = flow.smac if hasattr(flow, 'smac') else False
-
             if not src_mac:
                 if src_mac := self.db.get_mac_addr_from_profile(
                     f'profile_{saddr}'
                 ):
                     src_mac = src_mac[0]
+            if src_mac and src_mac in whitelist['src_macs']:
+                return True
 
-            if src_mac and src_mac in list(whitelisted_macs.keys()):
-                # the src mac of this flow is whitelisted, but which direction?
-                from_ = whitelisted_macs[src_mac]['from']
-                what_to_ignore = whitelisted_macs[src_mac]['what_to_ignore']
-
-                if (
-                    ('src' in from_ or 'both' in from_)
-                    and
-                    self.should_ignore_flows(what_to_ignore)
-                ):
-                    # self.print(f"The source MAC of this flow {src_mac} is whitelisted")
-                    return True
-
-            dst_mac = flow.dmac if hasattr(flow, 'smac') else False
-            if dst_mac and dst_mac in list(whitelisted_macs.keys()):
-                # the dst mac of this flow is whitelisted, but which direction?
-                from_ = whitelisted_macs[dst_mac]['from']
-                what_to_ignore = whitelisted_macs[dst_mac]['what_to_ignore']
-
-                if (
-                    ('dst' in from_ or 'both' in from_)
-                    and
-                    self.should_ignore_flows(what_to_ignore)
-                ):
-                    # self.print(f"The dst MAC of this flow {dst_mac} is whitelisted")
-                    return True
+        dst_mac = flow.dmac if hasattr(flow, 'smac') else False
+        if dst_mac and dst_mac in whitelist['dst_macs']:
+            return True
 
         if self.is_ignored_flow_type(flow_type):
             return False
 
-        if whitelisted_orgs := self.db.get_whitelist('organizations'):
-            # self.print('Check if the organization is whitelisted')
-            # Check if IP belongs to a whitelisted organization range
-            # Check if the ASN of this IP is any of these organizations
+        for org, from_, org_asn, org_domains in whitelist['orgs']:
+            # get the domains of this flow based on the direction.
+            domains_to_check_dst, domains_to_check_src = get_domains_of_flow()
+            if 'both' in from_:
+                domains_to_check = domains_to_check_src + domains_to_check_dst
+            elif 'src' in from_:
+                domains_to_check = domains_to_check_src
+            elif 'dst' in from_:
+                domains_to_check = domains_to_check_dst
+
+            if 'src' in from_ or 'both' in from_:
+                # Method 1 Check if src IP belongs to a whitelisted organization range
+                if self.is_ip_in_org(saddr, org):
+                    return True
+                # Method 2 Check if the ASN of this src IP is any of these organizations
+                ip_data = self.db.get_ip_context(saddr)['ip_info']
+                if self.is_asn_in_org(ip_data, org, org_asn):
+                    return True
 
-            for org in whitelisted_orgs:
-                from_ = whitelisted_orgs[org]['from']  # src or dst or both
-                what_to_ignore = whitelisted_orgs[org][
-                    'what_to_ignore'
-                ]  # flows, alerts or both
-                # self.print(f'Checking {org}, from:{from_} type {what_to_ignore}')
-
-                if self.should_ignore_flows(what_to_ignore):
-                    # We want to block flows from this org. get the domains of this flow based on the direction.
-                    if 'both' in from_:
-                        domains_to_check = (
-                            domains_to_check_src + domains_to_check_dst
-                        )
-                    elif 'src' in from_:
-                        domains_to_check = domains_to_check_src
-                    elif 'dst' in from_:
-                        domains_to_check = domains_to_check_dst
-
-                    if 'src' in from_ or 'both' in from_:
-                        # Method 1 Check if src IP belongs to a whitelisted organization range
-                        try:
-                            if self.is_ip_in_org(saddr, org):
-                                # self.print(f"The src IP {saddr} is in the ranges of org {org}. Whitelisted.")
-                                return True
-                        except ValueError:
-                            # Some flows don't have IPs, but mac address or just - in some cases
-                            return False
-
-                        # Method 2 Check if the ASN of this src IP is any of these organizations
-                        if self.is_whitelisted_asn(saddr, org):
-                            # this ip belongs to a whitelisted org, ignore flow
-                            # self.print(f"The src IP {saddr} belong to {org}. Whitelisted because of ASN.")
-                            return True
-
-                    if 'dst' in from_ or 'both' in from_:
-                        # Method 1 Check if dst IP belongs to a whitelisted organization range
-                        try:
-                            if self.is_ip_in_org(flow.daddr, org):
-                                # self.print(f"The dst IP {column_values['daddr']} "
-                                #            f"is in the network range of org {org}. Whitelisted.")
-                                return True
-                        except ValueError:
-                            # Some flows don't have IPs, but mac address or just - in some cases
-                            return False
-
-                        # Method 2 Check if the ASN of this dst IP is any of these organizations
-                        if self.is_whitelisted_asn(daddr, org):
-                            # this ip belongs to a whitelisted org, ignore flow
-                            return True
-
-                    # either we're blocking src, dst, or both check the domain of this flow
-                    # Method 3 Check if the domains of this flow belong to this org
-                    # domains to check are usually 1 or 2 domains
-                    for flow_domain in domains_to_check:
-                        if self.is_domain_in_org(flow_domain, org):
-                            return True
+            if 'dst' in from_ or 'both' in from_:
+                if self.is_ip_in_org(daddr, org):
+                    return True
+                ip_data = self.db.get_ip_context(daddr)['ip_info']
+                if self.is_asn_in_org(ip_data, org, org_asn):
+                    return True
+
+            # Method 3 Check if the domains of this flow belong to this org
+            # domains to check are usually 1 or 2 domains
+            for flow_domain in domains_to_check:
+                if self.is_domain_in_org_domains(flow_domain, org, org_domains):
+                    return True
 
         return False
 
@@ -349,6 +377,15 @@ class Whitelist(IObservable):
             org_domains = json.loads(
                 self.db.get_org_info(org, 'domains')
             )
+        except (KeyError, TypeError):
+            return
+        return self.is_domain_in_org_domains(domain, org, org_domains)
+
+    def is_domain_in_org_domains(self, domain, org, org_domains: list):
+        """
+        Checks if the given domain belongs to the given domains of the org
+        """
+        try:
             if org in domain:
                 # self.print(f"The domain of this flow ({domain}) belongs to the domains of {org}")
                 return True
@@ -525,6 +562,8 @@ class Whitelist(IObservable):
         self.db.set_whitelist('domains', whitelisted_domains)
         self.db.set_whitelist('organizations', whitelisted_orgs)
         self.db.set_whitelist('mac', whitelisted_mac)
+        # compile the whitelist of flows again on the next flow
+        self.flows_whitelist = None
 
         return whitelisted_IPs, whitelisted_domains, whitelisted_orgs, whitelisted_mac
 
@@ -536,58 +575,49 @@ class Whitelist(IObservable):
         # check if they are SRC or DST. Not both
         domains_to_check_src = []
         domains_to_check_dst = []
-        try:
-            if ip_data := self.db.get_ip_info(saddr):
-                if sni_info := ip_data.get('SNI', [{}])[0]:
-                    domains_to_check_src.append(sni_info.get('server_name', ''))
-        except (KeyError, TypeError):
-            pass
-        try:
-            # self.print(f"DNS of src IP {column_values['saddr']}: {self.db.get_dns_resolution(column_values['saddr'])}")
-            src_dns_domains = self.db.get_dns_resolution(saddr)
-            src_dns_domains = src_dns_domains.get('domains', [])
-            domains_to_check_src.extend(iter(src_dns_domains))
-        except (KeyError, TypeError):
-            pass
-        try:
-            if ip_data := self.db.get_ip_info(daddr):
-                if sni_info := ip_data.get('SNI', [{}])[0]:
-                    domains_to_check_dst.append(sni_info.get('server_name'))
-        except (KeyError, TypeError):
-            pass
-
-        try:
-            # self.print(f"DNS of dst IP {column_values['daddr']}: {self.db.get_dns_resolution(column_values['daddr'])}")
-            dst_dns_domains = self.db.get_dns_resolution(daddr)
-            dst_dns_domains = dst_dns_domains.get('domains', [])
-            domains_to_check_dst.extend(iter(dst_dns_domains))
-        except (KeyError, TypeError):
-            pass
+        for ip, domains in (
+                (saddr, domains_to_check_src),
+                (daddr, domains_to_check_dst),
+        ):
+            ip_context = self.db.get_ip_context(ip)
+            if ip_context['sni']:
+                domains.append(ip_context['sni'])
+            domains.extend(ip_context['domains'])
 
         return domains_to_check_dst, domains_to_check_src
 
+    def get_org_ranges(self, org) -> IPRangeIndex:
+        """
+        returns the index of the ranges of the given org,
+        the ranges of the orgs don't change while slips is running
+        """
+        if org in self.org_ranges:
+            return self.org_ranges[org]
+
+        # organization IPs are sorted by first octet
+        org_subnets: dict = self.db.get_org_IPs(org)
+        org_ranges = IPRangeIndex()
+        for ranges in org_subnets.values():
+            for ip_range in ranges:
+                org_ranges.add(ip_range)
+        if org_ranges:
+            # the ranges of this org aren't loaded yet if it's empty
+            self.org_ranges[org] = org_ranges
+        return org_ranges
+
     def is_ip_in_org(self, ip:str, org):
         """
         Check if the given ip belongs to the given org
         """
         try:
-            org_subnets: dict = self.db.get_org_IPs(org)
-
-            first_octet:str = utils.get_first_octet(ip)
-            if not first_octet:
-                return
-            ip_obj = ipaddress.ip_address(ip)
-            # organization IPs are sorted by first octet for faster search
-            for range in org_subnets.get(first_octet, []):
-                if ip_obj in ipaddress.ip_network(range):
-                    return True
-        except (KeyError, TypeError):
+            return ip in self.get_org_ranges(org)
+        except (KeyError, TypeError, AttributeError):
             # comes here if the whitelisted org doesn't have
             # info in slips/organizations_info (not a famous org)
             # and ip doesn't have asn info.
             pass
         return False
-    
+
     def profile_has_whitelisted_mac(
             self, profile_ip, whitelisted_macs, is_srcip, is_dstip
     ) -> bool:
@@ -626,7 +656,7 @@ class Whitelist(IObservable):
         returns true if the ASN of the given IP is listed in the ASNs of the given org ASNs
         """
         # Check if the IP in the content of the alert has ASN info in the db
-        ip_data = self.db.get_ip_info(ip)
+        ip_data = self.db.get_ip_context(ip)['ip_info']
         if not ip_data:
             return
         try:
@@ -16,7 +16,6 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 # Contact: eldraco@gmail.com, sebastian.garcia@agents.fel.cvut.cz, stratosphere@aic.fel.cvut.cz
 from pathlib import Path
-from re import split
 import signal
 import sys
 import os
@@ -25,11 +24,16 @@ import datetime
 from watchdog.observers import Observer
 from slips_files.core.helpers.filemonitor import FileEventHandler
 from slips_files.common.imports import *
+from slips_files.common.parsers.zeek_line_parser import ZeekLineParser
+from slips_files.core.helpers import mmap_reader
 import time
 import queue
 import json
 import threading
 import subprocess
+import zlib
+import re
+import heapq
 
 
 SUPPORTED_LOGFILES = (
@@ -49,6 +53,9 @@ SUPPORTED_LOGFILES = (
     'weird'
 )
 
+# used for getting the source ip of json lines without parsing them
+JSON_SADDR_PATTERN = re.compile(r'"(?:id\.orig_h|src_ip)"\s*:\s*"([^"]+)"')
+
 
 
 # Input Process
@@ -66,10 +73,22 @@ class Input(ICore):
             zeek_or_bro=None,
             zeek_dir=None,
             line_type=None,
-            is_profiler_done_event : multiprocessing.Event =None
+            is_profiler_done_event : multiprocessing.Event =None,
+            profiler_queues: list = None,
+            profiler_done_events: list = None,
     ):
         self.input_type = input_type
         self.profiler_queue = profiler_queue
+        # the queues of all the profiler workers, the flows are sharded
+        # between them by saddr, check get_profiler_queue_of()
+        self.profiler_queues: list = profiler_queues or [profiler_queue]
+        # the index of the saddr field in argus lines, set once we read the header
+        self.argus_saddr_idx = 3
+        # {queue index: [msgs]} the msgs waiting to be sent in 1 batch
+        # to each profiler worker, check give_profiler()
+        self.profiler_batches = {}
+        # {queue index: time the first msg of its batch was added}
+        self.profiler_batches_start = {}
         # in case of reading from stdin, the user must tell slips what
         # type of lines is the input using -f <type>
         self.line_type: str = line_type
@@ -97,7 +116,15 @@ class Input(ICore):
             target=self.remove_old_zeek_files, daemon=True
         )
         self.open_file_handlers = {}
-        self.c1 = self.db.subscribe('remove_old_files')
+        # min heap of (ts, filename) of the lines cached in self.cache_lines
+        # used for sending the zeek lines in order. check get_earliest_line()
+        self.lines_heap = []
+        # parses the zeek lines and keeps the fields of each tab separated file
+        self.zeek_parser = ZeekLineParser()
+        # how often to refresh the list of zeek files and check the files
+        # we reached the end of for new lines, in seconds
+        self.zeek_files_check_interval = 1
+        self.c1 = self.db.subscribe('remove_old_files', subscriber=self.name)
         self.channels = {'remove_old_files': self.c1}
         self.timeout = None
         # zeek rotated files to be deleted after a period of time
@@ -107,10 +134,15 @@ class Input(ICore):
             daemon=True
         )
         # used to give the profiler the total amount of flows to read with the first flow only
-        self.is_first_flow = True
+        # the profiler workers that already got the total amount of flows
+        self.workers_given_total_flows = set()
         # is set by the profiler to tell this proc that we it is done processing
         # the input process and shut down and close the profiler queue no issue
         self.is_profiler_done_event = is_profiler_done_event
+        # one event per profiler worker
+        self.profiler_done_events: list = (
+                profiler_done_events or [is_profiler_done_event]
+        )
 
     def is_done_processing(self):
         """
@@ -123,9 +155,12 @@ class Input(ICore):
         self.print(f"Telling Profiler to stop because "
                    f"no more input is arriving.",
                    log_to_logfiles_only=True)
-        self.profiler_queue.put('stop')
+        self.flush_profiler_batches()
+        for profiler_queue in self.profiler_queues:
+            profiler_queue.put('stop')
         self.print(f"Waiting for Profiler to stop.", log_to_logfiles_only=True)
-        self.is_profiler_done_event.wait()
+        for profiler_done_event in self.profiler_done_events:
+            profiler_done_event.wait()
         self.print(f"Input is done processing.", log_to_logfiles_only=True)
         self.done_processing.release()
 
@@ -138,12 +173,15 @@ class Input(ICore):
         self.enable_rotation = conf.rotation()
         self.rotation_period = conf.rotation_period()
         self.keep_rotated_files_for = conf.keep_rotated_files_for()
+        self.profiler_queue_batch_size = conf.profiler_queue_batch_size()
+        self.profiler_queue_batch_timeout = conf.profiler_queue_batch_timeout()
 
     def stop_queues(self):
         """Stops the profiler queue"""
         # By default if a process is not the creator of the queue then on exit it
         # will attempt to join the queue’s background thread. The process can call cancel_join_thread() to make join_thread() do nothing.
-        self.profiler_queue.cancel_join_thread()
+        for profiler_queue in self.profiler_queues:
+            profiler_queue.cancel_join_thread()
 
     def read_nfdump_output(self) -> int:
         """
@@ -210,7 +248,8 @@ class Input(ICore):
         except KeyError:
             # First time opening this file.
             try:
-                file_handler = open(filename, 'r')
+                # read the file in blocks of 1MB instead of the default 8KB
+                file_handler = open(filename, 'r', buffering=2 ** 20)
                 lock = threading.Lock()
                 lock.acquire()
                 self.open_file_handlers[filename] = file_handler
@@ -233,26 +272,7 @@ class Input(ICore):
         used only by zeek log files
         :param line: can be a json or a json serialized dict
         """
-        if self.is_zeek_tabs:
-            # It is not JSON format. It is tab format line.
-            nline = zeek_line
-            nline_list = nline.split('\t') if '\t' in nline else split(r'\s{2,}', nline)
-            timestamp = nline_list[0]
-        else:
-            try:
-                nline = json.loads(zeek_line)
-            except json.decoder.JSONDecodeError:
-                return False, False
-            # In some Zeek files there may not be a ts field
-            # Like in some weird smb files
-            timestamp = nline.get('ts', 0)
-        try:
-            timestamp = float(timestamp)
-        except ValueError:
-            # this ts doesnt repr a float value, ignore it
-            return False, False
-
-        return timestamp, nline
+        return self.zeek_parser.parse_ts(zeek_line, self.is_zeek_tabs)
 
     def cache_nxt_line_in_file(self, filename: str):
         """
@@ -268,24 +288,40 @@ class Input(ICore):
             # We have still something to send, do not read the next line from this file
             return False
 
-        # We don't have any waiting line for this file, so proceed
-        try:
-            zeek_line = file_handle.readline()
-        except ValueError:
-            # remover thread just finished closing all old handles.
-            # comes here if I/O operation failed due to a closed file.
-            # to get the new dict of open handles.
-            return False
+        # We don't have any waiting line for this file, so proceed.
+        # skip the comments and the lines without a valid ts, the file
+        # should stay in the heap until it really has no lines left,
+        # otherwise the lines of the other files would be sent before its
+        # next flow
+        while True:
+            try:
+                zeek_line = file_handle.readline()
+            except ValueError:
+                # remover thread just finished closing all old handles.
+                # comes here if I/O operation failed due to a closed file.
+                # to get the new dict of open handles.
+                return False
 
-        # Did the file end?
-        if not zeek_line or zeek_line.startswith('#'):
-            # We reached the end of one of the files that we were reading.
-            # Wait for more lines to come from another file
-            return False
+            # Did the file end?
+            if not zeek_line:
+                # We reached the end of one of the files that we were reading.
+                # Wait for more lines to come from another file
+                return False
 
-        timestamp, nline = self.get_ts_from_line(zeek_line)
-        if not timestamp:
-            return False
+            if zeek_line.startswith('#'):
+                if self.zeek_parser.is_fields_header(zeek_line):
+                    self.zeek_parser.set_fields(filename, zeek_line)
+                    # the profilers read the fields of the lines of
+                    # this file using it, it's sent before them
+                    self.give_profiler(
+                        {'type': filename, 'data': zeek_line},
+                        to_all_profilers=True
+                    )
+                continue
+
+            timestamp, nline = self.get_ts_from_line(zeek_line)
+            if timestamp:
+                break
 
 
         self.file_time[filename] = timestamp
@@ -294,6 +330,7 @@ class Input(ICore):
             'type': filename,
             'data': nline
         }
+        heapq.heappush(self.lines_heap, (timestamp, filename))
         return True
 
     def reached_timeout(self) -> bool:
@@ -319,20 +356,23 @@ class Input(ICore):
 
     def get_earliest_line(self):
         """
-        loops through all the caches lines and returns the line with the earliest ts
+        returns the cached line with the earliest ts and the file it belongs to
+        using self.lines_heap
         """
+        if len(self.lines_heap) != len(self.file_time):
+            # the cached lines were changed without updating the heap
+            self.lines_heap = [(ts, file) for file, ts in self.file_time.items()]
+            heapq.heapify(self.lines_heap)
+
         # Now read lines in order. The line with the earliest timestamp first
-        files_sorted_by_ts = sorted(self.file_time, key=self.file_time.get)
         try:
             # get the file that has the earliest flow
-            file_with_earliest_flow = files_sorted_by_ts[0]
+            _, file_with_earliest_flow = self.lines_heap[0]
         except IndexError:
-            # No more sorted keys. Just loop waiting for more lines
+            # No more cached lines. Just loop waiting for more lines
             # It may happen that we check all the files in the folder,
             # and there is still no files for us.
-            # To cover this case, just refresh the list of files
-            self.zeek_files = self.db.get_all_zeek_files()
-            # time.sleep(1)
+            # To cover this case, read_zeek_files() refreshes the list of files
             return False, False
 
         # to fix the problem of evidence being generated BEFORE their corresponding flows are added to our db
@@ -348,21 +388,35 @@ class Input(ICore):
         earliest_line = self.cache_lines[file_with_earliest_flow]
         return earliest_line, file_with_earliest_flow
 
+    def get_zeek_files_to_read(self) -> list:
+        """returns the zeek files in the db that slips supports"""
+        return [
+            file for file in self.db.get_all_zeek_files()
+            if not self.is_ignored_file(file)
+        ]
+
     def read_zeek_files(self) -> int:
-        self.zeek_files = self.db.get_all_zeek_files()
+        """
+        merges the lines of all zeek files by their ts and sends them
+        to the profiler in order.
+        each file has 1 cached line at a time, the cached lines are kept in a
+        min heap so only the file whose line was just sent is read again.
+        the files that reached their end and the list of zeek files are only
+        checked every zeek_files_check_interval or when we have no lines
+        """
+        self.zeek_files = self.get_zeek_files_to_read()
         self.open_file_handlers = {}
         self.file_time = {}
         self.cache_lines = {}
+        self.lines_heap = []
         # Try to keep track of when was the last update so we stop this reading
         self.last_updated_file_time = datetime.datetime.now()
+        # the files to read 1 line from
+        files_to_read = self.zeek_files
+        last_files_check = time.time()
         while not self.should_stop():
             self.check_if_time_to_del_rotated_files()
-            # Go to all the files generated by Zeek and read 1
-            # line from each of them
-            for filename in self.zeek_files:
-                if self.is_ignored_file(filename):
-                    continue
-
+            for filename in files_to_read:
                 # reads 1 line from the given file and cache it
                 # from in self.cache_lines
                 self.cache_nxt_line_in_file(filename)
@@ -372,6 +426,12 @@ class Input(ICore):
 
             earliest_line, file_with_earliest_flow = self.get_earliest_line()
             if not file_with_earliest_flow:
+                # no new lines for now, don't keep the batched ones waiting
+                self.flush_profiler_batches()
+                # Get the new list of files. Since new files may have been
+                # created by Zeek while we were processing them.
+                self.zeek_files = self.get_zeek_files_to_read()
+                files_to_read = self.zeek_files
                 continue
 
             # self.print('	> Sent Line: {}'.format(earliest_line), 0, 3)
@@ -384,34 +444,29 @@ class Input(ICore):
             # Delete this line from the cache and the time list
             del self.cache_lines[file_with_earliest_flow]
             del self.file_time[file_with_earliest_flow]
-            # Get the new list of files. Since new files may have been created by
-            # Zeek while we were processing them.
-            self.zeek_files = self.db.get_all_zeek_files()
+            heapq.heappop(self.lines_heap)
+
+            # the rest of the files still have a cached line
+            files_to_read = [file_with_earliest_flow]
+            if time.time() - last_files_check >= self.zeek_files_check_interval:
+                # Get the new list of files. Since new files may have been created by
+                # Zeek while we were processing them.
+                # and check the files that had no new lines
+                last_files_check = time.time()
+                self.zeek_files = self.get_zeek_files_to_read()
+                files_to_read = self.zeek_files
 
         self.close_all_handles()
         return self.lines
 
-    def _make_gen(self, reader):
-        """yeilds (64 kilobytes) at a time from the file"""
-        while True:
-            b = reader(2 ** 16)
-            if not b:
-                break
-            yield b
-
     def get_flows_number(self, file: str) -> int:
         """
         returns the number of flows/lines in a given file
         """
         # using wc -l doesn't count last line of the file if it does not have end of line character
         # using  grep -c "" returns incorrect line numbers sometimes
-        # this method is the most efficient and accurate i found online
-        # https://stackoverflow.com/a/68385697/11604069
-
-
-        with open(file, "rb") as f:
-            # counts the occurances of \n in a file
-            count = sum(buf.count(b"\n") for buf in self._make_gen(f.raw.read))
+        # counts the occurances of \n in the memory mapped file
+        count = mmap_reader.count_lines(file)
 
         if hasattr(self, 'is_zeek_tabs') and self.is_zeek_tabs:
             # subtract comment lines in zeek tab files,
@@ -501,9 +556,8 @@ class Input(ICore):
             # slips supports reading zeek json conn.log only using stdin,
             # tabs aren't supported
             if self.line_type == 'zeek':
-                try:
-                    line = json.loads(line)
-                except json.decoder.JSONDecodeError:
+                line = self.zeek_parser.parse_json(line)
+                if line is None:
                     self.print('Invalid json line')
                     continue
 
@@ -513,7 +567,14 @@ class Input(ICore):
                 'data': line
             }
             self.print(f'	> Sent Line: {line_info}', 0, 3)
-            self.give_profiler(line_info)
+            # the first argus line is used by every profiler
+            # worker to define the columns
+            self.give_profiler(
+                line_info,
+                to_all_profilers=(self.line_type == 'argus' and self.lines == 0)
+            )
+            # we don't know when the next line is coming, don't keep this one waiting
+            self.flush_profiler_batches()
             self.lines += 1
             self.print('Done reading 1 flow.\n ', 0, 3)
         return True
@@ -524,15 +585,18 @@ class Input(ICore):
         self.db.set_input_metadata({'total_flows': self.total_flows})
 
         self.lines = 0
-        with open(self.given_path) as file_stream:
+        file_stream = mmap_reader.read_lines(self.given_path)
+        try:
             # read first line to determine the type of line, tab or comma separated
-            t_line = file_stream.readline()
+            t_line = next(file_stream, '')
             type_ = 'argus-tabs' if '\t' in t_line else 'argus'
             line = {
                 'type': type_,
                 'data': t_line
             }
-            self.give_profiler(line)
+            self.set_argus_saddr_idx(t_line)
+            # every profiler worker needs the header to define the columns
+            self.give_profiler(line, to_all_profilers=True)
             self.lines += 1
 
             # go through the rest of the file
@@ -547,6 +611,9 @@ class Input(ICore):
 
                 self.lines += 1
                 if self.testing: break
+        finally:
+            # closes the memory mapped file
+            file_stream.close()
 
         self.is_done_processing()
         return True
@@ -554,7 +621,8 @@ class Input(ICore):
     def handle_suricata(self):
         self.total_flows = self.get_flows_number(self.given_path)
         self.db.set_input_metadata({'total_flows': self.total_flows})
-        with open(self.given_path) as file_stream:
+        file_stream = mmap_reader.read_lines(self.given_path)
+        try:
             for t_line in file_stream:
                 line = {
                     'type': 'suricata',
@@ -566,6 +634,9 @@ class Input(ICore):
                 self.lines += 1
                 if self.testing:
                     break
+        finally:
+            # closes the memory mapped file
+            file_stream.close()
         self.is_done_processing()
         return True
 
@@ -864,7 +935,7 @@ class Input(ICore):
         if self.line_type != 'zeek':
             return
 
-        channel = self.db.subscribe('new_module_flow')
+        channel = self.db.subscribe('new_module_flow', subscriber=self.name)
         self.channels.update({'new_module_flow': channel})
         while not self.should_stop():
             # the CYST module will send msgs to this channel when it read s a new flow from the CYST UDS
@@ -888,32 +959,133 @@ class Input(ICore):
                 }
                 self.print(f'   > Sent Line: {line_info}', 0, 3)
                 self.give_profiler(line_info)
+                self.flush_profiler_batches()
                 self.lines += 1
                 self.print('Done reading 1 CYST flow.\n ', 0, 3)
                 time.sleep(2)
 
         self.is_done_processing()
 
-    def give_profiler(self, line):
+    def set_argus_saddr_idx(self, header: str):
+        """
+        sets the index of the saddr field using the header of the argus file
+        """
+        separator = ',' if header.count(',') > 5 else '\t'
+        for idx, field in enumerate(header.strip().split(separator)):
+            if 'srca' in field.lower():
+                self.argus_saddr_idx = idx
+                return
+
+    def get_saddr_of_line(self, line: dict) -> str:
+        """
+        returns the source ip of the given line without fully parsing it.
+        returns '' if we can't find it
+        """
+        data = line['data']
+        if isinstance(data, dict):
+            # zeek json lines are already parsed by get_ts_from_line()
+            return data.get('id.orig_h', data.get('src_ip', ''))
+
+        if not isinstance(data, str):
+            return ''
+
+        if data.startswith('{'):
+            match = JSON_SADDR_PATTERN.search(data)
+            return match.group(1) if match else ''
+
+        line_type = line.get('line_type') or line['type']
+        try:
+            if line_type == 'nfdump':
+                return data.split(',')[3]
+            if line_type in ('argus', 'argus-tabs'):
+                separator = ',' if data.count(',') > 5 else '\t'
+                return data.split(separator)[self.argus_saddr_idx]
+            # zeek tab separated lines, the fields are ts uid id.orig_h ...
+            saddr_idx = self.zeek_parser.get_field_index(
+                line['type'], 'id.orig_h', default=2
+            )
+            return data.split('\t')[saddr_idx]
+        except IndexError:
+            return ''
+
+    def get_profiler_queue_of(self, line: dict):
+        """
+        returns the queue of the profiler worker that owns the profile of the
+        saddr of the given line, so all the flows of the same profile
+        are profiled by the same worker in the order we read them
+        """
+        return self.profiler_queues[self.get_profiler_worker_of(line)]
+
+    def get_profiler_worker_of(self, line: dict) -> int:
+        """returns the index of the profiler worker that owns the given line"""
+        if len(self.profiler_queues) == 1:
+            return 0
+        saddr: str = self.get_saddr_of_line(line)
+        return zlib.crc32(saddr.encode()) % len(self.profiler_queues)
+
+    def flush_profiler_batch(self, worker: int):
+        """sends the batched msgs of the given profiler worker in 1 queue msg"""
+        batch: list = self.profiler_batches.pop(worker, None)
+        self.profiler_batches_start.pop(worker, None)
+        if batch:
+            # when the queue is full, the default behaviour is to block if necessary until a free slot is available
+            self.profiler_queues[worker].put(batch)
+
+    def flush_profiler_batches(self):
+        """sends the batched msgs of all the profiler workers"""
+        for worker in list(self.profiler_batches):
+            self.flush_profiler_batch(worker)
+
+    def put_in_profiler_queue(self, worker: int, msg: dict):
+        """
+        sends the given msg to the queue of the given profiler worker, or
+        adds it to the worker's batch if profiler_queue_batch_size > 1
+        """
+        if self.profiler_queue_batch_size == 1:
+            # when the queue is full, the default behaviour is to block if necessary until a free slot is available
+            self.profiler_queues[worker].put(msg)
+            return
+
+        batch: list = self.profiler_batches.setdefault(worker, [])
+        batch.append(msg)
+        now = time.time()
+        batch_start = self.profiler_batches_start.setdefault(worker, now)
+        if (
+                len(batch) >= self.profiler_queue_batch_size
+                or now - batch_start >= self.profiler_queue_batch_timeout
+        ):
+            self.flush_profiler_batch(worker)
+
+    def give_profiler(self, line, to_all_profilers=False):
         """
         sends the given txt/dict to the profilerqueue for process
         sends the total amount of flows to process with the first flow only
+        :param to_all_profilers: send the line to all the profiler workers
+         instead of the one that owns its saddr. used for headers
         """
-        to_send = {
-            'line': line,
-            'input_type': self.input_type
-        }
-        # send the total flows slips is going to read to the profiler
-        # the profiler will give it to output() for initialising the progress bar
-        # in case of interface and pcaps, we don't know the total_flows beforehand
-        # and we don't print a pbar
-        if self.is_first_flow and hasattr(self, 'total_flows'):
-            self.is_first_flow = False
-            to_send.update({
-                'total_flows': self.total_flows,
-            })
-        # when the queue is full, the default behaviour is to block if necessary until a free slot is available
-        self.profiler_queue.put(to_send)
+        workers = (
+            range(len(self.profiler_queues)) if to_all_profilers
+            else [self.get_profiler_worker_of(line)]
+        )
+        for worker in workers:
+            to_send = {
+                'line': line,
+                'input_type': self.input_type
+            }
+            # send the total flows slips is going to read to the profiler
+            # the profiler will give it to output() for initialising the progress bar
+            # in case of interface and pcaps, we don't know the total_flows beforehand
+            # and we don't print a pbar
+            # every worker gets it with its first flow
+            if (
+                    hasattr(self, 'total_flows')
+                    and worker not in self.workers_given_total_flows
+            ):
+                self.workers_given_total_flows.add(worker)
+                to_send.update({
+                    'total_flows': self.total_flows,
+                })
+            self.put_in_profiler_queue(worker, to_send)
 
     def main(self):
         utils.drop_root_privs()
@@ -1,7 +1,6 @@
-from re import split
-
 from slips_files.common.abstracts.input_type import IInputType
 from slips_files.common.slips_utils import utils
+from slips_files.common.parsers.zeek_line_parser import ZeekLineParser
 from slips_files.core.flows.zeek import (
     Conn, DNS, HTTP, SSL,
     SSH, DHCP, FTP, SMTP,
@@ -12,7 +11,9 @@ from slips_files.core.flows.zeek import (
 
 
 class ZeekJSON(IInputType):
-    def __init__(self): pass
+    def __init__(self):
+        self.parser = ZeekLineParser()
+
     def process_line(self, new_line: dict):
         """
         Process one zeek line(new_line) and extract columns
@@ -29,14 +30,15 @@ class ZeekJSON(IInputType):
             # slips thinks it's reading a conn file
             # because we use the file path as the file 'type'
             # to fix this, only use the file name as file 'type'
-            file_type = file_type.split('/')[-1]
+            # the type of each file is cached so we don't check its name every line
+            file_type = self.parser.get_log_type(file_type)
 
         if ts := line.get('ts', False):
             starttime = utils.convert_to_datetime(ts)
         else:
             starttime = ''
 
-        if 'conn' in file_type:
+        if file_type == 'conn':
             self.flow: Conn = Conn(
                 starttime,
                 line.get('uid', False),
@@ -59,7 +61,7 @@ class ZeekJSON(IInputType):
             # orig_bytes: The number of payload bytes the src sent.
             # orig_ip_bytes: the length of the header + the payload
 
-        elif 'dns' in file_type:
+        elif file_type == 'dns':
             self.flow: DNS = DNS(
                 starttime,
                 line.get('uid', False),
@@ -73,7 +75,7 @@ class ZeekJSON(IInputType):
                 line.get('TTLs', ''),
             )
 
-        elif 'http' in file_type:
+        elif file_type == 'http':
             self.flow: HTTP = HTTP(
                 starttime,
                 line.get('uid', False),
@@ -93,7 +95,7 @@ class ZeekJSON(IInputType):
                 line.get('resp_fuids', ''),
             )
 
-        elif 'ssl' in file_type:
+        elif file_type == 'ssl':
             self.flow: SSL = SSL(
                 starttime,
                 line.get('uid', False),
@@ -123,7 +125,7 @@ class ZeekJSON(IInputType):
                 line.get('is_DoH', 'false'),
 
             )
-        elif 'ssh' in file_type:
+        elif file_type == 'ssh':
             self.flow: SSH = SSH(
                 starttime,
                 line.get('uid', False),
@@ -146,7 +148,7 @@ class ZeekJSON(IInputType):
 
 
             )
-        elif 'dhcp' in file_type:
+        elif file_type == 'dhcp':
             self.flow: DHCP = DHCP(
                 starttime,
                 line.get('uids', []),
@@ -160,7 +162,7 @@ class ZeekJSON(IInputType):
                 line.get('requested_addr', ''),
 
             )
-        elif 'ftp' in file_type:
+        elif file_type == 'ftp':
             self.flow: FTP = FTP(
                 starttime,
                 line.get('uids', []),
@@ -169,7 +171,7 @@ class ZeekJSON(IInputType):
 
                 line.get('data_channel.resp_p', False),
             )
-        elif 'smtp' in file_type:
+        elif file_type == 'smtp':
             self.flow: SMTP = SMTP(
                 starttime,
                 line.get('uid', ''),
@@ -178,7 +180,7 @@ class ZeekJSON(IInputType):
 
                 line.get('last_reply', '')
             )
-        elif 'tunnel' in file_type:
+        elif file_type == 'tunnel':
             self.flow: Tunnel = Tunnel(
                 starttime,
                 line.get('uid', ''),
@@ -192,7 +194,7 @@ class ZeekJSON(IInputType):
                 line.get('action', ''),
             )
 
-        elif 'notice' in file_type:
+        elif file_type == 'notice':
             self.flow: Notice = Notice(
                 starttime,
                 line.get('uid', ''),
@@ -209,7 +211,7 @@ class ZeekJSON(IInputType):
                 line.get('dst', ''),
             )
 
-        elif 'files.log' in file_type:
+        elif file_type == 'files':
             self.flow: Files = Files(
                 starttime,
                 line.get('conn_uids', [''])[0],
@@ -226,7 +228,7 @@ class ZeekJSON(IInputType):
                 line.get('tx_hosts',''),
                 line.get('rx_hosts',''),
             )
-        elif 'arp' in file_type:
+        elif file_type == 'arp':
             self.flow: ARP = ARP(
                 starttime,
                 line.get('uid', ''),
@@ -242,7 +244,7 @@ class ZeekJSON(IInputType):
 
             )
 
-        elif 'software' in file_type:
+        elif file_type == 'software':
             self.flow: Software = Software(
                 starttime,
                 line.get('uid', ''),
@@ -256,7 +258,7 @@ class ZeekJSON(IInputType):
                 line.get('version.minor', ''),
             )
 
-        elif 'weird' in file_type:
+        elif file_type == 'weird':
             self.flow: Weird =  Weird(
                 starttime,
                 line.get('uid', ''),
@@ -273,222 +275,234 @@ class ZeekJSON(IInputType):
 
 class ZeekTabs(IInputType):
     separator = '\t'
-    def __init__(self): pass
+    def __init__(self):
+        self.parser = ZeekLineParser()
 
 
     def process_line(self, new_line: dict) :
         """
         Process the tab line from zeek.
+        the #fields header of each file is sent by the input process before
+        the lines of the file, the fields are read using it when it's there
         """
         line = new_line['data']
+        if self.parser.is_fields_header(line):
+            self.parser.set_fields(new_line['type'], line)
+            return False
+
         line = line.rstrip('\n')
         # the data is either \t separated or space separated
-        # zeek files that are space separated are either separated by 2 or 3 spaces so we can't use python's split()
-        # using regex split, split line when you encounter more than 2 spaces in a row
-        line = line.split('\t') if '\t' in line else split(r'\s{2,}', line)
+        line = self.parser.split_tabs_line(line)
 
         if ts := line[0]:
             starttime = utils.convert_to_datetime(ts)
         else:
             starttime = ''
 
-        def get_value_at(index: int, default_=''):
+        # {field_name: index} or None if the file has no #fields header
+        fields = self.parser.fields.get(new_line['type'])
+
+        def get_value_of(field: str, index: int, default_=''):
+            """
+            :param index: the index of the field in the default zeek
+            logs, used when the file has no #fields header
+            """
+            if fields is not None:
+                index = fields.get(field)
+                if index is None:
+                    return default_
             try:
                 val = line[index]
                 return default_ if val == '-' else val
             except IndexError:
                 return default_
 
-        # uid = get_value_at(1)
-        # saddr = get_value_at(2, '')
-        # saddr = get_value_at(3, '')
-
         if 'conn.log' in new_line['type']:
             self.flow: Conn = Conn(
                 starttime,
-                get_value_at(1, False),
-                get_value_at(2),
-                get_value_at(4),
+                get_value_of('uid', 1, False),
+                get_value_of('id.orig_h', 2),
+                get_value_of('id.resp_h', 4),
 
-                float(get_value_at(8, 0)),
+                float(get_value_of('duration', 8, 0)),
 
-                get_value_at(6, False),
-                get_value_at(7),
+                get_value_of('proto', 6, False),
+                get_value_of('service', 7),
 
-                int(get_value_at(3)),
-                int(get_value_at(5)),
+                int(get_value_of('id.orig_p', 3)),
+                int(get_value_of('id.resp_p', 5)),
 
-                int(get_value_at(16, 0)),
-                int(get_value_at(18, 0)),
+                int(get_value_of('orig_pkts', 16, 0)),
+                int(get_value_of('resp_pkts', 18, 0)),
 
-                int(get_value_at(9, 0)),
-                int(get_value_at(10, 0)),
+                int(get_value_of('orig_bytes', 9, 0)),
+                int(get_value_of('resp_bytes', 10, 0)),
 
-                get_value_at(21),
-                get_value_at(22),
+                get_value_of('orig_l2_addr', 21),
+                get_value_of('resp_l2_addr', 22),
 
-                get_value_at(11),
-                get_value_at(15),
+                get_value_of('conn_state', 11),
+                get_value_of('history', 15),
             )
 
 
         elif 'dns.log' in new_line['type']:
             self.flow: DNS = DNS(
                 starttime,
-                get_value_at(1, False),
-                get_value_at(2),
-                get_value_at(4),
+                get_value_of('uid', 1, False),
+                get_value_of('id.orig_h', 2),
+                get_value_of('id.resp_h', 4),
 
-                get_value_at(9),
+                get_value_of('query', 9),
 
-                get_value_at(11),
-                get_value_at(13),
-                get_value_at(15),
+                get_value_of('qclass_name', 11),
+                get_value_of('qtype_name', 13),
+                get_value_of('rcode_name', 15),
 
-                get_value_at(21),
-                get_value_at(22),
+                get_value_of('answers', 21),
+                get_value_of('TTLs', 22),
             )
 
         elif 'http.log' in new_line['type']:
             self.flow: HTTP = HTTP(
                 starttime,
-                get_value_at(1, False),
-                get_value_at(2),
-                get_value_at(4),
+                get_value_of('uid', 1, False),
+                get_value_of('id.orig_h', 2),
+                get_value_of('id.resp_h', 4),
 
-                get_value_at(7),
-                get_value_at(8),
-                get_value_at(9),
+                get_value_of('method', 7),
+                get_value_of('host', 8),
+                get_value_of('uri', 9),
 
-                get_value_at(11),
-                get_value_at(12),
+                get_value_of('version', 11),
+                get_value_of('user_agent', 12),
 
-                int(get_value_at(13, 0)),
-                int(get_value_at(14, 0)),
+                int(get_value_of('request_body_len', 13, 0)),
+                int(get_value_of('response_body_len', 14, 0)),
 
-                get_value_at(15),
-                get_value_at(16),
+                get_value_of('status_code', 15),
+                get_value_of('status_msg', 16),
 
-                get_value_at(28),
-                get_value_at(26),
+                get_value_of('resp_mime_types', 28),
+                get_value_of('resp_fuids', 26),
 
             )
 
         elif 'ssl.log' in new_line['type']:
             self.flow: SSL = SSL(
                 starttime,
-                get_value_at(1, False),
-                get_value_at(2),
-                get_value_at(4),
+                get_value_of('uid', 1, False),
+                get_value_of('id.orig_h', 2),
+                get_value_of('id.resp_h', 4),
 
-                get_value_at(6),
-                get_value_at(3),
-                get_value_at(5),
+                get_value_of('version', 6),
+                get_value_of('id.orig_p', 3),
+                get_value_of('id.resp_p', 5),
 
-                get_value_at(7),
-                get_value_at(10),
+                get_value_of('cipher', 7),
+                get_value_of('resumed', 10),
 
-                get_value_at(13),
-                get_value_at(14),
-                get_value_at(15),
+                get_value_of('established', 13),
+                get_value_of('cert_chain_fuids', 14),
+                get_value_of('client_cert_chain_fuids', 15),
 
-                get_value_at(16),
+                get_value_of('subject', 16),
 
-                get_value_at(17),
-                get_value_at(20),
-                get_value_at(8),
-                get_value_at(9),
+                get_value_of('issuer', 17),
+                get_value_of('validation_status', 20),
+                get_value_of('curve', 8),
+                get_value_of('server_name', 9),
 
-                get_value_at(21),
-                get_value_at(22),
-                get_value_at(23),
+                get_value_of('ja3', 21),
+                get_value_of('ja3s', 22),
+                get_value_of('is_DoH', 23),
             )
 
         elif 'ssh.log' in new_line['type']:
             # Zeek can put in column 7 the auth success if it has one
             # or the auth attempts only. However if the auth
             # success is there, the auth attempts are too.
-            auth_success = get_value_at(7)
+            auth_success = get_value_of('auth_success', 7)
             if 'T' in auth_success:
                 self.flow: SSH = SSH(
                     starttime,
-                    get_value_at(1, False),
-                    get_value_at(2),
-                    get_value_at(4),
+                    get_value_of('uid', 1, False),
+                    get_value_of('id.orig_h', 2),
+                    get_value_of('id.resp_h', 4),
 
-                    get_value_at(6),
-                    get_value_at(7),
-                    get_value_at(8),
+                    get_value_of('version', 6),
+                    get_value_of('auth_success', 7),
+                    get_value_of('auth_attempts', 8),
 
-                    get_value_at(10),
-                    get_value_at(11),
-                    get_value_at(12),
-                    get_value_at(13),
+                    get_value_of('client', 10),
+                    get_value_of('server', 11),
+                    get_value_of('cipher_alg', 12),
+                    get_value_of('mac_alg', 13),
 
-                    get_value_at(14),
-                    get_value_at(15),
+                    get_value_of('compression_alg', 14),
+                    get_value_of('kex_alg', 15),
 
-                    get_value_at(16),
-                    get_value_at(17),
+                    get_value_of('host_key_alg', 16),
+                    get_value_of('host_key', 17),
                 )
             else:
                 self.flow: SSH = SSH(
                     starttime,
-                    get_value_at(1, False),
-                    get_value_at(2),
-                    get_value_at(4),
+                    get_value_of('uid', 1, False),
+                    get_value_of('id.orig_h', 2),
+                    get_value_of('id.resp_h', 4),
 
-                    get_value_at(6),
+                    get_value_of('version', 6),
                     '',
-                    get_value_at(7),
+                    get_value_of('auth_attempts', 7),
 
-                    get_value_at(9),
-                    get_value_at(10),
-                    get_value_at(11),
-                    get_value_at(12),
+                    get_value_of('client', 9),
+                    get_value_of('server', 10),
+                    get_value_of('cipher_alg', 11),
+                    get_value_of('mac_alg', 12),
 
-                    get_value_at(13),
-                    get_value_at(14),
+                    get_value_of('compression_alg', 13),
+                    get_value_of('kex_alg', 14),
 
-                    get_value_at(15),
-                    get_value_at(16),
+                    get_value_of('host_key_alg', 15),
+                    get_value_of('host_key', 16),
                 )
         elif 'dhcp.log' in new_line['type']:
             self.flow: DHCP = DHCP(
                 starttime,
-                get_value_at(1, False),
-                get_value_at(2),
-                get_value_at(3),   #  daddr in dhcp.log is the server_addr at index 3 not 4 like most log files
+                get_value_of('uids', 1, False),
+                get_value_of('client_addr', 2),
+                get_value_of('server_addr', 3),   #  daddr in dhcp.log is the server_addr at index 3 not 4 like most log files
 
-                get_value_at(2), # client_addr is the same as saddr
-                get_value_at(3),
-                get_value_at(5),
+                get_value_of('client_addr', 2), # client_addr is the same as saddr
+                get_value_of('server_addr', 3),
+                get_value_of('host_name', 5),
 
-                get_value_at(4),
-                get_value_at(8),
+                get_value_of('mac', 4),
+                get_value_of('requested_addr', 8),
 
             )
         elif 'smtp.log' in new_line['type']:
             self.flow: SMTP = SMTP(
                 starttime,
-                get_value_at(1, False),
-                get_value_at(2),
-                get_value_at(4),
+                get_value_of('uid', 1, False),
+                get_value_of('id.orig_h', 2),
+                get_value_of('id.resp_h', 4),
 
-                get_value_at(20)
+                get_value_of('last_reply', 20)
             )
         elif 'tunnel.log' in new_line['type']:
             self.flow: Tunnel = Tunnel(
                 starttime,
-                get_value_at(1, False),
-                get_value_at(2),
-                get_value_at(4),
+                get_value_of('uid', 1, False),
+                get_value_of('id.orig_h', 2),
+                get_value_of('id.resp_h', 4),
 
-                get_value_at(3),
-                get_value_at(5),
+                get_value_of('id.orig_p', 3),
+                get_value_of('id.resp_p', 5),
 
-                get_value_at(6),
-                get_value_at(7),
+                get_value_of('tunnel_type', 6),
+                get_value_of('action', 7),
 
             )
         elif 'notice.log' in new_line['type']:
@@ -496,65 +510,65 @@ class ZeekTabs(IInputType):
             # instead they have src and dst
             self.flow: Notice = Notice(
                 starttime,
-                get_value_at(1, False),
-                get_value_at(13, '-'),    #  src field
-                get_value_at(4),
+                get_value_of('uid', 1, False),
+                get_value_of('src', 13, '-'),    #  src field
+                get_value_of('id.resp_h', 4),
 
-                get_value_at(3),
-                get_value_at(5, ''),
+                get_value_of('id.orig_p', 3),
+                get_value_of('id.resp_p', 5, ''),
 
 
-                get_value_at(10), # note
-                get_value_at(11), # msg
+                get_value_of('note', 10), # note
+                get_value_of('msg', 11), # msg
 
-                get_value_at(15), # scanned_port
-                get_value_at(13, '-'), # scanning_ip
+                get_value_of('p', 15), # scanned_port
+                get_value_of('src', 13, '-'), # scanning_ip
 
-                get_value_at(14), # dst
+                get_value_of('dst', 14), # dst
 
             )
         elif 'files.log' in new_line['type']:
             self.flow: Files = Files(
                 starttime,
-                get_value_at(4, False),
-                get_value_at(2),
-                get_value_at(3),
+                get_value_of('conn_uids', 4, False),
+                get_value_of('tx_hosts', 2),
+                get_value_of('rx_hosts', 3),
 
-                get_value_at(13),
-                get_value_at(19),
+                get_value_of('seen_bytes', 13),
+                get_value_of('md5', 19),
 
-                get_value_at(5),
-                get_value_at(7),
-                get_value_at(19),
+                get_value_of('source', 5),
+                get_value_of('analyzers', 7),
+                get_value_of('sha1', 19),
 
-                get_value_at(2),
-                get_value_at(3),
+                get_value_of('tx_hosts', 2),
+                get_value_of('rx_hosts', 3),
             )
         elif 'arp.log' in new_line['type']:
             self.flow: ARP = ARP(
                 starttime,
-                get_value_at(1, False),
-                get_value_at(4),
-                get_value_at(5),
+                get_value_of('operation', 1, False),
+                get_value_of('orig_h', 4),
+                get_value_of('resp_h', 5),
 
-                get_value_at(2),
-                get_value_at(3),
+                get_value_of('src_mac', 2),
+                get_value_of('dst_mac', 3),
 
-                get_value_at(6),
-                get_value_at(7),
+                get_value_of('orig_hw', 6),
+                get_value_of('resp_hw', 7),
 
-                get_value_at(1),
+                get_value_of('operation', 1),
             )
 
         elif 'weird' in new_line['type']:
             self.flow: Weird = Weird(
                 starttime,
-                get_value_at(1, False),
-                get_value_at(2),
-                get_value_at(4),
+                get_value_of('uid', 1, False),
+                get_value_of('id.orig_h', 2),
+                get_value_of('id.resp_h', 4),
 
-                get_value_at(6),
-                get_value_at(7),
+                get_value_of('name', 6),
+                get_value_of('addl', 7),
             )
         else:
             return False
@@ -20,6 +20,7 @@ import multiprocessing
 from dataclasses import asdict
 import queue
 import sys
+import time
 import ipaddress
 import pprint
 from datetime import datetime
@@ -29,6 +30,10 @@ from slips_files.common.abstracts.core import ICore
 from slips_files.core.helpers.flow_handler import FlowHandler
 from slips_files.core.helpers.symbols_handler import SymbolHandler
 from slips_files.core.helpers.whitelist import Whitelist
+from slips_files.core.database.parquet_db.flow_archive import (
+    FlowArchive,
+    is_pyarrow_installed,
+)
 from slips_files.core.input_profilers.argus import Argus
 from slips_files.core.input_profilers.nfdump import Nfdump
 from slips_files.core.input_profilers.suricata import Suricata
@@ -61,7 +66,8 @@ class Profiler(ICore):
     def init(self,
              is_profiler_done: multiprocessing.Semaphore = None,
              profiler_queue=None,
-             is_profiler_done_event : multiprocessing.Event =None
+             is_profiler_done_event : multiprocessing.Event =None,
+             worker_id: int = 0,
              ):
         # when profiler is done processing, it releases this semaphore,
         # that's how the process_manager knows it's done
@@ -70,6 +76,13 @@ class Profiler(ICore):
         self.done_processing: multiprocessing.Semaphore = is_profiler_done
         # every line put in this queue should be profiled
         self.profiler_queue = profiler_queue
+        # when using more than 1 profiler worker,
+        # each one profiles the flows of a subset of the saddrs
+        self.worker_id = worker_id
+        if worker_id:
+            # each worker needs its own name to get its own copy of the
+            # msgs when using redis streams
+            self.name = f'Profiler_{worker_id}'
         self.timeformat = None
         self.input_type = False
         self.whitelisted_flows_ctr = 0
@@ -77,15 +90,19 @@ class Profiler(ICore):
         self.whitelist = Whitelist(self.logger, self.db)
         # Read the configuration
         self.read_configuration()
+        self.flow_archive = self.create_flow_archive()
         self.symbol = SymbolHandler(self.logger, self.db)
         # there has to be a timeout or it will wait forever and never receive a new line
         self.timeout = 0.0000001
-        self.c1 = self.db.subscribe('reload_whitelist')
+        self.c1 = self.db.subscribe('reload_whitelist', subscriber=self.name)
         self.channels = {
             'reload_whitelist': self.c1,
         }
         # is set by this proc to tell input proc that we are dne processing and it can exit no issue
         self.is_profiler_done_event = is_profiler_done_event
+        # number of flows whose redis writes are queued and not yet flushed
+        self.flows_in_write_batch = 0
+        self.last_write_batch_flush = time.time()
 
 
     def read_configuration(self):
@@ -95,6 +112,23 @@ class Profiler(ICore):
         self.analysis_direction = conf.analysis_direction()
         self.label = conf.label()
         self.width = conf.get_tw_width_as_float()
+        self.write_batch_size = conf.profiler_write_batch_size()
+        if conf.embedded_mode():
+            # the modules running in this process share the db obj, their
+            # writes and msgs shouldn't be queued in the batch of the profiler
+            self.write_batch_size = 1
+        self.write_batch_timeout = conf.profiler_write_batch_timeout()
+        self.archive_flows = conf.archive_flows()
+        self.flow_archive_row_group_size = conf.flow_archive_row_group_size()
+
+    def create_flow_archive(self):
+        if not self.archive_flows:
+            return None
+        if not is_pyarrow_installed():
+            self.print('pyarrow is not installed, the flows will not be '
+                       'written to the flow archive', 0, 1)
+            return None
+        return FlowArchive(self.output_dir, self.flow_archive_row_group_size)
 
     def convert_starttime_to_epoch(self):
         try:
@@ -165,10 +199,16 @@ class Profiler(ICore):
         # For this 'forward' profile, find the id in the database of the tw where the flow belongs.
         self.twid = self.db.get_timewindow(self.flow.starttime, self.profileid)
         self.flow_parser.twid = self.twid
+        self.flush_write_batch_if_tw_modified(self.profileid, self.twid)
 
         # Create profiles for all ips we see
         self.db.addProfile(self.profileid, self.flow.starttime, self.width)
         self.store_features_going_out()
+        if self.flow_archive:
+            # archived once, using the profile and tw of its saddr
+            self.flow_archive.add_flow(
+                self.flow, self.profileid, self.twid, self.label
+            )
         if self.analysis_direction == 'all':
             self.handle_in_flows()
 
@@ -229,6 +269,7 @@ class Profiler(ICore):
             and 'nfdump' not in self.flow.type_
         ):
             return
+        self.flush_write_batch_if_tw_modified(profileid, twid)
         symbol = self.symbol.compute(self.flow, self.twid, 'InTuples')
 
         # Add the src tuple using the src ip, and dst port
@@ -268,6 +309,12 @@ class Profiler(ICore):
         rev_profileid, rev_twid = self.get_rev_profile()
         self.store_features_going_in(rev_profileid, rev_twid)
 
+    def is_zeek_fields_header(self, line: dict) -> bool:
+        return (
+            self.input_type == 'zeek-tabs'
+            and self.input.parser.is_fields_header(line['data'])
+        )
+
     def define_separator(self, line: dict, input_type: str):
         """
         :param line: dict with the line as read from the input file/dir
@@ -294,8 +341,75 @@ class Profiler(ICore):
             return input_type
 
 
+    def is_write_batch_enabled(self) -> bool:
+        return self.write_batch_size > 1
+
+    def init_write_batch(self):
+        """
+        starts queueing the redis writes of the profiled flows if
+        batching is enabled in slips.conf
+        """
+        if not self.is_write_batch_enabled():
+            return
+        self.db.start_write_batch()
+        self.flows_in_write_batch = 0
+        self.last_write_batch_flush = time.time()
+
+    def flush_write_batch_if_needed(self, new_flows=0):
+        """
+        sends the queued writes to redis once we have write_batch_size
+        flows queued, or the oldest queued write waited for more than
+        write_batch_timeout
+        :param new_flows: number of flows profiled since the last call
+        """
+        if not self.is_write_batch_enabled():
+            return
+
+        self.flows_in_write_batch += new_flows
+        now = time.time()
+        if (
+            self.flows_in_write_batch < self.write_batch_size
+            and now - self.last_write_batch_flush < self.write_batch_timeout
+        ):
+            return
+
+        self.flush_write_batch()
+
+    def flush_write_batch(self):
+        self.db.flush_write_batch()
+        self.flows_in_write_batch = 0
+        self.last_write_batch_flush = time.time()
+
+    def flush_write_batch_if_tw_modified(self, profileid: str, twid: str):
+        """
+        the modules read the state of a tw when they receive its tw_modified
+        msg, and the msgs queued in the batch are received after the whole
+        batch is in redis. so the batch is flushed before adding a flow to
+        a tw that an earlier flow of the batch was added to. this way the
+        modules see the tw after every flow, same as without batching
+        """
+        if (
+            self.is_write_batch_enabled()
+            and self.db.is_tw_modified_in_write_batch(profileid, twid)
+        ):
+            self.flush_write_batch()
+
     def shutdown_gracefully(self):
         self.print(f"Stopping. Total lines read: {self.rec_lines}", log_to_logfiles_only=True)
+        if self.is_write_batch_enabled():
+            # make sure all the queued writes are in the db before
+            # telling the rest of slips that we're done
+            self.db.stop_write_batch()
+        # the flows queued to be inserted in the sqlite db
+        self.db.flush_flows()
+        if self.flow_archive:
+            self.flow_archive.flush()
+        cache_stats = self.db.get_last_tw_cache_stats()
+        self.print(
+            f"Last TW cache hits: {cache_stats['hits']}, "
+            f"misses: {cache_stats['misses']}",
+            log_to_logfiles_only=True
+        )
         # By default if a process(profiler) is not the creator of the queue(profiler_queue) then on
         # exit it will attempt to join the queue’s background thread.
         # this causes a deadlock
@@ -349,6 +463,11 @@ class Profiler(ICore):
             self.supported_pbar = False
             return
 
+        self.supported_pbar = True
+        if self.worker_id != 0:
+            # all workers update the same pbar, only the first one inits it
+            return
+
         # Find the number of flows we're going to receive of input received
         self.notify_observers({
             'bar': 'init',
@@ -357,75 +476,110 @@ class Profiler(ICore):
                 'total_flows': total_flows
             }
         })
-        self.supported_pbar = True
 
     def pre_main(self):
         utils.drop_root_privs()
 
     def main(self):
+        self.init_write_batch()
         while not self.should_stop():
             try:
                 # this msg can be a str only when it's a 'stop' msg indicating
                 # that this module should stop
-                msg: dict = self.profiler_queue.get(timeout=1, block=False)
+                msg = self.profiler_queue.get(timeout=1)
                 # ALYA, DO NOT REMOVE THIS CHECK
                 # without it, there's no way thi module will know it's time to
                 # stop and no new fows are coming
                 if self.check_for_stop_msg(msg):
                     return 1
-                line: dict = msg['line']
-                input_type: str = msg['input_type']
-                total_flows: int = msg.get('total_flows', 0)
             except queue.Empty:
+                # don't keep the queued writes waiting when no flows are coming
+                self.flush_write_batch_if_needed()
+                self.db.flush_flows_if_needed()
+                if self.flow_archive:
+                    self.flow_archive.flush_if_needed()
                 continue
             except Exception as e:
                 # ValueError is raised when the queue is closed
                 continue
 
-            # TODO who is putting this True here?
-            if line == True:
-                continue
-
-            # Received new input data
-            self.print(f'< Received Line: {line}', 2, 0)
-            self.rec_lines += 1
-
-            # self.input_type is set only once by define_separator
-            # once we know the type, no need to check each line for it
-            if not self.input_type:
-                # Find the type of input received
-                self.input_type = self.define_separator(line, input_type)
-                self.init_pbar(input_type, total_flows)
-
-            # What type of input do we have?
-            if not self.input_type:
-                # the above define_type can't define the type of input
-                self.print("Can't determine input type.")
-                return False
+            self.set_queue_depth_metric()
+            # the input process sends a list of msgs when
+            # profiler_queue_batch_size > 1
+            msgs: list = msg if isinstance(msg, list) else [msg]
+            for msg in msgs:
+                if self.process_msg(msg) is False:
+                    return False
+        return 1
 
+    def set_queue_depth_metric(self):
+        """stores the number of msgs waiting in the queue of this worker"""
+        if not self.collect_metrics:
+            return
+        try:
+            depth = self.profiler_queue.qsize()
+        except NotImplementedError:
+            # qsize() isn't supported on macOS
+            return
+        self.db.set_metric(f'profiler_queue_depth:{self.worker_id}', depth)
 
-            # only create the input obj once,
-            # the rest of the flows will use the same input handler
-            if not hasattr(self, 'input'):
-                self.input = SUPPORTED_INPUT_TYPES[self.input_type]()
+    def process_msg(self, msg: dict):
+        """
+        profiles the line in the given msg sent by the input process
+        returns False if the type of the input can't be determined
+        """
+        try:
+            line: dict = msg['line']
+            input_type: str = msg['input_type']
+            total_flows: int = msg.get('total_flows', 0)
+        except Exception:
+            return
 
-            # get the correct input type class and process the line based on it
-            self.flow = self.input.process_line(line)
-            if self.flow:
-                self.add_flow_to_profile()
+        # TODO who is putting this True here?
+        if line == True:
+            return
 
+        # Received new input data
+        self.print(f'< Received Line: {line}', 2, 0)
+        self.rec_lines += 1
+
+        # self.input_type is set only once by define_separator
+        # once we know the type, no need to check each line for it
+        if not self.input_type:
+            # Find the type of input received
+            self.input_type = self.define_separator(line, input_type)
+            self.init_pbar(input_type, total_flows)
+
+        # What type of input do we have?
+        if not self.input_type:
+            # the above define_type can't define the type of input
+            self.print("Can't determine input type.")
+            return False
 
-            # now that one flow is processed tell output.py to update the bar
-            if self.supported_pbar:
-                self.notify_observers({'bar': 'update'})
 
-            # listen on this channel in case whitelist.conf is changed,
-            # we need to process the new changes
-            if self.get_msg('reload_whitelist'):
-                # if whitelist.conf is edited using pycharm
-                # a msg will be sent to this channel on every keypress,
-                # because pycharm saves file automatically
-                # otherwise this channel will get a msg only when
-                # whitelist.conf is modified and saved to disk
-                self.whitelist.read_whitelist()
-        return 1
+        # only create the input obj once,
+        # the rest of the flows will use the same input handler
+        if not hasattr(self, 'input'):
+            self.input = SUPPORTED_INPUT_TYPES[self.input_type]()
+
+        # get the correct input type class and process the line based on it
+        self.flow = self.input.process_line(line)
+        if self.flow:
+            self.add_flow_to_profile()
+            self.flush_write_batch_if_needed(new_flows=1)
+
+
+        # now that one flow is processed tell output.py to update the bar.
+        # the #fields headers of the zeek tab files aren't counted as flows
+        if self.supported_pbar and not self.is_zeek_fields_header(line):
+            self.notify_observers({'bar': 'update'})
+
+        # listen on this channel in case whitelist.conf is changed,
+        # we need to process the new changes
+        if self.get_msg('reload_whitelist'):
+            # if whitelist.conf is edited using pycharm
+            # a msg will be sent to this channel on every keypress,
+            # because pycharm saves file automatically
+            # otherwise this channel will get a msg only when
+            # whitelist.conf is modified and saved to disk
+            self.whitelist.read_whitelist()
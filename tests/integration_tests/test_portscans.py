@@ -90,4 +90,52 @@ def test_vertical(path, output_dir, redis_port):
     log_file = os.path.join(output_dir, alerts_file)
     assert is_evidence_present(log_file, expected_evidence) == True
 
-    shutil.rmtree(output_dir)
\ No newline at end of file
+    shutil.rmtree(output_dir)
+
+def run_slips_with_write_batch_size(
+        path, output_dir, redis_port, write_batch_size
+) -> list:
+    """
+    runs slips on the given file with the given profiler_write_batch_size
+    returns the evidence in alerts.log
+    """
+    output_dir = create_output_dir(output_dir)
+    config_file = os.path.join(output_dir, 'slips.conf')
+    with open('config/slips.conf') as default_config:
+        with open(config_file, 'w') as config:
+            for line in default_config:
+                if line.startswith('profiler_write_batch_size'):
+                    line = f'profiler_write_batch_size = {write_batch_size}\n'
+                config.write(line)
+
+    output_file = os.path.join(output_dir, 'slips_output.txt')
+    command = f'./slips.py -e 1 -t -f {path} -o {output_dir} ' \
+              f'-P {redis_port} -c {config_file} > {output_file} 2>&1'
+    run_slips(command)
+    assert has_errors(output_dir) is False
+
+    with open(os.path.join(output_dir, alerts_file)) as f:
+        # the alerts have the time they were generated
+        evidence = [line for line in f if 'real time' not in line]
+    shutil.rmtree(output_dir)
+    return evidence
+
+
+@pytest.mark.parametrize(
+    'path',
+    ['dataset/test11-portscan.binetflow'],
+)
+def test_write_batch_detects_the_same_scans(path):
+    """
+    the portscan and icmp scan detections check the number of flows of
+    each tw when it's modified, batching the writes of the profiler
+    shouldn't make them skip any threshold
+    """
+    evidence = run_slips_with_write_batch_size(
+        path, 'test_ps_without_write_batch/', 7896, 1
+    )
+    batched_evidence = run_slips_with_write_batch_size(
+        path, 'test_ps_with_write_batch/', 7897, 50
+    )
+    assert evidence
+    assert sorted(batched_evidence) == sorted(evidence)
@@ -5,8 +5,12 @@ from tests.module_factory import ModuleFactory
 import redis
 import os
 import json
+import ipaddress
 import time
 import pytest
+from unittest.mock import patch
+from slips_files.common.msg_codec import MsgCodec
+from slips_files.core.database.redis_db.metrics_handler import format_metrics
 
 # random values for testing
 profileid = 'profile_192.168.1.1'
@@ -237,4 +241,453 @@ def test_update_max_threat_level(
     ):
     db.set_max_threat_level(profileid, max_threat_level)
     assert db.update_max_threat_level(
-        profileid, cur_threat_level) == expected_max
\ No newline at end of file
+        profileid, cur_threat_level) == expected_max
+
+def test_write_batch():
+    """tests that batched writes are readable before and after flushing"""
+    batch_profileid = 'profile_192.168.1.20'
+    hash_id = f'{batch_profileid}_{twid}'
+    db.start_write_batch()
+    db.update_times_contacted('8.8.8.8', 'Dst', batch_profileid, twid)
+    db.update_times_contacted('8.8.8.8', 'Dst', batch_profileid, twid)
+    # the write is queued and not in redis yet
+    assert db.r.hget(hash_id, 'DstIPs') is None
+    assert db.get_write_batch_len() > 0
+    assert json.loads(db.getDstIPsfromProfileTW(batch_profileid, twid)) == {'8.8.8.8': 2}
+
+    db.stop_write_batch()
+    assert db.is_write_batch_active() is False
+    assert json.loads(db.r.hget(hash_id, 'DstIPs')) == {'8.8.8.8': 2}
+
+
+def test_native_tw_storage():
+    """tests that the native tw layout returns the same data as the json one"""
+    native_profileid = 'profile_192.168.1.30'
+    native_flow = Conn(
+        '1601998398.945854', '5678', '192.168.1.30', '8.8.8.8',
+        5, 'TCP', 'dhcp', 80, 88, 20, 20, 20, 20, '', '', 'S0', ''
+    )
+    db.rdb.native_tw_storage = True
+    try:
+        db.add_port(native_profileid, twid, native_flow, 'Client', 'Dst')
+        db.add_port(native_profileid, twid, native_flow, 'Client', 'Dst')
+        db.add_ips(native_profileid, twid, native_flow, 'Client')
+        ports = db.get_data_from_profile_tw(
+            native_profileid, twid, 'Dst', 'Not Established', 'TCP', 'Client', 'Ports'
+        )
+        assert ports['88']['totalflows'] == 2
+        assert ports['88']['dstips']['8.8.8.8']['uid'] == ['5678', '5678']
+        assert db.get_tw_data_sizes(
+            native_profileid, twid, 'Dst', 'Not Established', 'TCP', 'Client', 'IPs'
+        ) == {'8.8.8.8': 1}
+        ip_data = db.get_data_of_tw_entry(
+            native_profileid, twid, 'Dst', 'Not Established', 'TCP', 'Client', 'IPs', '8.8.8.8'
+        )
+        assert ip_data['dstports'] == {'88': 20}
+        assert json.loads(db.getDstIPsfromProfileTW(native_profileid, twid)) == {'8.8.8.8': 1}
+    finally:
+        db.rdb.native_tw_storage = False
+
+
+def test_native_tw_storage_reads_queued_writes():
+    """the native reads see the updates still queued in the write batch"""
+    native_profileid = 'profile_192.168.1.31'
+    native_flow = Conn(
+        '1601998398.945854', '5679', '192.168.1.31', '8.8.8.8',
+        5, 'TCP', 'dhcp', 80, 88, 20, 20, 20, 20, '', '', 'S0', ''
+    )
+    db.rdb.native_tw_storage = True
+    db.start_write_batch()
+    try:
+        db.add_port(native_profileid, twid, native_flow, 'Client', 'Dst')
+        assert db.get_tw_data_sizes(
+            native_profileid, twid, 'Dst', 'Not Established', 'TCP', 'Client', 'Ports'
+        ) == {'88': 1}
+    finally:
+        db.stop_write_batch()
+        db.rdb.native_tw_storage = False
+
+
+def test_close_modified_tws():
+    """tests that the tws are closed using the in-process heap"""
+    closing_profileid = 'profile_192.168.1.40'
+    profileid_tw = f'{closing_profileid}_{twid}'
+    db.rdb.tw_closing_check_every = 2
+    try:
+        db.set_slips_internal_time(0)
+        db.markProfileTWAsModified(closing_profileid, twid, '')
+        # not closed yet, the internal time didn't pass the tw width
+        db.close_modified_tws()
+        assert not db.r.sismember('ClosedTW', profileid_tw)
+
+        db.set_slips_internal_time(time.time() + db.rdb.width + 10)
+        db.markProfileTWAsModified(closing_profileid, twid, '')
+        # the check is done on the 2nd modification
+        db.markProfileTWAsModified('profile_192.168.1.41', twid, '')
+        assert db.r.sismember('ClosedTW', profileid_tw)
+        assert db.r.zscore('ModifiedTW', profileid_tw) is None
+    finally:
+        db.rdb.tw_closing_check_every = 500
+        db.set_slips_internal_time(0)
+
+
+def test_tw_is_scheduled_for_closing_once():
+    """the heap has 1 entry per tw no matter how many times it's modified"""
+    profileid_tw = f'profile_192.168.1.42_{twid}'
+    heap_size = len(db.rdb.tws_modification_heap)
+    for modification_time in range(1000):
+        db.rdb.schedule_tw_closing(profileid_tw, modification_time)
+    assert len(db.rdb.tws_modification_heap) == heap_size + 1
+    assert db.rdb.tws_last_modification[profileid_tw] == 999
+
+
+def test_last_tw_cache():
+    """tests that flows in the last tw are served from the cache"""
+    cached_profileid = 'profile_192.168.1.50'
+    starttime = 1601998398.0
+    twid = db.get_timewindow(starttime, cached_profileid)
+    hits = db.get_last_tw_cache_stats()['hits']
+    assert db.get_timewindow(starttime + 1, cached_profileid) == twid
+    assert db.get_last_tw_cache_stats()['hits'] == hits + 1
+
+    # a newer tw invalidates the cache
+    newer_twid = db.get_timewindow(starttime + db.rdb.width + 1, cached_profileid)
+    assert newer_twid != twid
+    assert db.get_timewindow(starttime + db.rdb.width + 2, cached_profileid) == newer_twid
+    assert db.get_last_tw_cache_stats()['hits'] == hits + 2
+
+
+def test_known_profiles_cache():
+    """tests that already seen profiles are answered from the local cache"""
+    known_profileid = 'profile_192.168.1.60'
+    assert db.addProfile(known_profileid, '1601998398.0', 3600) is True
+    assert db.addProfile(known_profileid, '1601998398.0', 3600) is False
+    # remove it from redis to make sure redis isn't asked again
+    db.r.srem('profiles', known_profileid)
+    assert db.getProfileIdFromIP(ipaddress.ip_address('192.168.1.60')) == known_profileid
+    db.r.sadd('profiles', known_profileid)
+    # profiles added by other processes are found in redis
+    db.r.sadd('profiles', 'profile_192.168.1.61')
+    assert db.getProfileIdFromIP(ipaddress.ip_address('192.168.1.61')) == 'profile_192.168.1.61'
+    assert db.getProfileIdFromIP(ipaddress.ip_address('192.168.1.62')) is False
+
+
+def test_known_profiles_cache_is_bounded():
+    cache_size = db.rdb.known_profiles_cache_size
+    db.rdb.known_profiles_cache_size = 2
+    db.rdb.known_profiles.clear()
+    try:
+        for ip in ('192.168.1.63', '192.168.1.64', '192.168.1.65'):
+            db.addProfile(f'profile_{ip}', '1601998398.0', 3600)
+        assert len(db.rdb.known_profiles) == 2
+        assert 'profile_192.168.1.63' not in db.rdb.known_profiles
+        # the forgotten profiles are still found in redis
+        assert db.has_profile('profile_192.168.1.63')
+    finally:
+        db.rdb.known_profiles_cache_size = cache_size
+
+
+def test_streams_transport():
+    """tests that the msgs sent using streams are acked and replayed"""
+    db.rdb.use_streams = True
+    try:
+        channel = db.subscribe('new_letters')
+        db.publish('new_letters', 'first')
+        db.publish_many('new_letters', ['second', 'third'])
+        msg = db.get_message(channel, timeout=0.1)
+        assert msg['channel'] == 'new_letters'
+        assert msg['data'] == 'first'
+        assert db.get_message(channel)['data'] == 'second'
+
+        lag = db.get_streams_lag()['new_letters'][channel.group]
+        assert lag == {'pending': 3, 'lag': 0}
+
+        # a restarted subscriber gets the msgs that weren't acked
+        restarted_channel = db.subscribe('new_letters')
+        assert [
+            db.get_message(restarted_channel)['data'] for _ in range(3)
+        ] == ['first', 'second', 'third']
+        assert db.get_message(restarted_channel) is None
+        assert db.get_streams_lag()['new_letters'][channel.group]['pending'] == 0
+    finally:
+        db.rdb.use_streams = False
+
+
+def test_streams_group_per_subscriber():
+    """
+    tests that the modules subscribing in the same process get their own
+    consumer group, so each one gets every msg
+    """
+    db.rdb.use_streams = True
+    try:
+        readers = {
+            subscriber: db.subscribe_to_channels(
+                ['new_letters'], subscriber=subscriber
+            )
+            for subscriber in ('ModuleA', 'ModuleB')
+        }
+        db.publish('new_letters', 'sent_to_both')
+        for subscriber, reader in readers.items():
+            assert db.get_message(reader, timeout=0.1)['data'] == 'sent_to_both'
+            assert reader.group == subscriber
+        groups = db.get_streams_lag()['new_letters']
+        assert {'ModuleA', 'ModuleB'} <= set(groups)
+    finally:
+        db.rdb.use_streams = False
+
+
+def test_only_trimmed_pending_msgs_are_dropped():
+    db.rdb.use_streams = True
+    try:
+        reader = db.subscribe('new_letters', subscriber='TrimmedReader')
+        db.publish_many('new_letters', ['trimmed', 'kept'])
+        assert db.get_message(reader, timeout=0.1)['data'] == 'trimmed'
+        assert db.get_message(reader)['data'] == 'kept'
+        # the msgs aren't acked, the restarted subscriber replays them
+        restarted_reader = db.subscribe('new_letters', subscriber='TrimmedReader')
+        stream = db.rdb.get_stream_key('new_letters')
+        pending = db.r.xpending_range(
+            stream, 'TrimmedReader', '-', '+', 10
+        )
+        trimmed_id = pending[0]['message_id']
+        db.r.xdel(stream, trimmed_id)
+
+        # the deleted msg is acked and only the one that is still in the
+        # stream is replayed
+        assert db.get_message(restarted_reader)['data'] == 'kept'
+        pending_ids = [
+            msg['message_id']
+            for msg in db.r.xpending_range(stream, 'TrimmedReader', '-', '+', 10)
+        ]
+        assert trimmed_id not in pending_ids
+        assert len(pending_ids) == 1
+    finally:
+        db.rdb.use_streams = False
+
+
+@pytest.mark.parametrize('codec', ['json', 'msgpack'])
+def test_new_flow_msg_codec(codec):
+    """tests that the new_flow msgs are encoded once and decoded by any subscriber"""
+    codec_flow = Conn(
+        '1601998398.945854', 'uid_of_codec_flow', '192.168.1.70', '8.8.8.8',
+        5, 'TCP', 'dhcp', 80, 88, 20, 20, 20, 20, '', '', 'Established', ''
+    )
+    db.rdb.msg_codec = MsgCodec(codec)
+    channel = db.subscribe('new_flow')
+    try:
+        db.add_flow(codec_flow, 'profile_192.168.1.70', twid, label='benign')
+        msg = db.get_message(channel, timeout=0.1)
+        while msg and msg['type'] != 'message':
+            msg = db.get_message(channel, timeout=0.1)
+
+        data = MsgCodec().decode(msg['data'])
+        assert data['profileid'] == 'profile_192.168.1.70'
+        assert data['flow']['uid'] == 'uid_of_codec_flow'
+        assert data['flow']['daddr'] == '8.8.8.8'
+        assert data['flow']['module_labels'] == {}
+    finally:
+        db.rdb.msg_codec = MsgCodec()
+        channel.close()
+
+
+def wait_for_subscribers(channel: str, subscribers: int):
+    """the subscriptions are done by redis asynchronously"""
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        if dict(db.r.pubsub_numsub(channel))[channel] >= subscribers:
+            return
+        time.sleep(0.01)
+
+
+def get_next_msg(channel) -> dict:
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        msg = db.get_message(channel, timeout=0.1)
+        if msg and msg['type'] == 'message':
+            return msg
+
+
+def test_msgpack_msgs_are_sent_as_raw_bytes():
+    """
+    tests that the bytes >= 0x80 of the msgpack msgs aren't re-encoded
+    when publishing, and that the subscribers get the same bytes back
+    """
+    pytest.importorskip('msgpack')
+    codec = MsgCodec('msgpack')
+    data = {'uid': 'Cé', 'bytes': 200, 'dur': 0.5, 'neg': -3}
+    encoded = codec.encode(data)
+    assert any(byte >= 0x80 for byte in encoded)
+
+    subscribers = dict(db.r.pubsub_numsub('new_flow'))['new_flow']
+    channel = db.subscribe_to_channels(['new_flow', 'new_ip'])
+    try:
+        wait_for_subscribers('new_flow', subscribers + 1)
+        db.publish('new_flow', encoded)
+        db.publish('new_ip', '1.2.3.4')
+
+        msg = get_next_msg(channel)
+        assert msg['channel'] == 'new_flow'
+        assert msg['data'] == encoded
+        assert codec.decode(msg['data']) == data
+        # the msgs of the other channels are decoded
+        msg = get_next_msg(channel)
+        assert msg['channel'] == 'new_ip'
+        assert msg['data'] == '1.2.3.4'
+    finally:
+        channel.close()
+
+
+def test_msgpack_msgs_in_streams():
+    pytest.importorskip('msgpack')
+    codec = MsgCodec('msgpack')
+    data = {'uid': 'Cé', 'bytes': 200}
+    db.rdb.use_streams = True
+    try:
+        channel = db.subscribe_to_channels(
+            ['new_flow', 'new_ip'], subscriber='MsgpackReader'
+        )
+        db.publish('new_flow', codec.encode(data))
+        db.publish('new_ip', '1.2.3.4')
+        msg = db.get_message(channel, timeout=0.1)
+        assert codec.decode(msg['data']) == data
+        msg = db.get_message(channel, timeout=0.1)
+        assert msg['data'] == '1.2.3.4'
+        channel.close()
+    finally:
+        db.rdb.use_streams = False
+
+
+def test_the_main_client_doesnt_escape_invalid_utf8():
+    db.r.set('invalid_utf8', b'\xff')
+    try:
+        with pytest.raises(UnicodeDecodeError):
+            db.r.get('invalid_utf8')
+    finally:
+        db.r.delete('invalid_utf8')
+
+
+def test_add_ips_to_IoC_without_bumping_the_version():
+    version = db.get_ioc_version()
+    db.add_ips_to_IoC(
+        {'1.2.3.5': json.dumps({'source': 'spamhaus'})}, bump_version=False
+    )
+    assert db.get_ioc_version() == version
+    assert db.search_IP_in_IoC('1.2.3.5')
+    db.add_ips_to_IoC({'1.2.3.6': json.dumps({'source': 'spamhaus'})})
+    assert db.get_ioc_version() == version + 1
+    db.rdb.rcache.hdel('IoC_ips', '1.2.3.5', '1.2.3.6')
+
+
+def test_fork_hooks_are_registered_once():
+    """tests that initializing the db again doesn't add more fork hooks"""
+    with patch('os.register_at_fork') as register_at_fork:
+        db.rdb._read_configuration()
+    register_at_fork.assert_not_called()
+
+
+def test_metrics():
+    """tests that the published and consumed msgs are counted in the metrics hash"""
+    db.rdb.collect_metrics = True
+    db.flush_metrics()
+    db.r.delete('metrics')
+    db.publish('new_letters', 'letters')
+    db.publish_many('new_letters', ['more', 'letters'])
+    db.incr_metric('consumed:Timeline:new_flow')
+    db.observe_handler_latency('Timeline', 'new_flow', 0.005)
+    db.set_metric('profiler_queue_depth:0', 3)
+    # nothing is sent to redis until the metrics are flushed
+    assert db.get_metrics() == {}
+    db.flush_metrics()
+
+    metrics = db.get_metrics()
+    assert metrics['published:new_letters'] == '3'
+    assert metrics['latency:Timeline:new_flow:le_10ms'] == '1'
+    assert metrics['gauge:profiler_queue_depth:0'] == '3'
+    text = format_metrics(metrics)
+    assert 'new_letters: 3' in text
+    assert 'Timeline <- new_flow: 1 msgs, avg 5.00ms [le_10ms:1]' in text
+
+
+@pytest.mark.parametrize(
+    'domain, expected',
+    [
+        ('google.com', ('google', False)),
+        ('mail.google.com', ('google', True)),
+        ('images.google.com', ('images', False)),
+        ('a.images.google.com', ('images', True)),
+        # only whole labels match
+        ('notgoogle.com', (False, False)),
+        ('google.com.evil.net', (False, False)),
+    ],
+)
+def test_is_domain_malicious(domain, expected):
+    db.rdb.rcache.delete('IoC_domains')
+    db.add_domains_to_IoC({'google.com': 'google', 'images.google.com': 'images'})
+    assert db.is_domain_malicious(domain) == expected
+
+
+def test_ti_requests_coalescing():
+    db.rdb.ti_coalescing_window = 60
+    db.rdb.ti_requests_sent = {}
+    channel = db.subscribe('give_threat_intelligence')
+
+    for uid in ('uid1', 'uid2'):
+        db.give_threat_intelligence(
+            profileid, twid, 'dstip', 1, uid, '8.8.8.8', lookup='8.8.8.8'
+        )
+    # the same ip in another tw is sent
+    db.give_threat_intelligence(
+        profileid, 'timewindow2', 'dstip', 1, 'uid3', '8.8.8.8', lookup='8.8.8.8'
+    )
+    msgs = []
+    while msg := channel.get_message(timeout=0.1):
+        if msg['type'] == 'message':
+            msgs.append(json.loads(msg['data'])['uid'])
+    db.rdb.ti_coalescing_window = 0
+    assert msgs == ['uid1', 'uid3']
+
+
+def test_ip_context_cache():
+    ip = '9.9.9.9'
+    # the cache db isn't flushed between runs
+    db.rdb.rcache.hdel('IPsInfo', ip)
+    db.delete_dns_resolution(ip)
+    db.rdb.ip_context_cache_ttl = 60
+    db.rdb.reset_ip_context_cache()
+    assert db.get_ip_context(ip)['sni'] is None
+
+    # cached, the context isn't read from redis again
+    db.rdb.rcache.hset('IPsInfo', ip, json.dumps({'reverse_dns': 'dns.quad9.net'}))
+    assert db.get_ip_context(ip)['ip_info'] == {}
+
+    # changing the info of the ip drops its cached context
+    db.setInfoForIPs(ip, {'SNI': [{'server_name': 'dns.quad9.net', 'dport': 443}]})
+    db.set_dns_resolution(
+        'dns.quad9.net', [ip], 1, 'uid1', 'A', test_ip, twid
+    )
+    time.sleep(db.rdb.ip_context_invalidation_interval + 0.1)
+    context = db.get_ip_context(ip)
+    assert context['sni'] == 'dns.quad9.net'
+    assert context['domains'] == ['dns.quad9.net']
+    assert context['ip_info']['reverse_dns'] == 'dns.quad9.net'
+
+
+def test_ip_context_cache_drops_the_pending_changes_over_the_limit():
+    ip = '9.9.9.9'
+    db.rdb.ip_context_cache_ttl = 60
+    db.rdb.reset_ip_context_cache()
+    # the limit is read by the classmethods of the handler
+    type(db.rdb).max_pending_ip_context_changes = 2
+    try:
+        db.get_ip_context(ip)
+        assert ip in db.rdb.ip_contexts
+        for changed_ip in ('1.1.1.1', '2.2.2.2', '3.3.3.3'):
+            db.rdb.publish_ip_context_change('ip_info_change', changed_ip)
+
+        time.sleep(db.rdb.ip_context_invalidation_interval + 0.1)
+        db.rdb.invalidate_changed_ip_contexts()
+        # too many changes to read, the whole cache is dropped
+        assert ip not in db.rdb.ip_contexts
+        assert db.rdb.ip_context_changes is None
+    finally:
+        type(db.rdb).max_pending_ip_context_changes = 10000
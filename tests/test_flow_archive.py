@@ -0,0 +1,89 @@
+import os
+import pytest
+
+from slips_files.core.flows.zeek import Conn, DNS
+from slips_files.core.database.parquet_db.flow_archive import (
+    FlowArchive,
+    get_archive_dir,
+    get_archived_flow_types,
+    read_archived_flows,
+)
+
+pytest.importorskip('pyarrow')
+
+profileid = 'profile_192.168.1.1'
+
+
+def create_conn(uid: str, sbytes=20) -> Conn:
+    return Conn(
+        '1601998398.945854',
+        uid,
+        '192.168.1.1',
+        '8.8.8.8',
+        5,
+        'TCP',
+        'dhcp',
+        80, 88,
+        20, 20,
+        sbytes, 20,
+        '', '',
+        'Established', ''
+    )
+
+
+def create_dns(uid: str) -> DNS:
+    return DNS(
+        '1601998398.945854',
+        uid,
+        '192.168.1.1',
+        '8.8.8.8',
+        'example.com',
+        '', 'A', 'NOERROR',
+        ['1.1.1.1', '2.2.2.2'],
+        '',
+    )
+
+
+def test_flows_are_written_in_row_groups(tmp_path):
+    archive = FlowArchive(str(tmp_path), row_group_size=2)
+    archive.add_flow(create_conn('1'), profileid, 'timewindow1', 'benign')
+    archive_dir = get_archive_dir(str(tmp_path))
+    assert not os.path.exists(archive_dir)
+
+    archive.add_flow(create_conn('2'), profileid, 'timewindow1', 'benign')
+    flows = read_archived_flows(archive_dir, 'conn')
+    assert flows.num_rows == 2
+
+
+def test_read_archived_flows(tmp_path):
+    archive = FlowArchive(str(tmp_path), row_group_size=100)
+    archive.add_flow(create_conn('1', sbytes=100), profileid, 'timewindow1', 'benign')
+    archive.add_flow(create_conn('2', sbytes=200), profileid, 'timewindow2', 'malicious')
+    archive.add_flow(create_dns('3'), profileid, 'timewindow1', 'benign')
+    archive.flush()
+
+    archive_dir = get_archive_dir(str(tmp_path))
+    assert get_archived_flow_types(archive_dir) == ['conn', 'dns']
+
+    flows = read_archived_flows(
+        archive_dir, 'conn', columns=['uid', 'sbytes', 'label'], twids=['timewindow2']
+    ).to_pylist()
+    assert flows == [{'uid': '2', 'sbytes': 200.0, 'label': 'malicious'}]
+
+    dns = read_archived_flows(archive_dir, 'dns').to_pylist()[0]
+    assert dns['query'] == 'example.com'
+    assert dns['answers'] == '["1.1.1.1", "2.2.2.2"]'
+    assert dns['twid'] == 'timewindow1'
+
+
+def test_archives_in_the_same_process_dont_overwrite_each_other(tmp_path):
+    # the profiler workers share the same pid in embedded_mode
+    archives = [
+        FlowArchive(str(tmp_path), row_group_size=1) for _ in range(2)
+    ]
+    for worker_id, archive in enumerate(archives):
+        archive.add_flow(
+            create_conn(str(worker_id)), profileid, 'timewindow1', 'benign'
+        )
+    flows = read_archived_flows(get_archive_dir(str(tmp_path)), 'conn')
+    assert sorted(flows.column('uid').to_pylist()) == ['0', '1']
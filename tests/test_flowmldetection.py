@@ -0,0 +1,56 @@
+"""Unit test for modules/flowmldetection/flowmldetection.py"""
+from tests.module_factory import ModuleFactory
+from tests.common_test_utils import do_nothing
+import pytest
+
+profileid = 'profile_192.168.1.1'
+twid = 'timewindow1'
+uid = 'CAeDWs37BipkfP21u8'
+
+
+def test_main_detects_new_flow(mock_rdb):
+    pytest.importorskip('sklearn')
+    flowmldetection = ModuleFactory().create_flowmldetection_obj(mock_rdb)
+    flowmldetection.mode = 'test'
+    flowmldetection.pre_main()
+    flowmldetection.set_evidence_malicious_flow = do_nothing
+    # the flow as published by add_flow_to_profile in the new_flow channel
+    flow = {
+        'ts': 1594417039.029793,
+        'dur': '1.9424750804901123',
+        'saddr': '192.168.1.1',
+        'sport': '49733',
+        'daddr': '40.70.224.145',
+        'dport': '443',
+        'proto': 'tcp',
+        'origstate': 'SRPA_SPA',
+        'state': 'Established',
+        'pkts': 84,
+        'allbytes': 42764,
+        'spkts': 37,
+        'sbytes': 25517,
+        'appproto': 'ssl',
+        'smac': '',
+        'dmac': '',
+        'label': 'Malware',
+        'flow_type': 'conn',
+        'module_labels': {},
+        'uid': uid,
+    }
+    msg = {
+        'data': flowmldetection.msg_codec.encode({
+            'profileid': profileid,
+            'twid': twid,
+            'flow': flow,
+            'stime': flow['ts'],
+        })
+    }
+    flowmldetection.get_msg = lambda channel: msg
+
+    predictions = []
+    detect = flowmldetection.detect
+    flowmldetection.detect = lambda: predictions.append(detect()) or predictions[-1]
+    flowmldetection.main()
+    assert 'uid' not in flowmldetection.flow.columns
+    assert len(predictions) == 1
+    assert predictions[0][0] in ('Malware', 'Normal')
@@ -189,3 +189,25 @@ def test_check_if_enough_dstips_to_trigger_an_evidence(mock_rdb,
     enough: bool = horizontal_ps.check_if_enough_dstips_to_trigger_an_evidence(
         key, cur_amount_of_dstips)
     assert enough == expected_return_val
+
+
+def test_json_tw_data_is_decoded_once(mock_rdb):
+    """
+    when the dports of the tw are stored in 1 json dict, check() shouldn't
+    read them again for each candidate dport
+    """
+    horizontal_ps = ModuleFactory().create_horizontal_portscan_obj(mock_rdb)
+    dports: dict = enough_dstips_to_reach_the_threshold(mock_rdb)
+    for dstip_data in dports[5555]['dstips'].values():
+        dstip_data.update({'spkts': 1, 'stime': '1234.54', 'uid': ['uid']})
+    mock_rdb.is_native_tw_storage.return_value = False
+    mock_rdb.get_data_from_profile_tw.return_value = dports
+    mock_rdb.get_dns_resolution.return_value = {}
+    horizontal_ps.fieldseparator = '_'
+    horizontal_ps.decide_if_time_to_set_evidence_or_combine = lambda *args: None
+
+    horizontal_ps.check('profile_1.1.1.1', 'timewindow0')
+    # once for TCP and once for UDP
+    assert mock_rdb.get_data_from_profile_tw.call_count == 2
+    mock_rdb.get_data_of_tw_entry.assert_not_called()
+    mock_rdb.get_tw_data_sizes.assert_not_called()
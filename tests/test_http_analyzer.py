@@ -143,3 +143,64 @@ def test_check_multiple_UAs(mock_rdb):
     assert (
         http_analyzer.check_multiple_UAs(cached_ua, user_agent, timestamp, profileid, twid, uid) is True
     )
+
+
+def test_read_channels(mock_rdb):
+    """tests that the msgs of the module's channels are read using 1 connection"""
+    http_analyzer = ModuleFactory().create_http_analyzer_obj(mock_rdb)
+    db = ModuleFactory().create_db_manager_obj(6379)
+    http_analyzer.db = db
+    assert list(http_analyzer.channels_msgs) == ['new_http']
+
+    db.publish('new_http', 'first')
+    db.publish('new_http', 'second')
+    received = []
+    # a read may only get the confirmation of the subscription
+    for _ in range(5):
+        http_analyzer.read_channels()
+        while msg := http_analyzer.get_msg('new_http'):
+            assert http_analyzer.msg_received is True
+            received.append(msg['data'])
+        if len(received) == 2:
+            break
+    assert received == ['first', 'second']
+    assert http_analyzer.msg_received is False
+
+
+def test_unread_channel_doesnt_stop_reading(mock_rdb):
+    """
+    tests that the msgs of a channel the module subscribes to and never
+    reads in main() don't stop it from reading its other channels
+    """
+    http_analyzer = ModuleFactory().create_http_analyzer_obj(mock_rdb)
+    db = ModuleFactory().create_db_manager_obj(6379)
+    http_analyzer.db = db
+    http_analyzer.channels['new_ip'] = db.subscribe('new_ip')
+    http_analyzer.multiplex_channels()
+    assert set(http_analyzer.channels_msgs) == {'new_http', 'new_ip'}
+
+    received = []
+    for msg_number in range(5):
+        db.publish('new_ip', f'unread_{msg_number}')
+        db.publish('new_http', f'http_{msg_number}')
+        # a read may only get the confirmation of the subscription
+        for _ in range(5):
+            http_analyzer.read_channels()
+            # main() only reads new_http
+            if msg := http_analyzer.get_msg('new_http'):
+                received.append(msg['data'])
+                break
+        http_analyzer.main_called = True
+
+    assert received == [f'http_{msg_number}' for msg_number in range(5)]
+    assert http_analyzer.channels_msgs['new_ip']
+    http_analyzer.read_channels()
+    assert http_analyzer.msg_received is False
+
+
+def test_consumed_channels_arent_shared(mock_rdb):
+    """the modules running as threads of 1 process track their own channels"""
+    http_analyzer = ModuleFactory().create_http_analyzer_obj(mock_rdb)
+    other_http_analyzer = ModuleFactory().create_http_analyzer_obj(mock_rdb)
+    http_analyzer.consumed_channels.add('new_http')
+    assert other_http_analyzer.consumed_channels == set()
@@ -1,6 +1,7 @@
 import pytest
 from tests.module_factory import ModuleFactory
 from unittest.mock import patch
+from multiprocessing import Queue
 
 import shutil
 import os
@@ -71,8 +72,9 @@ def test_handle_zeek_log_file(
 @pytest.mark.parametrize(
     'path, is_tabs, line_cached',
     [
-        # sllips shouldn't be able to cache teh first line as it's a comment
-        ('dataset/test10-mixed-zeek-dir/conn.log', True, False),
+        # the comments at the beginning of the file are skipped
+        # and the first flow is cached
+        ('dataset/test10-mixed-zeek-dir/conn.log', True, True),
         ('dataset/test9-mixed-zeek-dir/conn.log', False, True),
     ],
 )
@@ -307,3 +309,78 @@ def test_read_from_stdin(line_type: str, line: str, mock_rdb):
 
 
 
+
+
+@pytest.mark.parametrize(
+    'line, expected_saddr',
+    [
+        ({'type': 'conn.log', 'data': {'id.orig_h': '192.168.1.1'}}, '192.168.1.1'),
+        ({'type': 'conn.log', 'data': '1601998398.945854\tCuid\t192.168.1.2\t49733'}, '192.168.1.2'),
+        ({'type': 'suricata', 'data': '{"timestamp":"2021","src_ip":"192.168.1.3"}'}, '192.168.1.3'),
+        ({'type': 'nfdump', 'data': '2016-06-12,2016-06-12,0.000,192.168.1.4,8.8.8.8'}, '192.168.1.4'),
+    ],
+)
+def test_get_saddr_of_line(line: dict, expected_saddr: str, mock_rdb):
+    input = ModuleFactory().create_inputProcess_obj('', 'zeek_log_file', mock_rdb)
+    assert input.get_saddr_of_line(line) == expected_saddr
+
+
+def test_sharding_by_saddr(mock_rdb):
+    input = ModuleFactory().create_inputProcess_obj('', 'zeek_log_file', mock_rdb)
+    input.profiler_queues = [Queue(), Queue()]
+    line = {'type': 'conn.log', 'data': {'id.orig_h': '192.168.1.1'}}
+    # all the flows of the same saddr go to the same worker
+    assert input.get_profiler_queue_of(line) is input.get_profiler_queue_of(line)
+    assert {
+        id(input.get_profiler_queue_of(
+            {'type': 'conn.log', 'data': {'id.orig_h': f'10.0.0.{i}'}}
+        ))
+        for i in range(20)
+    } == {id(q) for q in input.profiler_queues}
+
+
+def test_read_zeek_files_in_order(tmp_path, mock_rdb):
+    input = ModuleFactory().create_inputProcess_obj('', 'zeek_folder', mock_rdb)
+    files = []
+    for name, timestamps in (('conn', [1, 4, 5]), ('dns', [2, 3, 7]), ('http', [6])):
+        path = tmp_path / f'{name}.log'
+        path.write_text(''.join(
+            json.dumps({'ts': ts, 'id.orig_h': '192.168.1.1'}) + '\n'
+            for ts in timestamps
+        ))
+        files.append(str(path))
+    mock_rdb.get_all_zeek_files.return_value = files
+    input.is_zeek_tabs = False
+    input.bro_timeout = 0
+    sent = []
+    input.give_profiler = lambda line: sent.append(line['data']['ts'])
+    assert input.read_zeek_files() == 7
+    assert sent == [1, 2, 3, 4, 5, 6, 7]
+
+
+def test_read_zeek_files_skips_non_flow_lines(tmp_path, mock_rdb):
+    """
+    a file whose next line is a comment or has no ts shouldn't wait for
+    the next check of the files while the lines of the other files are sent
+    """
+    input = ModuleFactory().create_inputProcess_obj('', 'zeek_folder', mock_rdb)
+    conn = tmp_path / 'conn.log'
+    conn.write_text(
+        json.dumps({'ts': 1, 'id.orig_h': '192.168.1.1'}) + '\n'
+        + '#close\n'
+        + json.dumps({'ts': 'corrupted', 'id.orig_h': '192.168.1.1'}) + '\n'
+        + json.dumps({'ts': 3, 'id.orig_h': '192.168.1.1'}) + '\n'
+    )
+    dns = tmp_path / 'dns.log'
+    dns.write_text(''.join(
+        json.dumps({'ts': ts, 'id.orig_h': '192.168.1.1'}) + '\n'
+        for ts in (2, 4)
+    ))
+    mock_rdb.get_all_zeek_files.return_value = [str(conn), str(dns)]
+    input.is_zeek_tabs = False
+    input.bro_timeout = 0
+    input.zeek_files_check_interval = float('inf')
+    sent = []
+    input.give_profiler = lambda line: sent.append(line['data']['ts'])
+    assert input.read_zeek_files() == 4
+    assert sent == [1, 2, 3, 4]
@@ -0,0 +1,40 @@
+import pytest
+
+from slips_files.common.ip_range_index import IPRangeIndex
+
+index = IPRangeIndex.build(
+    {
+        '10.0.0.0/8': 'big',
+        '10.1.0.0/16': 'small',
+        '192.168.1.0/24': 'lan',
+        '2001:db8::/32': 'v6',
+        'not a range': 'invalid',
+    }
+)
+
+
+@pytest.mark.parametrize(
+    'ip, expected',
+    [
+        ('10.2.3.4', 'big'),
+        # the most specific range is returned
+        ('10.1.3.4', 'small'),
+        ('192.168.1.255', 'lan'),
+        ('192.168.2.1', None),
+        ('2001:db8:1::1', 'v6'),
+        ('2001:db9::1', None),
+        ('not an ip', None),
+    ],
+)
+def test_lookup(ip, expected):
+    assert index.lookup(ip) == expected
+
+
+def test_add():
+    ranges = IPRangeIndex()
+    assert not ranges
+    assert ranges.add('8.8.8.0/24', 'google')
+    assert not ranges.add('8.8.8.0/33')
+    assert len(ranges) == 1
+    assert '8.8.8.8' in ranges
+    assert ranges.lookup_range('8.8.8.8') == ('8.8.8.0/24', 'google')
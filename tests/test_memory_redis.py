@@ -0,0 +1,117 @@
+"""Unit test for slips_files/core/database/memory_db/memory_redis.py"""
+from slips_files.core.database.memory_db.memory_redis import MemoryRedis
+from slips_files.core.database.redis_db.database import RedisDB
+from slips_files.common.parsers.config_parser import ConfigParser
+from tests.module_factory import ModuleFactory
+from unittest.mock import patch
+import pytest
+from redis.exceptions import ConnectionError
+
+
+def test_hashes():
+    r = MemoryRedis()
+    assert r.hset('h', 'a', 1) == 1
+    assert r.hset('h', mapping={'a': 2, 'b': 1.5}) == 1
+    assert r.hget('h', 'a') == '2'
+    assert r.hmget('h', ['a', 'c']) == ['2', None]
+    assert r.hincrby('h', 'a', 3) == 5
+    assert r.hgetall('h') == {'a': '5', 'b': '1.5'}
+    assert r.hdel('h', 'a', 'b') == 2
+    assert r.hgetall('h') == {}
+
+
+def test_sorted_sets():
+    r = MemoryRedis()
+    r.zadd('z', {'b': 2, 'a': 2, 'c': 1})
+    assert r.zrange('z', 0, -1) == ['c', 'a', 'b']
+    assert r.zrange('z', -1, -1, withscores=True) == [('b', 2.0)]
+    assert r.zrange('z', 0, 0, desc=True) == ['b']
+    assert r.zincrby('z', 5, 'c') == 6.0
+    assert r.zrangebyscore('z', '(2', '+inf') == ['c']
+    assert r.zrangebyscore('z', 0, 2, start=0, num=1) == ['a']
+    assert r.zrank('z', 'c') == 2
+    assert r.zscore('z', 'missing') is None
+
+
+def test_pipeline_and_pubsub():
+    r = MemoryRedis()
+    pubsub = r.pubsub()
+    pubsub.subscribe('new_flow')
+    pipe = r.pipeline()
+    pipe.sadd('s', 'x').rpush('l', 'y').publish('new_flow', 'flow')
+    assert len(pipe) == 3
+    assert pipe.execute() == [1, 1, 1]
+    assert r.smembers('s') == {'x'}
+    assert r.lrange('l', 0, -1) == ['y']
+    msg = pubsub.get_message(timeout=0.1)
+    assert msg['channel'] == 'new_flow'
+    assert msg['data'] == 'flow'
+    assert pubsub.get_message() is None
+
+
+def test_published_bytes_arent_decoded():
+    r = MemoryRedis()
+    pubsub = r.pubsub()
+    pubsub.subscribe('new_flow')
+    # a msgpack msg that isn't valid utf-8
+    r.publish('new_flow', b'\x81\xa3uid\xa2C\xff')
+    assert pubsub.get_message()['data'] == b'\x81\xa3uid\xa2C\xff'
+
+
+def test_pubsub_over_the_pending_msgs_limit_is_closed():
+    r = MemoryRedis()
+    pubsub = r.pubsub()
+    pubsub.max_pending_msgs = 2
+    pubsub.subscribe('ip_info_change')
+    for ip in ('1.1.1.1', '2.2.2.2', '3.3.3.3'):
+        r.publish('ip_info_change', ip)
+    with pytest.raises(ConnectionError):
+        pubsub.get_message()
+    # the msgs aren't kept after closing it
+    assert r.publish('ip_info_change', '4.4.4.4') == 0
+
+
+def test_profiles_in_memory():
+    """tests that the profile handler works the same using MemoryRedis"""
+    db = ModuleFactory().create_db_manager_obj(6379)
+    db.rdb.r = MemoryRedis()
+    profileid = 'profile_192.168.1.80'
+    starttime = 1601998398.0
+    try:
+        db.rdb.known_profiles.pop(profileid, None)
+        db.rdb.last_tw_cache.clear()
+        assert db.addProfile(profileid, starttime, 3600) is True
+        assert db.get_timewindow(starttime, profileid) == 'timewindow1'
+        # creates the empty tw in the middle
+        assert db.get_timewindow(
+            starttime + db.rdb.width * 2 + 1, profileid
+        ) == 'timewindow3'
+        assert db.get_last_twid_of_profile(profileid)[0][0] == 'timewindow3'
+        assert db.get_number_of_tws_in_profile(profileid) == 3
+        # nothing was stored in redis
+        assert not db.rdb.__class__.r.sismember('profiles', profileid)
+    finally:
+        del db.rdb.r
+        db.rdb.known_profiles.pop(profileid, None)
+        db.rdb.last_tw_cache.clear()
+
+
+def test_memory_backend_requires_embedded_mode():
+    """
+    the processes can't see the memory of each other, so the memory backend
+    is only used when the modules run as threads of the same process
+    """
+    try:
+        with patch.object(
+            ConfigParser, 'database_backend', return_value='memory'
+        ), patch.object(ConfigParser, 'embedded_mode', return_value=False):
+            RedisDB._read_configuration()
+            assert RedisDB.in_memory is False
+
+        with patch.object(
+            ConfigParser, 'database_backend', return_value='memory'
+        ), patch.object(ConfigParser, 'embedded_mode', return_value=True):
+            RedisDB._read_configuration()
+            assert RedisDB.in_memory is True
+    finally:
+        RedisDB._read_configuration()
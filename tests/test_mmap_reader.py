@@ -0,0 +1,29 @@
+"""Unit test for slips_files/core/helpers/mmap_reader.py"""
+from slips_files.core.helpers import mmap_reader
+import pytest
+
+
+@pytest.mark.parametrize(
+    'path, expected_val',
+    [
+        ('dataset/test1-normal.nfdump', 4646),
+        ('dataset/test9-mixed-zeek-dir/conn.log', 577),
+    ]
+)
+def test_count_lines(path: str, expected_val: int):
+    assert mmap_reader.count_lines(path) == expected_val
+
+
+def test_read_lines(tmp_path):
+    path = tmp_path / 'flows.log'
+    path.write_text('first\nsecond\n\nlast')
+    assert list(mmap_reader.read_lines(str(path))) == [
+        'first\n', 'second\n', '\n', 'last'
+    ]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'empty.log'
+    path.write_text('')
+    assert mmap_reader.count_lines(str(path)) == 0
+    assert list(mmap_reader.read_lines(str(path))) == []
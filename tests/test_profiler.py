@@ -1,13 +1,16 @@
 """Unit test for slips_files/core/performance_profiler.py"""
 import ipaddress
+from unittest.mock import Mock, patch
 
 from tests.module_factory import ModuleFactory
 from tests.common_test_utils import do_nothing
 import subprocess
+import time
 import pytest
 import json
 from slips_files.core.profiler import SUPPORTED_INPUT_TYPES, SEPARATORS
 from slips_files.core.flows.zeek import Conn
+from slips_files.common.parsers.config_parser import ConfigParser
 
 
 
@@ -186,6 +189,130 @@ def test_process_line(file, flow_type):
     assert added_flow is not None
 
 
+@pytest.mark.parametrize(
+    'header, line',
+    [
+        # the default order of the conn.log fields, read by position
+        (
+            None,
+            '1.0\tCuid\t10.0.0.1\t1234\t8.8.8.8\t53\tudp\tdns\t2.5',
+        ),
+        # the same flow with the fields in another order
+        (
+            '#fields\tts\tid.resp_h\tid.resp_p\tduration\tuid\tproto'
+            '\tid.orig_h\tid.orig_p\tservice',
+            '1.0\t8.8.8.8\t53\t2.5\tCuid\tudp\t10.0.0.1\t1234\tdns',
+        ),
+    ],
+)
+def test_process_zeek_tabs_line(header, line):
+    input_handler = SUPPORTED_INPUT_TYPES['zeek-tabs']()
+    if header:
+        assert input_handler.process_line(
+            {'type': 'conn.log', 'data': header}
+        ) is False
+
+    flow = input_handler.process_line({'type': 'conn.log', 'data': line})
+    assert flow.uid == 'Cuid'
+    assert flow.saddr == '10.0.0.1'
+    assert flow.daddr == '8.8.8.8'
+    assert flow.sport == 1234
+    assert flow.dport == 53
+    assert flow.proto == 'udp'
+    assert flow.appproto == 'dns'
+    assert flow.dur == 2.5
+
+
+@pytest.mark.parametrize('analysis_direction', ['out', 'all'])
+def test_add_flow_to_profile_archives_the_flow_once(
+        analysis_direction, tmp_path
+):
+    pytest.importorskip('pyarrow')
+    from slips_files.core.database.parquet_db.flow_archive import (
+        FlowArchive,
+        get_archive_dir,
+        read_archived_flows,
+    )
+    profiler = ModuleFactory().create_profiler_obj()
+    profiler.whitelist.is_whitelisted_flow = do_nothing
+    profiler.analysis_direction = analysis_direction
+    profiler.flow_archive = FlowArchive(str(tmp_path), 10)
+    profiler.flow = Conn(
+        '1.0',
+        'archived_uid',
+        '192.168.1.1',
+        '8.8.8.8',
+        5,
+        'TCP',
+        'dhcp',
+        80, 88,
+        20, 20,
+        20, 20,
+        '', '',
+        'Established', ''
+    )
+    assert profiler.add_flow_to_profile() is True
+    profiler.flow_archive.flush()
+
+    flows = read_archived_flows(
+        get_archive_dir(str(tmp_path)), 'conn'
+    ).to_pylist()
+    assert [flow['uid'] for flow in flows] == ['archived_uid']
+    assert flows[0]['profileid'] == 'profile_192.168.1.1'
+
+
+def get_tw_modified_msgs(db, channel) -> list:
+    msgs = []
+    while msg := db.get_message(channel, timeout=0.2):
+        msgs.append(msg['data'])
+    return msgs
+
+
+def test_write_batch_has_one_flow_per_tw():
+    """
+    the modules read the tw when they get its tw_modified msg, they should
+    see the tw after each flow when the flows are batched
+    """
+    profiler = ModuleFactory().create_profiler_obj()
+    profiler.whitelist.is_whitelisted_flow = do_nothing
+    profiler.analysis_direction = 'out'
+    profiler.write_batch_size = 50
+    db = profiler.db
+    subscribers = dict(db.rdb.r.pubsub_numsub('tw_modified'))['tw_modified']
+    channel = db.subscribe_to_channels(['tw_modified'])
+    deadline = time.time() + 5
+    while (
+        dict(db.rdb.r.pubsub_numsub('tw_modified'))['tw_modified'] <= subscribers
+        and time.time() < deadline
+    ):
+        time.sleep(0.01)
+
+    def create_flow(uid: str, dport: int) -> Conn:
+        return Conn(
+            '1.0', uid, '192.168.1.40', '8.8.8.8', 5, 'TCP', '',
+            80, dport, 1, 0, 20, 0, '', '', 'S0', ''
+        )
+
+    profiler.init_write_batch()
+    try:
+        profiler.flow = create_flow('batched_uid1', 81)
+        assert profiler.add_flow_to_profile() is True
+        # queued in the batch
+        assert get_tw_modified_msgs(db, channel) == []
+
+        profiler.flow = create_flow('batched_uid2', 82)
+        assert profiler.add_flow_to_profile() is True
+        # the first flow is sent before adding the second one to the same tw
+        tw_modified = f'profile_192.168.1.40:{profiler.twid}'
+        assert get_tw_modified_msgs(db, channel) == [tw_modified]
+        assert db.get_write_batch_len() > 0
+
+        db.stop_write_batch()
+        assert get_tw_modified_msgs(db, channel) == [tw_modified]
+    finally:
+        db.stop_write_batch()
+        channel.close()
+
 
 def test_get_rev_profile(mock_rdb):
     profiler = ModuleFactory().create_profiler_obj()
@@ -214,3 +341,40 @@ def test_get_rev_profile_no_daddr(flow):
     profiler.daddr_as_obj = None
     assert profiler.get_rev_profile() == (False, False)
 
+
+def test_main_drains_batched_msgs(mock_rdb):
+    profiler = ModuleFactory().create_profiler_obj()
+    processed = []
+    profiler.process_msg = processed.append
+    profiler.check_for_stop_msg = lambda msg: msg == 'stop'
+    profiler.init_write_batch = do_nothing
+    msg = {'line': {'data': ''}, 'input_type': 'zeek_log_file'}
+    profiler.profiler_queue.put([msg, msg])
+    profiler.profiler_queue.put(msg)
+    profiler.profiler_queue.put('stop')
+    assert profiler.main() == 1
+    assert processed == [msg, msg, msg]
+
+
+def test_several_workers_use_the_native_tw_layout():
+    with patch.object(ConfigParser, 'profiler_workers', return_value=2):
+        assert ConfigParser().tw_storage_layout() == 'native'
+
+
+@pytest.mark.parametrize(
+    'workers, configured_layout, expected_warning',
+    [(2, 'json', True), (2, 'native', False), (1, 'json', False)],
+)
+def test_warn_about_tw_storage_layout(
+        workers, configured_layout, expected_warning
+):
+    proc_manager = ModuleFactory().create_process_manager_obj()
+    proc_manager.profiler_workers = workers
+    proc_manager.main.print = Mock()
+    with patch.object(
+        ConfigParser,
+        'configured_tw_storage_layout',
+        return_value=configured_layout
+    ):
+        assert proc_manager.warn_about_tw_storage_layout() is expected_warning
+    assert proc_manager.main.print.called is expected_warning
@@ -5,10 +5,87 @@ from ..slips import *
 
 def test_load_modules():
     proc_manager = ModuleFactory().create_process_manager_obj()
-    failed_to_load_modules = proc_manager.get_modules(
+    plugins, failed_to_load_modules = proc_manager.get_modules(
         ['template', 'mldetection-1', 'ensembling']
-    )[1]
+    )
     assert failed_to_load_modules == 0
+    # the modules are only imported when they're loaded
+    module_classes, failed_to_import_modules = proc_manager.import_modules(
+        plugins
+    )
+    assert failed_to_import_modules == 0
+    assert set(module_classes) == set(plugins)
+
+
+def test_import_failures_are_counted():
+    proc_manager = ModuleFactory().create_process_manager_obj()
+    module_classes, failed_to_import_modules = proc_manager.import_modules({
+        'Missing': {
+            'module': 'modules.missing_module.missing_module',
+            'class_name': 'MissingModule',
+            'description': '',
+        }
+    })
+    assert module_classes == {}
+    assert failed_to_import_modules == 1
+
+
+def test_get_modules_without_importing_them():
+    import sys
+    proc_manager = ModuleFactory().create_process_manager_obj()
+    sys.modules.pop('modules.riskiq.riskiq', None)
+    plugins = proc_manager.get_modules(['template', 'ensembling'])[0]
+
+    assert plugins['Risk IQ'] == {
+        'module': 'modules.riskiq.riskiq',
+        'class_name': 'RiskIQ',
+        'description': 'Module to get passive DNS info about IPs from RiskIQ',
+    }
+    assert 'modules.riskiq.riskiq' not in sys.modules
+
+    module_classes = proc_manager.import_modules(
+        {'Risk IQ': plugins['Risk IQ']}
+    )[0]
+    assert module_classes['Risk IQ'].__name__ == 'RiskIQ'
+    assert 'modules.riskiq.riskiq' in sys.modules
+
+
+def test_start_module_embedded():
+    import threading
+    from multiprocessing import Event, Process
+    from slips_files.common.abstracts._module import IModule
+    from managers.process_manager import ModuleThread
+
+    class Dummy(IModule, Process):
+        name = 'Dummy'
+
+        def init(self):
+            self.thread = None
+
+        def pre_main(self):
+            self.thread = threading.current_thread()
+
+        def main(self):
+            pass
+
+    proc_manager = ModuleFactory().create_process_manager_obj()
+    proc_manager.embedded_mode = True
+    termination_event = Event()
+    termination_event.set()
+    module = Dummy(
+        ModuleFactory().logger, 'output/', 6379, termination_event
+    )
+    module_thread = proc_manager.start_module(module)
+    module_thread.join(3)
+
+    assert isinstance(module_thread, ModuleThread)
+    assert module_thread.name == 'Dummy'
+    # the module ran in this process
+    assert module.thread is module_thread
+    assert module.pid is None
+    assert module_thread.pid == module_thread.native_id
+    assert module_thread in proc_manager.get_children()
+    assert not module_thread.is_alive()
 #
 # @pytest.mark.skipif(IS_IN_A_DOCKER_CONTAINER, reason='This functionality is not supported in docker')
 # def test_save():
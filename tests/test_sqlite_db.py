@@ -0,0 +1,118 @@
+from unittest.mock import Mock, patch
+import pytest
+
+from slips_files.core.flows.zeek import Conn
+from slips_files.common.parsers.config_parser import ConfigParser
+from slips_files.core.database.sqlite_db.database import SQLiteDB
+
+profileid = 'profile_192.168.1.1'
+twid = 'timewindow1'
+
+
+def create_flow(uid: str) -> Conn:
+    return Conn(
+        '1601998398.945854',
+        uid,
+        '192.168.1.1',
+        '8.8.8.8',
+        5,
+        'TCP',
+        'dhcp',
+        80, 88,
+        20, 20,
+        20, 20,
+        '', '',
+        'Established', ''
+    )
+
+
+def create_sqlite_db(output_dir, batch_size: int, timeout=60) -> SQLiteDB:
+    with patch.object(
+        ConfigParser, 'sqlite_write_batch_size', return_value=batch_size
+    ), patch.object(
+        ConfigParser, 'sqlite_write_batch_timeout', return_value=timeout
+    ):
+        return SQLiteDB(Mock(), str(output_dir))
+
+
+def count_flows(db: SQLiteDB) -> int:
+    # don't use db.execute(), it flushes the queued flows first
+    return db.conn.execute('SELECT COUNT(*) FROM flows').fetchone()[0]
+
+
+def test_flows_are_inserted_in_batches(tmp_path):
+    db = create_sqlite_db(tmp_path, batch_size=3)
+    db.add_flow(create_flow('1'), profileid, twid)
+    db.add_flow(create_flow('2'), profileid, twid)
+    assert count_flows(db) == 0
+    assert db.rows_in_write_batch == 2
+
+    db.add_flow(create_flow('3'), profileid, twid)
+    assert count_flows(db) == 3
+    assert db.rows_in_write_batch == 0
+
+
+def test_queued_flows_are_flushed_before_reading(tmp_path):
+    db = create_sqlite_db(tmp_path, batch_size=100)
+    db.add_flow(create_flow('1'), profileid, twid)
+    assert db.get_flows_count(profileid, twid) == 1
+
+
+def test_queued_flows_are_flushed_after_the_timeout(tmp_path):
+    db = create_sqlite_db(tmp_path, batch_size=100, timeout=0)
+    db.add_flow(create_flow('1'), profileid, twid)
+    db.flush_flows_if_needed()
+    assert count_flows(db) == 1
+
+
+@pytest.mark.parametrize(
+    'batch_size, journal_mode', [(1, 'delete'), (100, 'wal')]
+)
+def test_journal_mode(tmp_path, batch_size, journal_mode):
+    db = create_sqlite_db(tmp_path, batch_size=batch_size)
+    mode = db.conn.execute('PRAGMA journal_mode').fetchone()[0]
+    assert mode.lower() == journal_mode
+    db.close()
+
+
+def test_get_flows_fields(tmp_path):
+    db = create_sqlite_db(tmp_path, batch_size=1)
+    db.add_flow(create_flow('1'), profileid, twid)
+    db.add_flow(create_flow('2'), profileid, 'timewindow2')
+    db.add_flow(create_flow('3'), 'profile_192.168.1.2', twid)
+
+    flows = db.get_flows_fields(['daddr', 'sbytes', 'not_a_field'], profileid, twid)
+    assert flows == {
+        '1': {'daddr': '8.8.8.8', 'sbytes': 20, 'not_a_field': None}
+    }
+    assert set(db.get_flows_fields(['daddr'], profileid)) == {'1', '2'}
+    assert db.get_all_contacted_ips_in_profileid_twid(profileid, twid) == {
+        '8.8.8.8': '1'
+    }
+
+
+@pytest.mark.parametrize(
+    'kwargs, expected_count',
+    [
+        ({}, 3),
+        ({'profileid': profileid}, 2),
+        ({'twid': twid}, 2),
+        ({'profileid': profileid, 'twid': twid}, 1),
+    ],
+)
+def test_get_flows_count(tmp_path, kwargs, expected_count):
+    db = create_sqlite_db(tmp_path, batch_size=1)
+    db.add_flow(create_flow('1'), profileid, twid)
+    db.add_flow(create_flow('2'), profileid, 'timewindow2')
+    db.add_flow(create_flow('3'), 'profile_192.168.1.2', twid)
+    assert db.get_flows_count(**kwargs) == expected_count
+
+
+def test_flows_of_a_tw_are_looked_up_using_the_index(tmp_path):
+    db = create_sqlite_db(tmp_path, batch_size=1)
+    condition, params = db.get_flows_condition(profileid, twid)
+    plan = db.conn.execute(
+        f'EXPLAIN QUERY PLAN SELECT uid, flow FROM flows WHERE {condition}',
+        params,
+    ).fetchall()
+    assert 'flows_profileid_twid' in str(plan)
@@ -2,6 +2,7 @@
 from tests.module_factory import ModuleFactory
 import os
 import pytest
+from unittest.mock import Mock
 
 
 
@@ -39,3 +40,42 @@ def test_check_local_ti_files_for_update(
     mock_rdb.get_TI_file_info.return_value = {'hash': old_hash}
 
     assert threatintel.should_update_local_ti_file(own_malicious_iocs) == expected_return
+
+
+def test_online_hits_dont_drop_the_verdict_cache(mock_rdb):
+    threatintel = ModuleFactory().create_threatintel_obj(mock_rdb)
+    threatintel.verdict_cache_ttl = 3600
+    threatintel.set_evidence_malicious_ip = Mock()
+    threatintel.search_offline_for_ip = Mock(return_value=False)
+    threatintel.search_online_for_ip = Mock(
+        return_value={'source': 'spamhaus', 'description': 'spam'}
+    )
+    threatintel.is_malicious_ip(
+        '1.2.3.4', 'uid', '8.8.8.8', 'ts', 'profile_1.1.1.1',
+        'timewindow1', 'srcip'
+    )
+    args, kwargs = mock_rdb.add_ips_to_IoC.call_args
+    assert '1.2.3.4' in args[0]
+    assert kwargs == {'bump_version': False}
+
+
+def test_verdict_cache(mock_rdb):
+    threatintel = ModuleFactory().create_threatintel_obj(mock_rdb)
+    threatintel.verdict_cache_ttl = 3600
+    mock_rdb.is_domain_malicious.return_value = (False, False)
+    mock_rdb.get_ioc_version.return_value = threatintel.ioc_version
+
+    for _ in range(3):
+        threatintel.is_malicious_domain(
+            'example.com', 'uid', 'ts', 'profile_1.1.1.1', 'timewindow1'
+        )
+    assert mock_rdb.is_domain_malicious.call_count == 1
+
+    # the feeds changed
+    mock_rdb.get_ioc_version.return_value = threatintel.ioc_version + 1
+    threatintel.last_iocs_refresh = 0
+    threatintel.refresh_iocs_if_needed()
+    threatintel.is_malicious_domain(
+        'example.com', 'uid', 'ts', 'profile_1.1.1.1', 'timewindow1'
+    )
+    assert mock_rdb.is_domain_malicious.call_count == 2
@@ -1,4 +1,5 @@
 from tests.module_factory import ModuleFactory
+from unittest.mock import Mock
 import pytest
 
 
@@ -31,3 +32,37 @@ def test_load_org_IPs(org, subnet, mock_rdb):
     first_octet = subnet.split('.')[0]
     assert first_octet in whitelist.load_org_IPs(org)
     assert subnet in whitelist.load_org_IPs(org)[first_octet]
+
+
+@pytest.mark.parametrize(
+    'saddr, daddr, query, expected',
+    [
+        ('10.0.0.1', '8.8.8.8', 'test.slack.com', True),
+        ('10.0.0.1', '8.8.8.8', 'slack.com.test', False),
+        ('91.121.83.118', '8.8.8.8', 'example.com', True),
+        # this ip is whitelisted only when it's the source of the flow
+        ('8.8.8.8', '91.121.83.118', 'example.com', False),
+        # this ip is whitelisted for alerts only
+        ('1.1.1.1', '8.8.8.8', 'example.com', False),
+    ],
+)
+def test_is_whitelisted_flow(saddr, daddr, query, expected, mock_rdb):
+    whitelist = ModuleFactory().create_whitelist_obj(mock_rdb)
+    whitelists = {
+        'IPs': {
+            '91.121.83.118': {'from': 'src', 'what_to_ignore': 'flows'},
+            '1.1.1.1': {'from': 'both', 'what_to_ignore': 'alerts'},
+        },
+        'domains': {'slack.com': {'from': 'both', 'what_to_ignore': 'both'}},
+    }
+    mock_rdb.get_whitelist.side_effect = lambda key: whitelists.get(key, {})
+    mock_rdb.get_whitelist_version.return_value = 1
+    whitelist.get_domains_of_flow = Mock(return_value=([], []))
+    mock_rdb.get_mac_addr_from_profile.return_value = None
+    flow = Mock(saddr=saddr, daddr=daddr, type_='dns', query=query, answers=[])
+    flow.smac = flow.dmac = ''
+    assert whitelist.is_whitelisted_flow(flow) == expected
+
+    # the whitelist is read from the db only once
+    whitelist.is_whitelisted_flow(flow)
+    assert mock_rdb.get_whitelist.call_count == 4
@@ -0,0 +1,38 @@
+"""Unit test for slips_files/common/parsers/zeek_line_parser.py"""
+from slips_files.common.parsers.zeek_line_parser import ZeekLineParser
+import pytest
+
+
+@pytest.mark.parametrize(
+    'line, is_tabs, expected_ts',
+    [
+        ('{"ts":271.102532,"uid":"CsYeNL1xflv3dW9hvb"}', False, 271.102532),
+        ('1601998375.703087\tClqdMB11qLHjikB6bd\t192.168.1.1', True, 1601998375.703087),
+        ('1601998375.703087  ClqdMB11qLHjikB6bd  192.168.1.1', True, 1601998375.703087),
+        ('{"ts":"corrupted"}', False, False),
+        ('{corrupted', False, False),
+    ],
+)
+def test_parse_ts(line: str, is_tabs: bool, expected_ts):
+    assert ZeekLineParser().parse_ts(line, is_tabs)[0] == expected_ts
+
+
+@pytest.mark.parametrize(
+    'file_type, expected_type',
+    [
+        ('zeek_files/conn.log', 'conn'),
+        ('conn_dir/dns.log', 'dns'),
+        ('zeek_files/files.log', 'files'),
+        ('zeek_files/x509.log', None),
+    ],
+)
+def test_get_log_type(file_type: str, expected_type):
+    assert ZeekLineParser().get_log_type(file_type) == expected_type
+
+
+def test_get_field_index():
+    parser = ZeekLineParser()
+    parser.set_fields('conn.log', '#fields\tts\tuid\tid.orig_h\tid.orig_p\n')
+    assert parser.get_field_index('conn.log', 'id.orig_h') == 2
+    assert parser.get_field_index('conn.log', 'service') is None
+    assert parser.get_field_index('dns.log', 'id.orig_h', default=2) == 2